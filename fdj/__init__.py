@@ -0,0 +1,7 @@
+# -*- coding: utf-8 -*-
+"""Componenti di supporto della dashboard dividendi FDJ.
+
+I moduli vengono importati singolarmente da ``fdj_dividend_app.py``: il
+package non riesporta nulla, così importare un componente non trascina con sé
+dipendenze pesanti (Plotly, NumPy) che servono solo ad altri.
+"""
@@ -0,0 +1,233 @@
+# -*- coding: utf-8 -*-
+"""Indice delle sezioni dei file di analisi testuale (es. Analisi_FDJ.txt).
+
+Ogni file viene letto e suddiviso in sezioni una sola volta per processo. La
+cache è indicizzata dalla firma del file (mtime e dimensione): a ogni rerun
+basta un ``os.stat``. Quando la firma cambia il file viene riletto, ma se il
+contenuto (sha256) è identico il parsing precedente viene riutilizzato.
+
+Per ogni sezione viene preparata anche la versione compatta del markdown da
+inviare al browser: i link inline diventano riferimenti numerati ``[n]`` con
+una tabella delle fonti deduplicata in coda alla sezione.
+
+I tag di citazione ``[source: N]`` sono tolti dal testo visualizzato ma non
+persi: la stessa passata che li rimuove ne registra la posizione, e
+``AnalysisDocument.citations`` associa a ogni id il passaggio citato (sezione
+e offset nel testo ripulito). L'indice è in cache con il parsing del
+documento e la ricerca di un id è un accesso a dizionario.
+"""
+import bisect
+import hashlib
+import os
+import re
+from dataclasses import dataclass, field
+from types import MappingProxyType
+
+import streamlit as st
+
+# Tag di citazione presenti nel testo, es. "[source: 12, 13]"
+SOURCE_TAG_PATTERN = re.compile(r'\s*\[source:\s*\d+.*?\]')
+# Id citati in un tag: numeri singoli o intervalli ("12, 14-16")
+SOURCE_ID_PATTERN = re.compile(r'(\d+)(?:\s*[-–]\s*(\d+))?')
+# Fine della frase precedente: il passaggio citato inizia dopo
+SENTENCE_END_PATTERN = re.compile(r'[.!?:;]\s|\n')
+
+# Regex per trovare i titoli principali (## Titolo o # Titolo) e i sottotitoli numerati (## N. Titolo)
+TITLE_PATTERN = re.compile(r"^(#+\s*\d*\.?\s*\*?.*?\*?)$", re.MULTILINE)
+
+# Link markdown inline, es. "[Titolo](https://...)", eventualmente racchiuso
+# tra parentesi tonde come citazione: "([Titolo](https://...))"
+INLINE_LINK_PATTERN = re.compile(r'(\()?\[((?:[^\[\]\\]|\\.)*)\]\(([^()\s]+)\)(?(1)\))')
+
+INTRO_TITLE = "Introduzione"
+
+
+@dataclass(frozen=True)
+class Section:
+    """Sezione dell'analisi: titolo, livello del titolo e testo ripulito.
+
+    ``start`` ed ``end`` delimitano la sezione (titolo incluso) nel testo
+    ripulito del documento; la sezione introduttiva ha livello 0. ``markdown``
+    è la versione compatta del corpo da visualizzare e ``links`` la tabella
+    delle fonti come coppie ``(url, titolo)``, nell'ordine di numerazione.
+    """
+    title: str
+    level: int
+    start: int
+    end: int
+    body: str
+    markdown: str = ""
+    links: tuple = ()
+
+
+@dataclass(frozen=True)
+class Citation:
+    """Passaggio citato da un tag ``[source: N]``: ``text[start:end]`` nella sezione ``section``."""
+    source: int
+    section: int
+    start: int
+    end: int
+
+
+@dataclass(frozen=True)
+class AnalysisDocument:
+    path: str
+    sha256: str
+    text: str
+    sections: tuple
+    citations: MappingProxyType = field(default_factory=lambda: MappingProxyType({}))
+
+    def passage(self, citation):
+        """Testo del passaggio citato."""
+        return self.text[citation.start:citation.end].strip()
+
+
+def source_ids(tag):
+    """Id citati in un tag ``[source: ...]``, intervalli espansi e nell'ordine del tag."""
+    ids = []
+    for first, last in SOURCE_ID_PATTERN.findall(tag.partition(':')[2]):
+        ids.extend(range(int(first), int(last or first) + 1))
+    return ids
+
+
+def strip_citations(raw):
+    """Toglie i tag di citazione in un'unica passata sul testo.
+
+    Restituisce ``(text, tags)``: il testo ripulito e, per ogni tag, la coppia
+    ``(ids, offset)`` con la posizione del tag nel testo ripulito.
+    """
+    pieces, tags = [], []
+    last = length = 0
+    for match in SOURCE_TAG_PATTERN.finditer(raw):
+        pieces.append(raw[last:match.start()])
+        length += match.start() - last
+        tags.append((source_ids(match.group()), length))
+        last = match.end()
+    pieces.append(raw[last:])
+    return "".join(pieces), tags
+
+
+def index_citations(text, sections, tags):
+    """Indice ``id -> (Citation, ...)`` dei tag estratti da ``strip_citations``.
+
+    Il passaggio citato va dall'inizio della frase (o dal tag precedente
+    nella stessa frase) fino alla posizione del tag.
+    """
+    starts = [section.start for section in sections]
+    index = {}
+    previous = 0
+    for ids, offset in tags:
+        section = max(bisect.bisect_right(starts, offset) - 1, 0)
+        sentence = max((m.end() for m in SENTENCE_END_PATTERN.finditer(text, sections[section].start, offset)), default=sections[section].start)
+        start = max(sentence, previous if previous < offset else 0)
+        for source in ids:
+            index.setdefault(source, []).append(Citation(source, section, start, offset))
+        previous = offset
+    return MappingProxyType({source: tuple(citations) for source, citations in index.items()})
+
+
+def compact_links(body):
+    """Sostituisce i link inline con riferimenti numerati e deduplicati.
+
+    Ogni URL distinto riceve un numero progressivo; le citazioni tra parentesi
+    diventano ``[n]`` e gli altri link mantengono il proprio testo. In coda
+    vengono aggiunti l'elenco delle fonti, con il titolo una sola volta per
+    pagina citata (gli URL che differiscono solo per il frammento ``#:~:text=``
+    sono raggruppati), e le definizioni dei riferimenti con l'URL completo.
+    Restituisce ``(markdown, links)``.
+    """
+    numbers = {}
+    links = []
+
+    def replace(match):
+        is_citation, text, url = match.group(1), match.group(2), match.group(3)
+        n = numbers.get(url)
+        if n is None:
+            links.append((url, text))
+            n = numbers[url] = len(links)
+        if is_citation:
+            return f"[\\[{n}\\]][{n}]"
+        return f"[{text}][{n}]"
+
+    markdown = INLINE_LINK_PATTERN.sub(replace, body)
+    if not links:
+        return body, ()
+
+    pages = {}
+    for n, (url, text) in enumerate(links, start=1):
+        pages.setdefault(url.split('#', 1)[0], (text, []))[1].append(n)
+    sources = "\n".join(
+        "* " + " ".join(f"[\\[{n}\\]][{n}]" for n in refs) + f" [{text}][{refs[0]}]"
+        for text, refs in pages.values()
+    )
+    definitions = "\n".join(f"[{n}]: {url}" for n, (url, text) in enumerate(links, start=1))
+    return f"{markdown}\n\n**Fonti:**\n\n{sources}\n\n{definitions}", tuple(links)
+
+
+def _make_section(title, level, start, end, body):
+    markdown, links = compact_links(body)
+    return Section(title, level, start, end, body, markdown, links)
+
+
+def parse_sections(text):
+    """Suddivide il testo in sezioni in base ai titoli markdown.
+
+    Nota: è una suddivisione euristica; il testo che precede il primo titolo
+    confluisce nella sezione "Introduzione".
+    """
+    sections = []
+    title, level, start, body_start = INTRO_TITLE, 0, 0, 0
+    for match in TITLE_PATTERN.finditer(text):
+        sections.append(_make_section(title, level, start, match.start(), text[body_start:match.start()].strip()))
+        raw_title = match.group(1).strip()
+        level = len(raw_title) - len(raw_title.lstrip('#'))
+        title = raw_title.replace('#', '').replace('*', '').strip()
+        # Pulisce il titolo da eventuali numeri iniziali e punti
+        title = re.sub(r"^\d+\.\s+", "", title)
+        start, body_start = match.start(), match.end()
+    sections.append(_make_section(title, level, start, len(text), text[body_start:].strip()))
+    return tuple(sections)
+
+
+@st.cache_resource(show_spinner=False, max_entries=256)
+def _parse_by_hash(sha256, _text):
+    # Il contenuto è identificato dal suo hash: il testo non viene ri-hashato da Streamlit
+    text, tags = strip_citations(_text)
+    sections = parse_sections(text)
+    return text, sections, index_citations(text, sections, tags)
+
+
+@st.cache_resource(show_spinner=False, max_entries=256)
+def _load_by_signature(path, mtime_ns, size):
+    with open(path, 'r', encoding='utf-8') as f:
+        raw = f.read()
+    sha256 = hashlib.sha256(raw.encode('utf-8')).hexdigest()
+    text, sections, citations = _parse_by_hash(sha256, raw)
+    return AnalysisDocument(path, sha256, text, sections, citations)
+
+
+def load_document(path):
+    """Restituisce il documento indicizzato; solleva OSError se il file non è leggibile."""
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    return _load_by_signature(path, stat.st_mtime_ns, stat.st_size)
+
+
+def load_documents(paths):
+    """Carica più file di analisi; i file non leggibili sono riportati a parte.
+
+    Restituisce ``(documenti, errori)`` dove ``errori`` è una lista di coppie
+    ``(percorso, eccezione)``.
+    """
+    documents, errors = [], []
+    for path in paths:
+        try:
+            documents.append(load_document(path))
+        except (OSError, UnicodeDecodeError) as e:
+            errors.append((path, e))
+    return documents, errors
+
+
+def find_citations(documents, source):
+    """Passaggi che citano ``source`` come coppie ``(posizione del documento, Citation)``."""
+    return [(d, citation) for d, doc in enumerate(documents) for citation in doc.citations.get(source, ())]
@@ -0,0 +1,228 @@
+# -*- coding: utf-8 -*-
+"""Avvio della dashboard con preriscaldamento delle cache e report dei tempi di avvio.
+
+Uso::
+
+    python -m fdj.avvio [--porta 8501] [--senza-preriscaldamento] [opzioni di streamlit run]
+    python -m fdj.avvio --report [--output avvio.json]
+
+Nel primo modo viene avviato ``streamlit run`` (le opzioni non riconosciute,
+es. ``--server.enableCORS false``, sono passate a Streamlit; la porta si
+indica con ``--porta`` o con ``--server.port``). Appena il server accetta
+connessioni, una sessione
+interna visita tutte le sezioni sul websocket come farebbe il browser
+(``fdj.carico.giro_sezioni``): import di pandas e Plotly, bundle, cubo degli
+scenari, figure e analisi vengono caricati nel processo del server prima che
+arrivi il primo utente, che riceve la pagina dalle cache calde. Il
+preriscaldamento gira in un thread e non interrompe mai il server: se il
+server tarda a rispondere o la visita fallisce, viene solo segnalato. È il comando
+usato dal devcontainer (Codespaces) ed è adatto alle repliche avviate
+dall'autoscaling.
+
+Con ``--report`` vengono avviati due server locali, uno senza e uno con il
+preriscaldamento, e per ciascuno sono misurati:
+
+- il tempo fino alla prima risposta del controllo di salute del server;
+- il primo run di una sessione nuova e il primo passaggio su ogni sezione;
+- il tempo di import per pacchetto (``python -X importtime``, tempo proprio
+  dei moduli sommato per pacchetto radice), diviso per fase.
+
+Richiede il pacchetto ``websockets`` (dipendenza del server di Streamlit).
+"""
+import argparse
+import asyncio
+import json
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+
+from fdj.carico import APP, Sessione, attendi_server, giro_sezioni, porta_libera, server_pronto
+
+PORTA = 8501
+PREFISSO_IMPORT = "import time:"
+# Pausa prima di cambiare fase nel report: le righe di importtime in volo sullo stderr vanno lette
+ASSESTAMENTO_S = 0.3
+N_PACCHETTI = 6
+
+
+def _comando(porta, opzioni=()):
+    # La porta passata tra le opzioni di Streamlit ha la precedenza (vedi main)
+    porta = () if porta_opzioni(opzioni) is not None else ("--server.port", str(porta))
+    return [sys.executable, "-m", "streamlit", "run", str(APP), *porta, *opzioni]
+
+
+def porta_opzioni(opzioni):
+    """Porta indicata in ``opzioni`` con ``--server.port N`` o ``--server.port=N`` (``None`` se assente)."""
+    for i, opzione in enumerate(opzioni):
+        if opzione == "--server.port" and i + 1 < len(opzioni):
+            return int(opzioni[i + 1])
+        if opzione.startswith("--server.port="):
+            return int(opzione.split("=", 1)[1])
+    return None
+
+
+def preriscalda(porta):
+    """Visita tutte le sezioni del server in ascolto su ``porta``; restituisce ``(sezioni, secondi)``."""
+    inizio = time.perf_counter()
+    sezioni = asyncio.run(giro_sezioni(porta))
+    return sezioni, time.perf_counter() - inizio
+
+
+def _preriscalda_in_background(porta, processo):
+    # Attesa senza limite e senza conseguenze per il server: un avvio lento ritarda solo il preriscaldamento
+    if not server_pronto(porta, processo, timeout=None):
+        return
+    try:
+        sezioni, durata = preriscalda(porta)
+    except Exception as e:  # il server resta utilizzabile anche se il preriscaldamento fallisce
+        print(f"fdj.avvio: preriscaldamento non riuscito: {e!r}", file=sys.stderr, flush=True)
+        return
+    print(f"fdj.avvio: cache preriscaldate in {durata:.1f} s ({len(sezioni)} sezioni)", flush=True)
+
+
+def avvia(porta=PORTA, opzioni=(), preriscaldamento=True):
+    """Avvia il server, lo preriscalda in background e ne attende la fine; restituisce il codice di uscita."""
+    porta = porta_opzioni(opzioni) or porta
+    processo = subprocess.Popen(_comando(porta, opzioni), cwd=APP.parent)
+    # SIGTERM (es. arresto del container) arriva al lanciatore: va girato al server
+    signal.signal(signal.SIGTERM, lambda *_: processo.terminate())
+    try:
+        if preriscaldamento:
+            threading.Thread(target=_preriscalda_in_background, args=(porta, processo), daemon=True).start()
+        return processo.wait()
+    except KeyboardInterrupt:
+        processo.terminate()
+        return processo.wait()
+
+
+# --- Report dei tempi di avvio ---
+
+
+def importazioni(righe):
+    """Tempo di import in ms per pacchetto radice dalle righe di ``-X importtime`` (tempo proprio, senza doppi conteggi)."""
+    pacchetti = Counter()
+    for riga in righe:
+        proprio, _cumulativo, modulo = riga[len(PREFISSO_IMPORT):].split("|")
+        if proprio.strip().isdigit():  # salta l'intestazione
+            pacchetti[modulo.strip().split(".")[0]] += int(proprio) / 1000
+    return dict(pacchetti.most_common())
+
+
+class _StderrServer:
+    """Legge lo stderr del server e ne raccoglie le righe di importtime per la fase corrente."""
+
+    def __init__(self, processo):
+        self.fase = "avvio del server"
+        self.righe = defaultdict(list)
+        self._thread = threading.Thread(target=self._leggi, args=(processo.stderr,), daemon=True)
+        self._thread.start()
+
+    def _leggi(self, stderr):
+        for riga in stderr:
+            if riga.startswith(PREFISSO_IMPORT):
+                self.righe[self.fase].append(riga)
+
+    def passa_a(self, fase):
+        time.sleep(ASSESTAMENTO_S)
+        self.fase = fase
+
+    def chiudi(self):
+        self._thread.join(timeout=5)
+
+
+async def _prima_sessione(porta, stderr):
+    async with Sessione(porta) as sessione:
+        primo = await sessione.rerun()
+        stderr.passa_a("prime visite alle sezioni")
+        sezioni = {sezione: await sessione.rerun(sezione) for sezione in sessione.sezioni}
+        return primo, sezioni
+
+
+def misura_avvio(preriscaldamento):
+    """Avvia un server con ``-X importtime`` e misura prontezza, primo run, sezioni e import per fase."""
+    porta = porta_libera()
+    ambiente = dict(os.environ, PYTHONPROFILEIMPORTTIME="1")
+    inizio = time.perf_counter()
+    processo = subprocess.Popen(
+        _comando(porta, ("--server.headless", "true", "--browser.gatherUsageStats", "false")),
+        cwd=APP.parent, env=ambiente, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True,
+    )
+    stderr = _StderrServer(processo)
+    try:
+        attendi_server(porta, processo, intervallo=0.05)
+        pronto = time.perf_counter() - inizio
+        preriscaldamento_s = None
+        if preriscaldamento:
+            stderr.passa_a("preriscaldamento")
+            preriscaldamento_s = preriscalda(porta)[1]
+        stderr.passa_a("primo run")
+        primo, sezioni = asyncio.run(_prima_sessione(porta, stderr))
+        stderr.passa_a("fine")
+    finally:
+        processo.terminate()
+        processo.wait(timeout=30)
+        stderr.chiudi()
+
+    fasi = {fase: importazioni(righe) for fase, righe in stderr.righe.items() if fase != "fine"}
+    return {
+        'server_pronto_s': pronto,
+        'preriscaldamento_s': preriscaldamento_s,
+        'primo_run_s': primo,
+        'prime_visite_s': sezioni,
+        'import_ms': fasi,
+    }
+
+
+def stampa_report(report):
+    for modo, misure in report.items():
+        print(f"\n== {modo} ==")
+        print(f"server pronto:     {misure['server_pronto_s']:6.2f} s")
+        if misure['preriscaldamento_s'] is not None:
+            print(f"preriscaldamento:  {misure['preriscaldamento_s']:6.2f} s (in background, server già raggiungibile)")
+        print(f"primo run:         {misure['primo_run_s']:6.2f} s")
+        for sezione, durata in misure['prime_visite_s'].items():
+            print(f"  {sezione:<24}{durata:6.2f} s")
+        print("import per fase (ms, tempo proprio per pacchetto):")
+        for fase, pacchetti in misure['import_ms'].items():
+            principali = ", ".join(f"{nome} {ms:.0f}" for nome, ms in list(pacchetti.items())[:N_PACCHETTI])
+            print(f"  {fase:<26}{sum(pacchetti.values()):6.0f}  {principali}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m fdj.avvio",
+        description="Avvio della dashboard con preriscaldamento delle cache (le altre opzioni sono passate a streamlit run).",
+    )
+    parser.add_argument('--porta', type=int, help="porta del server (predefinita 8501; in alternativa --server.port)")
+    parser.add_argument('--senza-preriscaldamento', action='store_true', help="avvia il server senza visitare le sezioni")
+    parser.add_argument('--report', action='store_true', help="misura l'avvio con e senza preriscaldamento invece di avviare il server")
+    parser.add_argument('--output', default="avvio.json", help="file JSON del report (predefinito: avvio.json)")
+    args, opzioni = parser.parse_known_args(argv)
+
+    if not args.report:
+        try:
+            porta_streamlit = porta_opzioni(opzioni)
+        except ValueError:
+            parser.error("--server.port richiede un numero di porta")
+        if None not in (args.porta, porta_streamlit) and args.porta != porta_streamlit:
+            parser.error(f"porte in conflitto: --porta {args.porta} e --server.port {porta_streamlit}")
+        return avvia(porta_streamlit or args.porta or PORTA, opzioni, preriscaldamento=not args.senza_preriscaldamento)
+
+    report = {}
+    for modo, preriscaldamento in (("senza preriscaldamento", False), ("con preriscaldamento", True)):
+        print(f"Avvio {modo}...", flush=True)
+        report[modo] = misura_avvio(preriscaldamento)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=1, ensure_ascii=False)
+        f.write("\n")
+    stampa_report(report)
+    print(f"\nReport salvato in {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+"""Benchmark della dashboard eseguita senza browser (``streamlit.testing``).
+
+Uso::
+
+    python -m fdj.benchmark [--output risultati.json] [--ripetizioni 5]
+    python -m fdj.benchmark --confronta base.json --output nuovo.json [--soglia 0.2]
+
+Misure raccolte (tutte "più basso è meglio"):
+
+- ``avvio_freddo_s``: primo run dello script in un processo nuovo, con le
+  cache su disco vuote (cartella temporanea al posto di ``.cache``, salvo
+  ``--cache-dir``);
+- ``rerun_caldo_s``: mediana dei rerun successivi della stessa sessione;
+- ``sezione.<slug>_s``: mediana dei run con la sezione ``slug`` attiva;
+- ``picco_alloc_mb.<slug>``: picco delle allocazioni Python (``tracemalloc``)
+  in un run della sezione, misurato in una passata separata per non falsare
+  i tempi;
+- ``grafici_kb.<slug>``: dimensione delle specifiche Plotly inviate dalla
+  sezione (il dettaglio per grafico è in ``dettagli.grafici``);
+- ``picco_rss_mb``: picco della memoria residente del processo.
+
+Con ``--confronta`` il benchmark viene eseguito e confrontato con un file di
+risultati precedente: le misure peggiorate oltre ``--soglia`` (relativa) e
+oltre le tolleranze assolute sono segnalate e il codice di uscita è 1.
+I nuovi risultati vanno scritti in un file diverso dalla base (``--output``):
+se i due percorsi coincidono l'esecuzione è rifiutata.
+Funziona offline: nessun server né browser, solo lo script e i dataset locali.
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from pathlib import Path
+
+APP = Path(__file__).resolve().parent.parent / "fdj_dividend_app.py"
+VERSIONE_RISULTATI = 1
+RIPETIZIONI = 5
+TIMEOUT_S = 120
+SOGLIA = 0.20
+# Variazioni assolute sotto queste tolleranze non sono regressioni (rumore di misura)
+TOLLERANZE = {'_s': 0.05, '_mb': 2.0, '_kb': 1.0}
+
+
+def _app_test():
+    # Import differito: l'ambiente (cartella delle cache) va impostato prima di Streamlit e fdj
+    from streamlit.testing.v1 import AppTest
+    return AppTest.from_file(str(APP), default_timeout=TIMEOUT_S)
+
+
+def _esegui(at):
+    """Esegue un run e ne restituisce la durata; solleva ``RuntimeError`` se lo script va in errore."""
+    inizio = time.perf_counter()
+    at.run()
+    durata = time.perf_counter() - inizio
+    if at.exception:
+        raise RuntimeError(f"eccezione nello script: {at.exception[0].value}")
+    return durata
+
+
+def _radio_sezione(at):
+    return next(r for r in at.radio if r.key == 'sezione')
+
+
+def _grafici(at, sezione):
+    return [{'sezione': sezione, 'indice': i, 'byte': len(c.proto.spec)}
+            for i, c in enumerate(at.get("plotly_chart"))]
+
+
+def _picco_rss_mb():
+    # ru_maxrss è in KiB su Linux, in byte su macOS
+    picco = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return picco / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+
+
+def esegui_benchmark(ripetizioni=RIPETIZIONI):
+    """Misura avvio a freddo, rerun a caldo e ogni sezione; restituisce il dizionario dei risultati."""
+    metriche, dettagli = {}, {'rerun_caldo_s': [], 'sezioni_s': {}, 'grafici': []}
+
+    at = _app_test()
+    metriche['avvio_freddo_s'] = _esegui(at)
+    dettagli['rerun_caldo_s'] = [_esegui(at) for _ in range(ripetizioni)]
+    metriche['rerun_caldo_s'] = statistics.median(dettagli['rerun_caldo_s'])
+
+    # Le opzioni del radio sono le etichette; le misure usano lo slug della sezione (valore del widget)
+    sezioni = {}
+    for etichetta in _radio_sezione(at).options:
+        _radio_sezione(at).set_value(etichetta)
+        _esegui(at)  # primo run della sezione: cache della sezione riempite
+        sezione = sezioni[etichetta] = _radio_sezione(at).value
+        tempi = [_esegui(at) for _ in range(ripetizioni)]
+        dettagli['sezioni_s'][sezione] = tempi
+        metriche[f'sezione.{sezione}_s'] = statistics.median(tempi)
+        grafici = _grafici(at, sezione)
+        dettagli['grafici'].extend(grafici)
+        metriche[f'grafici_kb.{sezione}'] = sum(g['byte'] for g in grafici) / 1024
+
+    # Passata separata con tracemalloc (rallenta l'esecuzione)
+    tracemalloc.start()
+    try:
+        for etichetta, sezione in sezioni.items():
+            _radio_sezione(at).set_value(etichetta)
+            tracemalloc.reset_peak()
+            _esegui(at)
+            metriche[f'picco_alloc_mb.{sezione}'] = tracemalloc.get_traced_memory()[1] / 2**20
+    finally:
+        tracemalloc.stop()
+    metriche['picco_rss_mb'] = _picco_rss_mb()
+
+    import streamlit
+    return {
+        'versione': VERSIONE_RISULTATI,
+        'data': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'ambiente': {
+            'python': platform.python_version(),
+            'streamlit': streamlit.__version__,
+            'piattaforma': platform.platform(),
+            'cpu': os.cpu_count(),
+            'ripetizioni': ripetizioni,
+        },
+        'metriche': metriche,
+        'dettagli': dettagli,
+    }
+
+
+def _tolleranza(nome):
+    return next((v for suffisso, v in TOLLERANZE.items() if nome.endswith(suffisso)), 0.0)
+
+
+def confronta(base, nuovi, soglia=SOGLIA):
+    """Righe ``(metrica, base, nuovo, variazione relativa, regressione)`` delle misure comuni."""
+    righe = []
+    for nome in sorted(set(base['metriche']) & set(nuovi['metriche'])):
+        prima, dopo = base['metriche'][nome], nuovi['metriche'][nome]
+        variazione = (dopo - prima) / prima if prima else 0.0
+        regressione = variazione > soglia and dopo - prima > _tolleranza(nome)
+        righe.append((nome, prima, dopo, variazione, regressione))
+    return righe
+
+
+def _stampa_confronto(righe, soglia):
+    larghezza = max((len(r[0]) for r in righe), default=10)
+    print(f"{'metrica':<{larghezza}}  {'base':>10}  {'nuovo':>10}  {'var.':>8}")
+    for nome, prima, dopo, variazione, regressione in righe:
+        segnale = "  << REGRESSIONE" if regressione else ""
+        print(f"{nome:<{larghezza}}  {prima:>10.3f}  {dopo:>10.3f}  {variazione:>+8.1%}{segnale}")
+    n = sum(r[4] for r in righe)
+    print(f"\n{n} regressioni oltre il {soglia:.0%}" if n else f"\nNessuna regressione oltre il {soglia:.0%}")
+    return n
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m fdj.benchmark", description="Benchmark headless della dashboard.")
+    parser.add_argument('--output', default="benchmark.json", help="file JSON dei risultati (predefinito: benchmark.json)")
+    parser.add_argument('--ripetizioni', type=int, default=RIPETIZIONI, help="rerun misurati per fase")
+    parser.add_argument('--confronta', metavar='BASE', help="risultati precedenti da confrontare")
+    parser.add_argument('--soglia', type=float, default=SOGLIA, help="peggioramento relativo segnalato (predefinito 0.2)")
+    parser.add_argument('--cache-dir', help="cartella delle cache su disco (predefinito: temporanea, avvio a freddo)")
+    args = parser.parse_args(argv)
+
+    base = None
+    if args.confronta and Path(args.output).resolve() == Path(args.confronta).resolve():
+        parser.error(f"--output coincide con il file da confrontare ({args.confronta}): "
+                     "i nuovi risultati sovrascriverebbero la base, indicare un altro --output")
+    if args.confronta:
+        with open(args.confronta, 'r', encoding='utf-8') as f:
+            base = json.load(f)
+
+    with tempfile.TemporaryDirectory(prefix="fdj-benchmark-") as cartella:
+        os.environ['FDJ_CACHE_DIR'] = args.cache_dir or cartella
+        risultati = esegui_benchmark(args.ripetizioni)
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(risultati, f, indent=1, ensure_ascii=False)
+        f.write("\n")
+    print(f"Risultati salvati in {args.output}")
+
+    if base is None:
+        for nome, valore in sorted(risultati['metriche'].items()):
+            print(f"{nome:<32} {valore:>10.3f}")
+        return 0
+    return 1 if _stampa_confronto(confronta(base, risultati, args.soglia), args.soglia) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,304 @@
+# -*- coding: utf-8 -*-
+"""Test di carico della dashboard: N sessioni simultanee sul protocollo websocket di Streamlit.
+
+Uso::
+
+    python -m fdj.carico [--sessioni 1,5,10,25,50] [--rerun 20] [--output carico.json]
+
+Per ogni livello N viene avviato un server locale (``streamlit run`` con la
+configurazione del repository, ``.streamlit/config.toml``). Una prima sessione
+visita tutte le sezioni per riempire le cache di processo, poi N sessioni
+aprono il websocket ``/_stcore/stream`` come farebbe il browser e, insieme,
+eseguono ``--rerun`` rerun ciascuna alternando cambi di sezione (widget
+``sezione``) e rerun semplici. La latenza di un rerun è il tempo tra l'invio
+del ``BackMsg`` e il ``script_finished`` del server.
+
+Il report riporta per livello:
+
+- latenza p50/p95/p99 dei rerun (e p50 del primo run di ogni sessione);
+- RSS del server prima delle sessioni e massimo durante il test, con la
+  crescita per sessione ``(max - base) / N`` (include le allocazioni
+  temporanee dei run in corso);
+- RSS trattenuto: misurato a rerun finiti con le N sessioni ancora aperte,
+  ``(aperte - base) / N`` è la memoria che ogni sessione inattiva occupa;
+- CPU del server: secondi di CPU per secondo di test (100% = un core) e
+  saturazione rispetto ai core disponibili.
+
+Il client è un solo processo asyncio: con molti livelli alti conviene
+verificare che non sia lui il collo di bottiglia (CPU del client riportata).
+Richiede Linux (``/proc``) e il pacchetto ``websockets`` (dipendenza del server
+di Streamlit).
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+from pathlib import Path
+
+import numpy as np
+
+APP = Path(__file__).resolve().parent.parent / "fdj_dividend_app.py"
+LIVELLI = (1, 5, 10, 25)
+RERUN = 20
+TIMEOUT_S = 120
+AVVIO_S = 60
+# Pausa prima della misura della memoria trattenuta (fine dei messaggi in volo)
+ASSESTAMENTO_S = 1.0
+CHIAVE_SEZIONE = 'sezione'
+PERCENTILI = (50, 95, 99)
+
+
+def porta_libera():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def _rss_mb(pid):
+    with open(f"/proc/{pid}/status", encoding='ascii') as f:
+        for riga in f:
+            if riga.startswith('VmRSS:'):
+                return int(riga.split()[1]) / 1024
+    return float('nan')
+
+
+def _cpu_s(pid):
+    with open(f"/proc/{pid}/stat", encoding='ascii') as f:
+        campi = f.read().rsplit(')', 1)[1].split()
+    # utime e stime (campi 14 e 15 di /proc/<pid>/stat), in tick del clock
+    return (int(campi[11]) + int(campi[12])) / os.sysconf('SC_CLK_TCK')
+
+
+def server_pronto(porta, processo, timeout=AVVIO_S, intervallo=0.2):
+    """Attende che il server sulla porta indicata risponda al controllo di salute.
+
+    Restituisce ``False`` se ``processo`` esce o se il server non risponde
+    entro ``timeout`` secondi (``None``: finché il processo è vivo); il
+    processo non viene toccato.
+    """
+    scadenza = time.monotonic() + timeout if timeout is not None else None
+    while (scadenza is None or time.monotonic() < scadenza) and processo.poll() is None:
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{porta}/_stcore/health", timeout=1) as r:
+                if r.status == 200:
+                    return True
+        except OSError:
+            time.sleep(intervallo)
+    return False
+
+
+def attendi_server(porta, processo, intervallo=0.2):
+    """Come ``server_pronto``, ma termina ``processo`` e solleva ``RuntimeError`` se il server non risponde entro ``AVVIO_S`` secondi."""
+    if not server_pronto(porta, processo, AVVIO_S, intervallo):
+        processo.kill()
+        raise RuntimeError(f"il server non risponde sulla porta {porta} dopo {AVVIO_S} s")
+
+
+def avvia_server(porta):
+    """Avvia ``streamlit run`` sulla porta indicata e attende che risponda."""
+    processo = subprocess.Popen(
+        [sys.executable, "-m", "streamlit", "run", str(APP), "--server.headless", "true",
+         "--server.port", str(porta), "--browser.gatherUsageStats", "false"],
+        cwd=APP.parent, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    attendi_server(porta, processo)
+    return processo
+
+
+class Sessione:
+    """Una sessione del browser simulata: invia rerun e misura la latenza fino a ``script_finished``."""
+
+    def __init__(self, porta):
+        self.porta = porta
+        self.ws = None
+        self.radio = None
+        self.errori = 0
+
+    async def __aenter__(self):
+        import websockets
+        self.ws = await websockets.connect(
+            f"ws://127.0.0.1:{self.porta}/_stcore/stream", subprotocols=["streamlit"],
+            origin=f"http://127.0.0.1:{self.porta}", max_size=None,
+            # Niente ping lato client (il browser non li invia): con il server saturo
+            # il pong arriva in ritardo e la connessione verrebbe chiusa
+            ping_interval=None,
+        )
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.ws.close()
+
+    async def rerun(self, sezione=None):
+        """Esegue un rerun (con la sezione indicata, se data) e ne restituisce la durata."""
+        from streamlit.proto.BackMsg_pb2 import BackMsg
+        from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+
+        msg = BackMsg()
+        msg.rerun_script.query_string = ""
+        if sezione is not None and self.radio is not None:
+            widget = msg.rerun_script.widget_states.widgets.add()
+            widget.id = self.radio.id
+            widget.string_value = sezione
+        inizio = time.perf_counter()
+        await self.ws.send(msg.SerializeToString())
+        while True:
+            risposta = ForwardMsg()
+            risposta.ParseFromString(await asyncio.wait_for(self.ws.recv(), TIMEOUT_S))
+            tipo = risposta.WhichOneof('type')
+            if tipo == 'script_finished':
+                return time.perf_counter() - inizio
+            if tipo == 'delta' and risposta.delta.WhichOneof('type') == 'new_element':
+                elemento = risposta.delta.new_element
+                if elemento.WhichOneof('type') == 'exception':
+                    self.errori += 1
+                elif elemento.WhichOneof('type') == 'radio' and elemento.radio.id.endswith(f"-{CHIAVE_SEZIONE}"):
+                    self.radio = elemento.radio
+
+    @property
+    def sezioni(self):
+        return list(self.radio.options) if self.radio is not None else []
+
+
+async def giro_sezioni(porta):
+    """Una sessione visita tutte le sezioni per riempire le cache del processo; restituisce le sezioni visitate."""
+    async with Sessione(porta) as sessione:
+        await sessione.rerun()
+        for sezione in sessione.sezioni:
+            await sessione.rerun(sezione)
+        return sessione.sezioni
+
+
+async def _utente(porta, n_rerun, avvio, finiti, chiusura, sessioni, n):
+    async with Sessione(porta) as sessione:
+        await avvio.wait()
+        primo = await sessione.rerun()
+        tempi = []
+        sezioni = sessione.sezioni
+        for i in range(n_rerun):
+            # Rerun alternati: cambio di sezione e rerun della sezione corrente
+            sezione = sezioni[(i // 2) % len(sezioni)] if sezioni and i % 2 == 0 else None
+            tempi.append(await sessione.rerun(sezione))
+        sessioni.append(sessione)
+        if len(sessioni) == n:
+            finiti.set()
+        # La sessione resta aperta fino alla misura della memoria trattenuta
+        await chiusura.wait()
+        return primo, tempi
+
+
+async def _campiona_rss(pid, fine, massimo):
+    while not fine.is_set():
+        massimo[0] = max(massimo[0], _rss_mb(pid))
+        await asyncio.sleep(0.1)
+
+
+async def _livello(porta, pid, n, n_rerun):
+    avvio, finiti, chiusura, fine = asyncio.Event(), asyncio.Event(), asyncio.Event(), asyncio.Event()
+    sessioni, massimo = [], [_rss_mb(pid)]
+    campionatore = asyncio.create_task(_campiona_rss(pid, fine, massimo))
+    compiti = [asyncio.create_task(_utente(porta, n_rerun, avvio, finiti, chiusura, sessioni, n)) for _ in range(n)]
+    await asyncio.sleep(0.5)  # connessioni aperte prima di partire insieme
+    cpu_client, cpu_server, inizio = time.process_time(), _cpu_s(pid), time.perf_counter()
+    avvio.set()
+    # Attende che tutte le sessioni abbiano finito i rerun (o che una fallisca)
+    attesa = asyncio.create_task(finiti.wait())
+    await asyncio.wait([attesa, *compiti], return_when=asyncio.FIRST_COMPLETED)
+    durata = time.perf_counter() - inizio
+    cpu_server, cpu_client = _cpu_s(pid) - cpu_server, time.process_time() - cpu_client
+    fine.set()
+    await campionatore
+    if finiti.is_set():
+        await asyncio.sleep(ASSESTAMENTO_S)
+    rss_aperte = _rss_mb(pid)
+    chiusura.set()
+    attesa.cancel()
+    risultati = await asyncio.gather(*compiti)
+    return risultati, durata, cpu_server, cpu_client, massimo[0], rss_aperte, sum(s.errori for s in sessioni)
+
+
+def misura_livello(n, n_rerun=RERUN):
+    """Avvia un server, lo scalda e misura ``n`` sessioni simultanee; restituisce il riepilogo del livello."""
+    porta = porta_libera()
+    server = avvia_server(porta)
+    try:
+        asyncio.run(giro_sezioni(porta))
+        time.sleep(1.0)
+        rss_base = _rss_mb(server.pid)
+        risultati, durata, cpu_server, cpu_client, rss_max, rss_aperte, errori = asyncio.run(_livello(porta, server.pid, n, n_rerun))
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+    primi = np.array([primo for primo, _ in risultati])
+    tempi = np.concatenate([tempi for _, tempi in risultati]) if n_rerun else np.array([np.nan])
+    ms = np.percentile(tempi, PERCENTILI) * 1000
+    n_core = os.cpu_count() or 1
+    return {
+        'sessioni': n,
+        'rerun': int(len(tempi)),
+        'errori': int(errori),
+        **{f'p{p}_ms': float(v) for p, v in zip(PERCENTILI, ms)},
+        'primo_run_p50_ms': float(np.median(primi) * 1000),
+        'rerun_al_secondo': float(len(tempi) / durata),
+        'rss_base_mb': rss_base,
+        'rss_max_mb': rss_max,
+        'rss_per_sessione_mb': (rss_max - rss_base) / n,
+        'rss_sessioni_aperte_mb': rss_aperte,
+        'rss_trattenuto_per_sessione_mb': (rss_aperte - rss_base) / n,
+        'cpu_server_pct': cpu_server / durata * 100,
+        'saturazione_cpu_pct': cpu_server / durata / n_core * 100,
+        'cpu_client_pct': cpu_client / durata * 100,
+    }
+
+
+COLONNE = (
+    ('sessioni', "N", "{:>4d}"),
+    ('p50_ms', "p50 ms", "{:>8.0f}"),
+    ('p95_ms', "p95 ms", "{:>8.0f}"),
+    ('p99_ms', "p99 ms", "{:>8.0f}"),
+    ('rerun_al_secondo', "rerun/s", "{:>8.1f}"),
+    ('rss_max_mb', "RSS MB", "{:>8.0f}"),
+    ('rss_per_sessione_mb', "MB/sess", "{:>8.2f}"),
+    ('rss_trattenuto_per_sessione_mb', "tratt./s", "{:>8.2f}"),
+    ('cpu_server_pct', "CPU %", "{:>7.0f}"),
+    ('saturazione_cpu_pct', "satur. %", "{:>8.0f}"),
+    ('cpu_client_pct', "client %", "{:>8.0f}"),
+    ('errori', "errori", "{:>6d}"),
+)
+
+
+def stampa_report(livelli):
+    print("  ".join(f"{titolo:>{len(formato.format(0))}}" for _, titolo, formato in COLONNE))
+    for livello in livelli:
+        print("  ".join(formato.format(livello[chiave]) for chiave, _, formato in COLONNE))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m fdj.carico", description="Test di carico con sessioni websocket simultanee.")
+    parser.add_argument('--sessioni', default=",".join(str(n) for n in LIVELLI), help="livelli di sessioni simultanee, es. 1,10,50")
+    parser.add_argument('--rerun', type=int, default=RERUN, help="rerun per sessione dopo il primo run")
+    parser.add_argument('--output', default="carico.json", help="file JSON del report (predefinito: carico.json)")
+    args = parser.parse_args(argv)
+    if not Path("/proc/self/status").exists():
+        parser.error("il test di carico legge RSS e CPU del server da /proc: serve Linux")
+
+    livelli = []
+    for n in (int(v) for v in args.sessioni.split(",")):
+        print(f"{n} sessioni...", flush=True)
+        livelli.append(misura_livello(n, args.rerun))
+    report = {'cpu': os.cpu_count(), 'rerun_per_sessione': args.rerun, 'livelli': livelli}
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=1, ensure_ascii=False)
+        f.write("\n")
+    stampa_report(livelli)
+    print(f"\nReport salvato in {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+"""Strato dati della dashboard.
+
+I dati di ogni società sono letti dal suo bundle in ``datasets/`` (formato in
+``fdj.dataset``). Le tabelle di un bundle vengono costruite una sola volta per
+processo, con le tabelle derivate, e condivise tra tutte le sessioni tramite
+``st.cache_resource``; la cache tiene al massimo ``MAX_DATASET`` bundle. Ogni
+sessione riceve viste copy-on-write delle tabelle condivise, create solo per
+le tabelle lette: eventuali modifiche restano locali alla sessione e non
+alterano la copia in cache.
+"""
+import hashlib
+import os
+from collections.abc import Mapping
+from dataclasses import replace
+from pathlib import Path
+from types import MappingProxyType
+
+import pandas as pd
+import pyarrow as pa
+import streamlit as st
+
+from fdj.dataset import dataset_path, load_manifest, read_dataset, signature
+from fdj.metriche import calcola
+
+# Con pandas 2.x il copy-on-write è opzionale; da pandas 3 è il comportamento
+# predefinito e l'opzione non è più necessaria.
+try:
+    pd.set_option("mode.copy_on_write", True)
+except (KeyError, ValueError):
+    pass
+
+# --- Dati Chiave del ticker predefinito (datasets/<ticker>.json) ---
+# Usati dai modelli calibrati sull'analisi (simulazione Monte Carlo, cubo degli scenari)
+TICKER = load_manifest()['default']
+_INFO = read_dataset(dataset_path(TICKER)).info
+NOME_SOCIETA = _INFO['nome']
+ULTIMO_DPS_PAGATO_VAL = _INFO['ultimo_dps'] # Relativo all'esercizio 2023 [source: 4]
+ANNO_ULTIMO_DPS = _INFO['anno_ultimo_dps']
+PREZZO_RIFERIMENTO_APPROX = _INFO['prezzo_riferimento'] # Prezzo approssimativo menzionato nel testo [source: 13]
+POLITICA_PAYOUT = _INFO['politica_payout'] # [source: 3]
+DPS_ATTESO_2024_VAL = _INFO['dps_atteso'] # [source: 54]
+CRESCITA_ATTESA_DPS_2024 = _INFO['crescita_attesa_dps'] # [source: 54]
+IMPATTO_KINDRED_DIVIDENDO = _INFO['impatto_kindred_dividendo'] # [source: 57]
+RISCHIO_TASSE_2025 = _INFO['rischio_tasse'] # [source: 180, 181]
+MITIGAZIONE_TASSE = _INFO['mitigazione_tasse'] # [source: 183]
+
+# Numero massimo di bundle tenuti in memoria dal processo
+MAX_DATASET = 32
+
+# Cartella dei file derivati (tabelle Arrow, figure, cubo degli scenari), sovrascrivibile con FDJ_CACHE_DIR
+CACHE_DIR = Path(os.environ.get("FDJ_CACHE_DIR", Path(__file__).resolve().parent.parent / ".cache"))
+
+
+def hash_frame(df):
+    """Hash stabile del contenuto di un DataFrame (valori, indice, colonne e dtype)."""
+    h = hashlib.sha256()
+    h.update(repr([(str(c), str(t)) for c, t in df.dtypes.items()]).encode("utf-8"))
+    h.update(pd.util.hash_pandas_object(df, index=True).to_numpy().tobytes())
+    return h.hexdigest()
+
+
+def _derive_tables(tables, info):
+    """Tabelle derivate da quelle di base del bundle (formati lunghi e metriche derivate)."""
+    tables = dict(tables)
+
+    # Conversione a formato "lungo" per radar chart
+    tables['competitive_long'] = pd.melt(tables['competitive'], id_vars=['Dimensione'], var_name='Società', value_name='Punteggio')
+
+    # Conversione valori categorici in numerici per la mappa di calore dei rischi
+    impact_map = {'Basso': 1, 'Medio': 2, 'Alto': 3}
+    df_risk = tables['risk'].copy()
+    df_risk['Impatto_Num'] = df_risk['Impatto Dividendo'].map(impact_map)
+    tables['risk'] = df_risk
+
+    # FCF, copertura, payout, CAGR, leva e yield (vedi fdj/metriche.py)
+    return dict(calcola(tables, parametri={'prezzo': info['prezzo_riferimento']}))
+
+
+@st.cache_resource(show_spinner=False, max_entries=MAX_DATASET)
+def _load_by_signature(path, mtime_ns, size):
+    # Una voce per bundle caricato: oltre MAX_DATASET vengono scartati i meno usati
+    ds = read_dataset(path)
+    return replace(ds, tables=MappingProxyType(_derive_tables(ds.tables, ds.info)))
+
+
+def load_dataset(ticker=None):
+    """Dataset di ``ticker`` (predefinito: quello dell'indice) con le tabelle derivate.
+
+    Il bundle viene letto solo al primo accesso o quando il file cambia; la
+    verifica a ogni chiamata costa un ``os.stat``. Solleva ``KeyError`` se il
+    ticker non è nell'indice.
+    """
+    return _load_by_signature(*signature(dataset_path(ticker or default_ticker())))
+
+
+def default_ticker():
+    return load_manifest()['default']
+
+
+def list_tickers():
+    """Ticker disponibili come ``{ticker: nome}``, letti dal solo indice."""
+    return {ticker: entry['nome'] for ticker, entry in load_manifest()['tickers'].items()}
+
+
+def get_info(ticker=None):
+    """Dati chiave (nome, ultimo DPS, prezzo di riferimento, ...) del ticker."""
+    return load_dataset(ticker).info
+
+
+class _VisteTabelle(Mapping):
+    """Mapping di sola lettura che restituisce una vista copy-on-write della tabella in cache a ogni accesso."""
+
+    def __init__(self, tabelle):
+        self._tabelle = tabelle
+
+    def __getitem__(self, nome):
+        return self._tabelle[nome].copy(deep=False)
+
+    def __iter__(self):
+        return iter(self._tabelle)
+
+    def __len__(self):
+        return len(self._tabelle)
+
+
+def get_tables(ticker=None):
+    """Restituisce le tabelle condivise del ticker come mapping di sola lettura.
+
+    Ogni DataFrame letto è una copia superficiale della tabella in cache: con
+    il copy-on-write di pandas non viene copiato alcun dato, e qualunque
+    modifica (valori, colonne, ``inplace=True``) resta nella vista della
+    sessione. Le viste sono create solo per le tabelle effettivamente lette,
+    perché il namespace dello script di ogni sessione resta in memoria con i
+    suoi frammenti.
+    """
+    return _VisteTabelle(load_dataset(ticker).tables)
+
+
+def invalidate_tables():
+    """Scarta le tabelle in cache: la prossima chiamata a get_tables rilegge i bundle."""
+    _load_by_signature.clear()
+    _arrow_table.clear()
+
+
+def get_arrow_table(name, ticker=None):
+    """Tabella ``name`` del ticker come ``pyarrow.Table`` letta in memory-map da un file Arrow IPC.
+
+    Il file (``CACHE_DIR/tables/<ticker>/<name>.arrow``, non compresso) viene
+    scritto solo se manca o se il contenuto della tabella è cambiato; la
+    lettura in memory-map è zero-copy e la tabella può essere passata
+    direttamente a ``st.dataframe`` senza conversione da pandas.
+    """
+    ticker = ticker or default_ticker()
+    return _arrow_table(name, ticker, *signature(dataset_path(ticker)))
+
+
+@st.cache_resource(show_spinner=False, max_entries=MAX_DATASET)
+def _arrow_table(name, ticker, path, mtime_ns, size):
+    df = _load_by_signature(path, mtime_ns, size).tables[name]
+    fingerprint = hash_frame(df).encode("ascii")
+    path = CACHE_DIR / "tables" / ticker / f"{name}.arrow"
+    try:
+        table = pa.ipc.open_file(pa.memory_map(str(path))).read_all()
+        if table.schema.metadata and table.schema.metadata.get(b"fdj_fingerprint") == fingerprint:
+            return table
+    except (OSError, pa.ArrowInvalid):
+        pass
+
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    table = table.replace_schema_metadata({**(table.schema.metadata or {}), b"fdj_fingerprint": fingerprint})
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+    with pa.OSFile(str(tmp_path), "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table)
+    os.replace(tmp_path, path)
+    return pa.ipc.open_file(pa.memory_map(str(path))).read_all()
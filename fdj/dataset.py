@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+"""Formato dei dataset per ticker e caricamento pigro.
+
+Ogni società è descritta da un bundle JSON (``datasets/<ticker>.json``)::
+
+    {
+      "schema": 1,
+      "ticker": "FDJ.PA",
+      "info": {"nome": ..., "ultimo_dps": ..., ...},
+      "fonti": {"ultimo_dps": [4], ...},
+      "tables": {
+        "dps": {"dtypes": {"DPS (€)": "float64", ...},
+                "columns": {"Anno Esercizio": [...], "DPS (€)": [...]},
+                "fonti": [4, 5, 6]},
+        ...
+      }
+    }
+
+Le tabelle sono salvate per colonne (``null`` = non applicabile) con i dtype
+espliciti. ``fonti`` riporta i riferimenti ``[source: N]`` dell'analisi.
+
+L'indice ``datasets/manifest.json`` elenca i ticker disponibili con nome e
+file del bundle: è l'unico file letto per popolare il selettore, i bundle
+vengono aperti solo quando un ticker viene visualizzato (vedi ``fdj.data``
+per la cache limitata dei bundle caricati).
+"""
+import json
+import os
+from dataclasses import dataclass
+from pathlib import Path
+from types import MappingProxyType
+
+import pandas as pd
+import streamlit as st
+
+SCHEMA_VERSION = 1
+
+# Cartella dei dataset, sovrascrivibile con FDJ_DATASET_DIR
+DATASET_DIR = Path(os.environ.get("FDJ_DATASET_DIR", Path(__file__).resolve().parent.parent / "datasets"))
+MANIFEST_NAME = "manifest.json"
+
+# Tabelle che ogni bundle deve contenere (facoltative: ``acquisizioni``, esborsi per il piano del debito)
+TABELLE_RICHIESTE = (
+    'dps', 'fin', 'payout', 'yield_comp', 'forecast', 'cagr', 'business_mix', 'timeline',
+    'valuation', 'competitive', 'risk', 'debt', 'sustain',
+)
+# Dati chiave che ogni bundle deve contenere (gli altri, es. ``modello_scenari``, sono facoltativi)
+INFO_RICHIESTE = (
+    'nome', 'aggiornamento', 'ultimo_dps', 'anno_ultimo_dps', 'prezzo_riferimento',
+    'politica_payout', 'dps_atteso', 'crescita_attesa_dps',
+)
+
+
+@dataclass(frozen=True)
+class Dataset:
+    """Bundle di una società: dati chiave, tabelle di base e riferimenti alle fonti."""
+    ticker: str
+    path: str
+    info: MappingProxyType
+    fonti: MappingProxyType
+    tables: MappingProxyType
+
+
+def signature(path):
+    """Firma del file ``(percorso, mtime_ns, dimensione)``, usata come chiave di cache."""
+    stat = os.stat(path)
+    return str(path), stat.st_mtime_ns, stat.st_size
+
+
+@st.cache_resource(show_spinner=False, max_entries=4)
+def _manifest_by_signature(path, mtime_ns, size):
+    with open(path, 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+    if manifest.get('schema') != SCHEMA_VERSION:
+        raise ValueError(f"{path}: schema del manifest non supportato ({manifest.get('schema')!r})")
+    tickers = manifest['tickers']
+    if manifest['default'] not in tickers:
+        raise ValueError(f"{path}: ticker predefinito {manifest['default']!r} assente dall'indice")
+    return MappingProxyType({
+        'default': manifest['default'],
+        'tickers': MappingProxyType({t: MappingProxyType(entry) for t, entry in tickers.items()}),
+    })
+
+
+def load_manifest(directory=DATASET_DIR):
+    """Indice dei dataset: ``{'default': ticker, 'tickers': {ticker: {'nome', 'file'}}}``."""
+    return _manifest_by_signature(*signature(Path(directory) / MANIFEST_NAME))
+
+
+def _table_from_json(name, spec):
+    df = pd.DataFrame(spec['columns'])
+    dtypes = spec.get('dtypes', {})
+    missing = set(dtypes) - set(df.columns)
+    if missing:
+        raise ValueError(f"tabella {name!r}: dtype per colonne inesistenti {sorted(missing)}")
+    return df.astype(dtypes)
+
+
+def table_to_json(df, fonti=()):
+    """Serializza un DataFrame nel formato per colonne del bundle."""
+    columns = {c: [None if pd.isna(v) else v for v in df[c].tolist()] for c in df.columns}
+    return {
+        # I dtype testuali vengono dedotti alla lettura
+        'dtypes': {c: str(t) for c, t in df.dtypes.items() if pd.api.types.is_numeric_dtype(t)},
+        'columns': columns,
+        'fonti': list(fonti),
+    }
+
+
+def read_dataset(path):
+    """Legge e valida un bundle; solleva ``ValueError`` se non è conforme allo schema."""
+    with open(path, 'r', encoding='utf-8') as f:
+        bundle = json.load(f)
+    if bundle.get('schema') != SCHEMA_VERSION:
+        raise ValueError(f"{path}: schema del dataset non supportato ({bundle.get('schema')!r})")
+    missing = [name for name in TABELLE_RICHIESTE if name not in bundle['tables']]
+    missing += [f"info.{key}" for key in INFO_RICHIESTE if key not in bundle['info']]
+    if missing:
+        raise ValueError(f"{path}: elementi mancanti {missing}")
+    tables = {name: _table_from_json(name, spec) for name, spec in bundle['tables'].items()}
+    fonti = dict(bundle.get('fonti', {}))
+    fonti.update({f"tables.{name}": tuple(spec.get('fonti', ())) for name, spec in bundle['tables'].items()})
+    return Dataset(
+        ticker=bundle['ticker'],
+        path=str(path),
+        info=MappingProxyType(dict(bundle['info'])),
+        fonti=MappingProxyType(fonti),
+        tables=MappingProxyType(tables),
+    )
+
+
+def write_dataset(path, ticker, info, tables, fonti=None, fonti_tabelle=None):
+    """Scrive un bundle (scrittura atomica) a partire da dati chiave e tabelle di base."""
+    fonti_tabelle = fonti_tabelle or {}
+    bundle = {
+        'schema': SCHEMA_VERSION,
+        'ticker': ticker,
+        'info': dict(info),
+        'fonti': dict(fonti or {}),
+        'tables': {name: table_to_json(df, fonti_tabelle.get(name, ())) for name, df in tables.items()},
+    }
+    # Ogni colonna su una sola riga: il file resta leggibile e i diff per riga
+    segnaposti = {}
+    for spec in bundle['tables'].values():
+        for c, values in spec['columns'].items():
+            segnaposti[f"@@{len(segnaposti)}@@"] = json.dumps(values, ensure_ascii=False)
+            spec['columns'][c] = f"@@{len(segnaposti) - 1}@@"
+    text = json.dumps(bundle, ensure_ascii=False, indent=2)
+    for segnaposto, values in segnaposti.items():
+        text = text.replace(f'"{segnaposto}"', values, 1)
+
+    path = Path(path)
+    tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(text + "\n")
+    os.replace(tmp_path, path)
+    return path
+
+
+def dataset_path(ticker, directory=DATASET_DIR):
+    """Percorso del bundle di ``ticker``; solleva ``KeyError`` se il ticker non è nell'indice."""
+    entry = load_manifest(directory)['tickers'][ticker]
+    return Path(directory) / entry['file']
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+"""Piano del debito netto e leva finanziaria calcolati dai flussi di cassa.
+
+Dall'ultimo anno con debito netto riportato (``ANNO_BASE_DEBITO``) il debito
+netto avanza anno per anno con i flussi di cassa::
+
+    debito_t = debito_{t-1} - FCF_t + dividendi pagati_t + acquisizioni_t
+
+- i dividendi pagati nell'anno ``t`` sono il dividendo totale dell'esercizio
+  ``t - 1`` (tabella ``sustain``);
+- le acquisizioni sono gli esborsi della tabella ``acquisizioni`` del dataset
+  (ZEturf, Premier Lotteries Ireland, Kindred);
+- i rimborsi del debito lordo usano cassa e riducono il debito di pari
+  importo: non cambiano il debito netto e non compaiono nel piano.
+
+L'EBITDA proiettato è quello della tabella ``debt`` corretto per la
+differenza tra l'impatto delle tasse dello scenario e quello dell'analisi.
+
+FCF e dividendi possono avere assi iniziali qualsiasi (es. la griglia del
+cubo degli scenari): tutti gli scenari avanzano insieme con una ``cumsum``
+sull'ultimo asse.
+"""
+import numpy as np
+import pandas as pd
+
+from fdj.metriche import calcola
+from fdj.montecarlo import ALIQUOTA_IS, SimulationParams, apply_drivers
+
+ANNO_BASE_DEBITO = 2023
+# Impatto tasse incluso nelle proiezioni dell'EBITDA dell'analisi [source: 180, 181]
+TASSE_ANALISI = SimulationParams.impatto_tasse_media
+
+
+def esborsi_per_anno(df_acquisizioni, anni):
+    """Esborsi per acquisizioni (€M) sommati per anno, allineati ad ``anni``."""
+    if df_acquisizioni is None:
+        return np.zeros(len(anni))
+    esborsi = df_acquisizioni.groupby('Anno')['Esborso (€M)'].sum()
+    return esborsi.reindex(list(anni), fill_value=0).to_numpy(dtype=float)
+
+
+def piano_debito(debito_base, fcf, dividendi_pagati, acquisizioni):
+    """Debito netto di fine anno: ``debito_base`` avanzato con i flussi (ultimo asse = anni)."""
+    return debito_base + np.cumsum(dividendi_pagati + acquisizioni - fcf, axis=-1)
+
+
+def ebitda_scenario(ebitda, anni, tasse, mitigazione=None, tasse_analisi=TASSE_ANALISI):
+    """EBITDA (€M) con l'impatto tasse ``tasse`` al posto di quello dell'analisi.
+
+    ``tasse`` può essere un array (es. l'asse del cubo) compatibile per
+    broadcasting con ``ebitda``.
+    """
+    if mitigazione is None:
+        mitigazione = (SimulationParams.mitigazione_min + SimulationParams.mitigazione_max) / 2
+    delta = np.zeros(np.broadcast_shapes(np.shape(tasse), np.shape(ebitda)))
+    # apply_drivers lavora sull'utile netto: si riporta la variazione a livello di EBITDA
+    apply_drivers(delta, np.asarray(anni), np.asarray(tasse, dtype=float) - tasse_analisi, mitigazione, 0.0, 0)
+    return ebitda + delta / (1 - ALIQUOTA_IS)
+
+
+def tabella_debito(df_debt, anni, debito, ebitda):
+    """Tabella ``debt`` con gli anni storici del dataset seguiti dal piano; la leva è ricalcolata."""
+    storico = df_debt.loc[df_debt['Anno'] <= ANNO_BASE_DEBITO, ['Anno', 'Debito Netto (€M)', 'EBITDA (€M)']]
+    proiezione = pd.DataFrame({
+        'Anno': list(anni),
+        'Debito Netto (€M)': np.round(debito),
+        'EBITDA (€M)': np.round(ebitda),
+    })
+    df = pd.concat([storico, proiezione], ignore_index=True).astype(storico.dtypes.to_dict())
+    # Leva (Debt/EBITDA): metrica derivata dichiarata in fdj/metriche.py
+    return calcola({'debt': df}, modificati={'debt.Debito Netto (€M)', 'debt.EBITDA (€M)'})['debt']
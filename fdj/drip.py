@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+"""Reinvestimento dei dividendi (DRIP) e rendimento totale di una posizione.
+
+Simulazione storica (storico prezzi di ``fdj.prezzi``): per ogni seduta si
+calcola l'esito di un acquisto in chiusura quel giorno, con tutti i giorni di
+partenza e tutti gli orizzonti valutati in un'unica passata NumPy.
+
+- Ogni dividendo, al netto della ritenuta, è reinvestito alla chiusura della
+  data ex (o della prima seduta successiva): le azioni crescono del fattore
+  ``1 + dps * (1 - ritenuta) / prezzo_ex``. Il prodotto cumulato dei fattori
+  ``F_t`` dà il valore di una posizione acquistata il giorno ``s``::
+
+      V_drip(s, t)    = F_t / F_s * P_t / P_s
+      V_incasso(s, t) = (P_t + D_t - D_s) / P_s
+
+  dove ``D_t`` sono i dividendi netti cumulati per azione (strategia senza
+  reinvestimento). Chi compra in chiusura della data ex non riceve il
+  dividendo, che infatti è già incluso in ``F_s`` e ``D_s``.
+- L'orizzonte di ``h`` anni termina all'ultima seduta non successiva a
+  ``s + 365,25 h`` giorni; le partenze senza orizzonte completo sono escluse.
+
+Proiezione (``proiezione_posizione``): il DPS storico e previsto del dataset
+applicato a una posizione al prezzo di riferimento, anno per anno.
+"""
+import numpy as np
+import pandas as pd
+
+ORIZZONTI_ANNI = (1, 3, 5, 10)
+PERCENTILI = (5, 25, 50, 75, 95)
+GIORNI_ANNO = 365.25
+# Ritenuta francese sui dividendi per le persone fisiche non residenti
+RITENUTA_PREDEFINITA = 0.128
+
+STRATEGIA_DRIP = 'Reinvestimento (DRIP)'
+STRATEGIA_INCASSO = 'Incasso dividendi'
+
+
+def fattori_reinvestimento(giorni, chiusura, div_giorni, dps, ritenuta=RITENUTA_PREDEFINITA):
+    """Fattore cumulato delle azioni (DRIP) e dividendi netti cumulati per azione di ogni seduta.
+
+    ``giorni`` e ``div_giorni`` devono essere ordinati; gli stacchi successivi
+    all'ultima seduta (dividendi annunciati) sono ignorati.
+    """
+    seduta = np.searchsorted(giorni, div_giorni, side='left')
+    validi = seduta < len(giorni)
+    seduta = seduta[validi]
+    netto = dps[validi] * (1 - ritenuta)
+
+    log_fattore = np.zeros(len(giorni))
+    np.add.at(log_fattore, seduta, np.log1p(netto / chiusura[seduta]))
+    incassati = np.zeros(len(giorni))
+    np.add.at(incassati, seduta, netto)
+    return np.exp(np.cumsum(log_fattore)), np.cumsum(incassati)
+
+
+def rendimenti_totali(giorni, chiusura, div_giorni, dps, ritenuta=RITENUTA_PREDEFINITA, orizzonti=ORIZZONTI_ANNI):
+    """Valore finale per € investito, per orizzonte e giorno di partenza.
+
+    Restituisce ``(drip, incasso)``, matrici ``(orizzonti, sedute)`` con NaN
+    dove l'orizzonte va oltre l'ultima seduta disponibile.
+    """
+    fattore, incassati = fattori_reinvestimento(giorni, chiusura, div_giorni, dps, ritenuta)
+    anni = np.asarray(orizzonti, dtype=float)[:, None]
+    obiettivo = giorni[None, :] + anni * GIORNI_ANNO
+    fine = np.searchsorted(giorni, obiettivo, side='right') - 1
+    completo = obiettivo <= giorni[-1]
+    fine = np.where(completo, fine, 0)
+
+    drip = fattore[fine] / fattore * chiusura[fine] / chiusura
+    incasso = (chiusura[fine] + incassati[fine] - incassati) / chiusura
+    drip[~completo] = np.nan
+    incasso[~completo] = np.nan
+    return drip, incasso
+
+
+def annualizza(valore, anni):
+    """Rendimento annuo composto (%) di un valore finale per € investito."""
+    return (valore ** (1 / np.asarray(anni, dtype=float)[:, None]) - 1) * 100
+
+
+def distribuzione(giorni, chiusura, div_giorni, dps, ritenuta=RITENUTA_PREDEFINITA,
+                  orizzonti=ORIZZONTI_ANNI, percentili=PERCENTILI):
+    """Percentili del rendimento annuo (%) per orizzonte e strategia, su tutte le partenze storiche."""
+    drip, incasso = rendimenti_totali(giorni, chiusura, div_giorni, dps, ritenuta, orizzonti)
+    righe = []
+    for strategia, valori in ((STRATEGIA_DRIP, drip), (STRATEGIA_INCASSO, incasso)):
+        annui = annualizza(valori, orizzonti)
+        n = np.sum(~np.isnan(annui), axis=1)
+        # Orizzonti senza partenze complete: righe NaN (nessun avviso di NumPy)
+        q = np.full((len(orizzonti), len(percentili)), np.nan)
+        if n.any():
+            q[n > 0] = np.nanpercentile(annui[n > 0], percentili, axis=1).T
+        positivi = np.where(n > 0, np.sum(annui > 0, axis=1) / np.maximum(n, 1) * 100, np.nan)
+        for j, h in enumerate(orizzonti):
+            righe.append({
+                'Orizzonte (anni)': h,
+                'Strategia': strategia,
+                'Partenze': int(n[j]),
+                **{f'P{p} (%)': q[j, k] for k, p in enumerate(percentili)},
+                'Esiti Positivi (%)': positivi[j],
+            })
+    return pd.DataFrame(righe)
+
+
+def istogramma(giorni, chiusura, div_giorni, dps, anni, ritenuta=RITENUTA_PREDEFINITA, n_classi=40):
+    """Frequenze (%) del rendimento annuo per le due strategie sull'orizzonte ``anni``.
+
+    Restituisce poche righe (centro della classe, strategia, quota delle
+    partenze) invece dei singoli esiti, così il grafico resta leggero.
+    """
+    drip, incasso = rendimenti_totali(giorni, chiusura, div_giorni, dps, ritenuta, (anni,))
+    annui = {s: annualizza(v, (anni,))[0] for s, v in ((STRATEGIA_DRIP, drip), (STRATEGIA_INCASSO, incasso))}
+    annui = {s: v[~np.isnan(v)] for s, v in annui.items()}
+    tutti = np.concatenate(list(annui.values()))
+    if not len(tutti):
+        return None
+    bordi = np.histogram_bin_edges(tutti, bins=n_classi)
+    centri = (bordi[:-1] + bordi[1:]) / 2
+    return pd.DataFrame({
+        'Rendimento Annuo (%)': np.tile(centri, len(annui)),
+        'Strategia': np.repeat(list(annui), len(centri)),
+        'Partenze (%)': np.concatenate([np.histogram(v, bordi)[0] / len(v) * 100 for v in annui.values()]),
+    })
+
+
+def proiezione_posizione(anni, dps, prezzo, investimento, ritenuta=RITENUTA_PREDEFINITA):
+    """Reddito e azioni di una posizione a prezzo costante, anno per anno.
+
+    Ogni dividendo netto è reinvestito al ``prezzo`` indicato: la tabella
+    mostra cosa significano le serie del DPS (storiche e previste) per una
+    posizione di ``investimento`` €.
+    """
+    anni = np.asarray(anni)
+    netto = np.asarray(dps, dtype=float) * (1 - ritenuta)
+    crescita = np.cumprod(1 + netto / prezzo)
+    azioni_iniziali = investimento / prezzo
+    azioni_drip = azioni_iniziali * np.concatenate([[1.0], crescita[:-1]])
+    return pd.DataFrame({
+        'Anno': anni,
+        'DPS Netto (€)': netto,
+        'Reddito senza DRIP (€)': azioni_iniziali * netto,
+        'Reddito con DRIP (€)': azioni_drip * netto,
+        'Azioni con DRIP': azioni_iniziali * crescita,
+        'Valore con DRIP (€)': azioni_iniziali * crescita * prezzo,
+    })
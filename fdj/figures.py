@@ -0,0 +1,682 @@
+# -*- coding: utf-8 -*-
+"""Costruzione dei grafici Plotly con cache indirizzata per contenuto.
+
+Ogni grafico è prodotto da una funzione registrata con ``@_builder``. La chiave
+di cache è l'hash del DataFrame di input, dei parametri del grafico, del
+bytecode della funzione e della versione di Plotly: se cambia uno qualsiasi di
+questi elementi la figura viene ricostruita. Le figure vengono conservate in
+memoria (LRU) e serializzate come JSON in una cartella locale, così un
+processo appena avviato le serve senza richiamare Plotly Express. Anche
+l'import di Plotly Express e dei costruttori delle figure è rinviato alla
+prima figura da costruire: con la cache su disco non avviene affatto.
+
+Le figure restituite sono spec JSON (dict) condivise tra le sessioni: vanno
+passate a ``st.plotly_chart`` senza modificarle.
+"""
+import hashlib
+import json
+import logging
+import marshal
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+import plotly
+import streamlit as st
+
+from fdj import profilo
+from fdj.data import CACHE_DIR, hash_frame
+
+logger = logging.getLogger(__name__)
+
+# Cartella predefinita per le figure serializzate
+DEFAULT_CACHE_DIR = CACHE_DIR / "figures"
+
+BUILDERS = {}
+
+# Moduli di Plotly usati dalle funzioni di costruzione, importati da _importa_plotly
+px = go = make_subplots = None
+
+
+def _importa_plotly():
+    # Import differito: Plotly Express da solo costa decine di ms all'avvio del processo
+    # (px per ultimo: è il segnale che anche gli altri nomi sono pronti per gli altri thread)
+    global px, go, make_subplots
+    if px is None:
+        import plotly.graph_objects as go
+        from plotly.subplots import make_subplots
+        import plotly.express as px
+
+
+def _builder(name):
+    # Registra una funzione di costruzione grafico sotto il nome indicato
+    def decorator(fn):
+        BUILDERS[name] = fn
+        return fn
+    return decorator
+
+
+def _builder_fingerprint(fn):
+    # Il bytecode (costanti incluse) cambia quando cambia il codice del grafico
+    return hashlib.sha256(marshal.dumps(fn.__code__)).hexdigest()
+
+
+def figure_key(name, df, params=None):
+    """Chiave di cache per il grafico ``name`` costruito su ``df`` con ``params``."""
+    h = hashlib.sha256()
+    h.update(name.encode("utf-8"))
+    h.update(_builder_fingerprint(BUILDERS[name]).encode("ascii"))
+    h.update(plotly.__version__.encode("ascii"))
+    h.update(hash_frame(df).encode("ascii"))
+    h.update(json.dumps(params or {}, sort_keys=True, default=str).encode("utf-8"))
+    return h.hexdigest()
+
+
+class FigureCache:
+    """Cache delle figure: LRU in memoria con persistenza JSON su disco."""
+
+    def __init__(self, max_entries=64, cache_dir=DEFAULT_CACHE_DIR):
+        self.max_entries = max_entries
+        self.cache_dir = Path(cache_dir) if cache_dir is not None else None
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def get(self, name, df, **params):
+        """Restituisce la spec JSON del grafico, costruendola solo se necessario."""
+        key = figure_key(name, df, params)
+        with self._lock:
+            spec = self._entries.get(key)
+            if spec is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return spec
+
+        spec = self._read(key)
+        if spec is not None:
+            self.disk_hits += 1
+        else:
+            self.misses += 1
+            _importa_plotly()
+            fig = BUILDERS[name](df, **params)
+            payload = fig.to_json()
+            spec = json.loads(payload)
+            self._write(key, payload)
+
+        with self._lock:
+            self._entries[key] = spec
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return spec
+
+    def clear(self, disk=False):
+        """Svuota la cache in memoria e, se richiesto, quella su disco."""
+        with self._lock:
+            self._entries.clear()
+        if disk and self.cache_dir is not None and self.cache_dir.is_dir():
+            for path in self.cache_dir.glob("*.json"):
+                path.unlink(missing_ok=True)
+
+    def _read(self, key):
+        if self.cache_dir is None:
+            return None
+        try:
+            with open(self.cache_dir / f"{key}.json", "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning("Figura in cache illeggibile (%s): %s", key, e)
+            return None
+
+    def _write(self, key, payload):
+        if self.cache_dir is None:
+            return
+        # Scrittura atomica: un processo concorrente non legge mai un file parziale
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.cache_dir / f"{key}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(payload)
+            os.replace(tmp_path, self.cache_dir / f"{key}.json")
+        except OSError as e:
+            logger.warning("Impossibile salvare la figura in cache (%s): %s", key, e)
+
+
+@st.cache_resource(show_spinner=False)
+def get_figure_cache():
+    """Cache delle figure condivisa da tutte le sessioni del processo."""
+    return FigureCache()
+
+
+def get_figure(name, df, **params):
+    """Spec Plotly del grafico ``name`` per ``df``, servita dalla cache condivisa."""
+    with profilo.sezione(f"grafico {name}"):
+        return get_figure_cache().get(name, df, **params)
+
+
+# --- Grafici della dashboard ---
+
+
+@_builder('dps')
+def _build_dps(df, societa):
+    fig = px.line(
+        df,
+        x='Anno Esercizio',
+        y='DPS (€)',
+        title=f"Andamento DPS {societa} (Esercizi {df['Anno Esercizio'].min()}-{df['Anno Esercizio'].max()})",
+        markers=True,
+        text='DPS (€)'  # Mostra i valori sul grafico
+    )
+    fig.update_traces(textposition="top center", line=dict(width=3, color='#1f77b4'))
+    fig.update_layout(xaxis_title="Anno Esercizio Fiscale", yaxis_title="Dividendo per Azione (€)",
+                      hovermode="x unified", height=400)
+    return fig
+
+
+@_builder('payout')
+def _build_payout(df, societa):
+    fig = px.bar(
+        df,
+        x='Anno',
+        y='Payout Ratio (%)',
+        text='Payout Ratio (%)',
+        color='Payout Ratio (%)',
+        color_continuous_scale='Blues',
+        title=f"Payout Ratio {societa} (% Utile Netto Distribuito)",
+        hover_data=['Note']
+    )
+    fig.update_layout(coloraxis_showscale=False)
+    fig.update_traces(texttemplate='%{text}%', textposition='inside')
+    fig.update_layout(yaxis_range=[0, 100], height=400)
+    return fig
+
+
+@_builder('forecast')
+def _build_forecast(df, societa):
+    fig = px.line(
+        df,
+        x='Anno',
+        y='DPS (€)',
+        color='Tipo',
+        title=f"Proiezione Dividendi {societa} {df['Anno'].min()}-{df['Anno'].max()}",
+        markers=True,
+        text='DPS (€)',
+        hover_data=['Note']
+    )
+    fig.update_traces(textposition="top right")
+
+    # Aggiungiamo l'annotazione per l'impatto Kindred
+    dps_per_anno = df.set_index('Anno')['DPS (€)']
+    fig.add_annotation(
+        x=2026, y=dps_per_anno[2026],
+        text="Effetto Kindred",
+        showarrow=True,
+        arrowhead=1,
+        ax=-40, ay=-40
+    )
+
+    # Aggiungiamo l'annotazione per le nuove tasse
+    fig.add_annotation(
+        x=2025, y=dps_per_anno[2025],
+        text="Impatto nuove tasse 2025",
+        showarrow=True,
+        arrowhead=1,
+        ax=40, ay=40
+    )
+
+    fig.update_layout(height=450)
+    return fig
+
+
+@_builder('cagr')
+def _build_cagr(df, societa):
+    fig = px.bar(
+        df,
+        y='Periodo',
+        x='CAGR (%)',
+        text='CAGR (%)',
+        color='CAGR (%)',
+        color_continuous_scale='Greens',
+        orientation='h',
+        title=f"Tasso di Crescita Composto (CAGR) Dividendo {societa}",
+        hover_data=['Descrizione']
+    )
+    fig.update_traces(texttemplate='%{x:.1f}%', textposition='outside')
+    fig.update_layout(coloraxis_showscale=False, height=450)
+    return fig
+
+
+@_builder('mix')
+def _build_mix(df, societa):
+    fig = px.pie(
+        df,
+        values='Percentuale (%)',
+        names='Segmento',
+        title=f"Mix di Business {societa} (% Ricavi)",
+        hole=0.4,
+        color_discrete_sequence=px.colors.qualitative.Set2
+    )
+    fig.update_traces(textposition='inside', textinfo='percent+label')
+    fig.update_layout(height=450)
+    return fig
+
+
+@_builder('margin')
+def _build_margin(df):
+    fig = px.bar(
+        df,
+        x='Segmento',
+        y='Margine Op. (%)',
+        text='Margine Op. (%)',
+        color='Segmento',
+        title="Margini Operativi Stimati per Segmento",
+        color_discrete_sequence=px.colors.qualitative.Set2
+    )
+    fig.update_traces(texttemplate='%{text}%', textposition='outside')
+    fig.update_layout(height=450)
+    return fig
+
+
+@_builder('timeline')
+def _build_timeline(df, societa):
+    fig = px.scatter(
+        df,
+        x='Anno',
+        y='Tipo',
+        color='Tipo',
+        size=[15]*len(df),
+        text='Evento',
+        hover_data=['Descrizione'],
+        title=f"Timeline Strategica di {societa} ({df['Anno'].min()}-{df['Anno'].max()})"
+    )
+
+    # Aggiungere connettori tra i punti
+    fig.update_traces(marker=dict(symbol='diamond', opacity=0.8), selector=dict(mode='markers'))
+    fig.add_shape(type="line", x0="2019", y0="Milestone", x1="2027", y1="Strategia",
+                  line=dict(color="lightgrey", width=1, dash="dot"))
+
+    # Formattare il layout
+    fig.update_layout(
+        height=300,
+        xaxis=dict(showgrid=False),
+        yaxis=dict(showgrid=False)
+    )
+    return fig
+
+
+@_builder('yield')
+def _build_yield(df, evidenzia=None, mediana=None):
+    # evidenzia: società da mettere in risalto; mediana: linea di riferimento (predefinita: media delle barre)
+    fig = px.bar(
+        df,
+        x='Società',
+        y='Dividend Yield (%)',
+        text='Dividend Yield (%)',
+        color='Tipo',
+        title="Confronto Dividend Yield vs. Competitors",
+        hover_data=['Tipo']
+    )
+    fig.update_traces(texttemplate='%{text:.1f}%', textposition='outside')
+    fig.update_layout(height=450)
+    if evidenzia is not None:
+        for trace in fig.data:
+            trace.marker.line = dict(color='black', width=[3 if x == evidenzia else 0 for x in trace.x])
+
+    # Aggiungere linea per la media (o per la mediana dei peer indicata)
+    riferimento = df['Dividend Yield (%)'].mean() if mediana is None else mediana
+    fig.add_shape(
+        type='line',
+        x0=-0.5,
+        y0=riferimento,
+        x1=len(df)-0.5,
+        y1=riferimento,
+        line=dict(color='red', width=2, dash='dash')
+    )
+
+    fig.add_annotation(
+        x=len(df)-1,
+        y=riferimento,
+        text=f"{'Media' if mediana is None else 'Mediana peer'}: {riferimento:.1f}%",
+        showarrow=False,
+        yshift=10
+    )
+    return fig
+
+
+@_builder('multiples')
+def _build_multiples(df, evidenzia=None):
+    fig = make_subplots(specs=[[{"secondary_y": True}]])
+
+    fig.add_trace(
+        go.Bar(
+            x=df['Società'],
+            y=df['EV/EBITDA'],
+            name='EV/EBITDA',
+            marker_color=['darkorange' if s == evidenzia else 'royalblue' for s in df['Società']],
+            text=df['EV/EBITDA'],
+            textposition='outside'
+        ),
+        secondary_y=False
+    )
+
+    fig.add_trace(
+        go.Scatter(
+            x=df['Società'],
+            y=df['P/E'],
+            name='P/E',
+            mode='markers+lines+text',
+            marker=dict(size=12, color='firebrick'),
+            line=dict(width=2, dash='dot'),
+            text=df['P/E'],
+            textposition='top center'
+        ),
+        secondary_y=True
+    )
+
+    fig.update_layout(
+        title='Confronto Multipli Valutativi',
+        legend=dict(orientation='h', yanchor='bottom', y=1.02, xanchor='center', x=0.5),
+        height=450
+    )
+
+    fig.update_yaxes(title_text="EV/EBITDA", secondary_y=False)
+    fig.update_yaxes(title_text="P/E", secondary_y=True)
+    return fig
+
+
+@_builder('radar')
+def _build_radar(df):
+    fig = px.line_polar(
+        df,
+        r='Punteggio',
+        theta='Dimensione',
+        color='Società',
+        line_close=True,
+        range_r=[0, 10],
+        title="Analisi Competitiva Radar (Scala 1-10)"
+    )
+    fig.update_traces(fill='toself', opacity=0.4)
+
+    # Layout
+    fig.update_layout(
+        polar=dict(radialaxis=dict(visible=True, range=[0, 10])),
+        height=500
+    )
+    return fig
+
+
+@_builder('heatmap')
+def _build_heatmap(df):
+    fig = px.imshow(
+        df[['Livello (1-10)', 'Impatto_Num']].T,
+        x=df['Categoria'],
+        y=['Probabilità', 'Impatto Dividendo'],
+        color_continuous_scale='Reds',
+        labels=dict(color="Intensità"),
+        title="Mappa di Calore dei Rischi per il Dividendo",
+        text_auto=True
+    )
+
+    fig.update_layout(height=450)
+    return fig
+
+
+@_builder('debt')
+def _build_debt(df, tasse=90):
+    # tasse: impatto annuo (€M EBITDA) dello scenario, riportato nell'annotazione
+    fig = make_subplots(specs=[[{"secondary_y": True}]])
+
+    # Aggiungiamo barre per il debito netto
+    fig.add_trace(
+        go.Bar(
+            x=df['Anno'],
+            y=df['Debito Netto (€M)'],
+            name='Debito Netto (€M)',
+            marker_color=['green' if x < 0 else 'orangered' for x in df['Debito Netto (€M)']],
+            text=[f"Cassa: {-x}M" if x < 0 else f"Debito: {x}M" for x in df['Debito Netto (€M)']],
+            textposition='outside'
+        ),
+        secondary_y=False
+    )
+
+    # Aggiungiamo linea per la leva
+    fig.add_trace(
+        go.Scatter(
+            x=df['Anno'],
+            y=df['Leva (Debt/EBITDA)'],
+            name='Leva (Debt/EBITDA)',
+            mode='lines+markers+text',
+            marker=dict(size=10),
+            line=dict(width=3, color='navy'),
+            text=df['Leva (Debt/EBITDA)'],
+            textposition='top center'
+        ),
+        secondary_y=True
+    )
+
+    # Aggiungiamo linea EBITDA
+    fig.add_trace(
+        go.Scatter(
+            x=df['Anno'],
+            y=df['EBITDA (€M)'],
+            name='EBITDA (€M)',
+            mode='lines+markers',
+            marker=dict(size=8),
+            line=dict(width=2, color='green', dash='dash')
+        ),
+        secondary_y=False
+    )
+
+    # Evidenziamo l'effetto Kindred (sopra il debito netto dell'anno dell'acquisizione)
+    anni = df.set_index('Anno')
+    fig.add_annotation(
+        x=2024.5,
+        y=anni['Debito Netto (€M)'].get(2025, 1500) * 0.8,
+        text="Acquisizione<br>Kindred",
+        showarrow=True,
+        arrowhead=1,
+        ax=0,
+        ay=-40
+    )
+
+    # Evidenziamo l'effetto tasse
+    fig.add_annotation(
+        x=2025,
+        y=anni['EBITDA (€M)'].get(2025, 850),
+        text=f"Impatto<br>Tasse<br>-€{tasse:.0f}M",
+        showarrow=True,
+        arrowhead=1,
+        ax=0,
+        ay=-70
+    )
+
+    # Layout
+    fig.update_layout(
+        title="Evoluzione Debito Netto, EBITDA e Leva Finanziaria (2021-2027E)",
+        legend=dict(orientation='h', yanchor='bottom', y=1.02, xanchor='center', x=0.5),
+        height=450
+    )
+
+    fig.update_yaxes(title_text="€ Milioni", secondary_y=False)
+    fig.update_yaxes(title_text="Leva (Debt/EBITDA)", secondary_y=True, range=[0, 3])
+    return fig
+
+
+@_builder('sustainability')
+def _build_sustainability(df):
+    fig = make_subplots(specs=[[{"secondary_y": True}]])
+
+    # Barre FCF e Dividendo
+    fig.add_trace(
+        go.Bar(
+            x=df['Anno'],
+            y=df['FCF (€M)'],
+            name='Free Cash Flow (€M)',
+            marker_color='lightblue',
+            opacity=0.7
+        ),
+        secondary_y=False
+    )
+
+    fig.add_trace(
+        go.Bar(
+            x=df['Anno'],
+            y=df['Dividendo Totale (€M)'],
+            name='Dividendo Totale (€M)',
+            marker_color='darkblue'
+        ),
+        secondary_y=False
+    )
+
+    # Linea Payout Ratio
+    fig.add_trace(
+        go.Scatter(
+            x=df['Anno'],
+            y=df['Payout Ratio (%)'],
+            name='Payout Ratio (%)',
+            mode='lines+markers+text',
+            marker=dict(size=8, color='red'),
+            line=dict(width=2, color='red'),
+            text=df['Payout Ratio (%)'],
+            textposition='top center'
+        ),
+        secondary_y=True
+    )
+
+    # Layout
+    fig.update_layout(
+        title="Analisi Sostenibilità Dividendo: FCF vs Dividendo Totale",
+        barmode='overlay',
+        legend=dict(orientation='h', yanchor='bottom', y=1.02, xanchor='center', x=0.5),
+        height=450
+    )
+
+    fig.update_yaxes(title_text="€ Milioni", secondary_y=False)
+    fig.update_yaxes(title_text="Payout Ratio (%)", secondary_y=True, range=[0, 100])
+    return fig
+
+
+@_builder('dps_fan')
+def _build_dps_fan(df, societa):
+    # df: percentili del DPS simulato per anno (colonne P5, P25, P50, P75, P95, Media)
+    fig = go.Figure()
+
+    # Banda esterna P5-P95 e banda interna P25-P75
+    for low, high, color, name in [('P5', 'P95', 'rgba(31, 119, 180, 0.15)', 'Intervallo 5-95%'),
+                                   ('P25', 'P75', 'rgba(31, 119, 180, 0.35)', 'Intervallo 25-75%')]:
+        fig.add_trace(go.Scatter(x=df['Anno'], y=df[high], mode='lines', line=dict(width=0),
+                                 showlegend=False, hoverinfo='skip'))
+        fig.add_trace(go.Scatter(x=df['Anno'], y=df[low], mode='lines', line=dict(width=0),
+                                 fill='tonexty', fillcolor=color, name=name,
+                                 customdata=df[high], hovertemplate='%{y:.2f} - %{customdata:.2f} €'))
+
+    fig.add_trace(go.Scatter(
+        x=df['Anno'],
+        y=df['P50'],
+        name='Mediana',
+        mode='lines+markers+text',
+        line=dict(width=3, color='#1f77b4'),
+        text=[f"{v:.2f}" for v in df['P50']],
+        textposition='top center'
+    ))
+    fig.add_trace(go.Scatter(
+        x=df['Anno'],
+        y=df['Media'],
+        name='Media',
+        mode='lines',
+        line=dict(width=1, color='navy', dash='dot')
+    ))
+
+    fig.update_layout(
+        title=f"Distribuzione Simulata del DPS {societa} (Monte Carlo)",
+        xaxis=dict(title="Anno", dtick=1),
+        yaxis_title="Dividendo per Azione (€)",
+        legend=dict(orientation='h', yanchor='bottom', y=1.02, xanchor='center', x=0.5),
+        hovermode="x unified",
+        height=450
+    )
+    return fig
+
+
+@_builder('yield_history')
+def _build_yield_history(df):
+    # df: serie settimanale (Data, Chiusura, Yield Trailing (%), Yield Forward (%)) da fdj/prezzi.py
+    fig = make_subplots(specs=[[{"secondary_y": True}]])
+    for column, color, dash in [('Yield Trailing (%)', '#1f77b4', None), ('Yield Forward (%)', 'seagreen', 'dot')]:
+        fig.add_trace(go.Scatter(x=df['Data'], y=df[column], name=column.replace(' (%)', ''), mode='lines',
+                                 line=dict(width=2, color=color, dash=dash),
+                                 hovertemplate='%{y:.2f}%'), secondary_y=False)
+    fig.add_trace(go.Scatter(x=df['Data'], y=df['Chiusura'], name='Prezzo', mode='lines',
+                             line=dict(width=1, color='lightgray'), hovertemplate='€ %{y:.2f}'),
+                  secondary_y=True)
+    fig.update_layout(
+        title="Dividend Yield Trailing e Forward (12 mesi)",
+        legend=dict(orientation='h', yanchor='bottom', y=1.02, xanchor='center', x=0.5),
+        hovermode="x unified",
+        height=400
+    )
+    fig.update_yaxes(title_text="Dividend Yield (%)", secondary_y=False)
+    fig.update_yaxes(title_text="Prezzo (€)", secondary_y=True, showgrid=False)
+    return fig
+
+
+@_builder('drip')
+def _build_drip(df, anni):
+    # df: frequenze per classe di rendimento annuo (vedi fdj/drip.py, istogramma)
+    fig = px.bar(
+        df,
+        x='Rendimento Annuo (%)',
+        y='Partenze (%)',
+        color='Strategia',
+        barmode='overlay',
+        opacity=0.6,
+        title=f"Rendimento Totale Annuo su {anni} {'anno' if anni == 1 else 'anni'} per Data di Acquisto",
+        color_discrete_sequence=['#1f77b4', 'darkorange']
+    )
+    fig.add_vline(x=0, line=dict(color='gray', width=1, dash='dash'))
+    fig.update_layout(bargap=0, xaxis_title="Rendimento annuo composto (%)", yaxis_title="Quota delle date di acquisto (%)",
+                      legend=dict(orientation='h', yanchor='bottom', y=1.02, xanchor='center', x=0.5), height=400)
+    return fig
+
+
+@_builder('calendario')
+def _build_calendario(df):
+    # df: reddito del portafoglio per anno e mese di stacco (vedi fdj/portafoglio.py)
+    df = df.assign(Anno=df['Anno'].astype(str))
+    fig = px.bar(
+        df,
+        x='Mese',
+        y='Reddito (€)',
+        color='Anno',
+        barmode='group',
+        title="Calendario del Reddito da Dividendi (per mese di stacco)",
+        category_orders={'Mese': list(df['Mese'].cat.categories)} if hasattr(df['Mese'], 'cat') else None
+    )
+    fig.update_traces(hovertemplate='%{x} %{fullData.name}: € %{y:,.0f}<extra></extra>')
+    fig.update_layout(xaxis_title="Mese di stacco", yaxis_title="Reddito lordo (€)", height=400)
+    return fig
+
+
+@_builder('stress_heatmap')
+def _build_stress_heatmap(df):
+    # df: probabilità di violazione (%) con righe e colonne = livelli di due shock (vedi fdj/stress.py)
+    fig = px.imshow(
+        df,
+        x=[f"{v:g}" for v in df.columns],
+        y=[f"{v:g}" for v in df.index],
+        color_continuous_scale='Reds',
+        zmin=0,
+        zmax=100,
+        aspect='auto',
+        origin='lower',
+        labels=dict(x=df.columns.name, y=df.index.name, color="Probabilità violazione (%)"),
+        title="Probabilità di Violazione (Copertura < 1x o Leva > 2,5x)",
+        text_auto='.0f'
+    )
+    fig.update_layout(height=450)
+    return fig
@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+"""Metriche derivate dichiarative con tracciamento delle dipendenze.
+
+Ogni metrica derivata è dichiarata una sola volta con ``@metrica``: tabella e
+colonna prodotte, riferimenti ``"tabella.colonna"`` da cui dipende e una
+funzione vettorizzata che riceve gli input come array NumPy (tutti gli anni in
+un'unica chiamata). I riferimenti ``"parametri.<nome>"`` indicano valori
+scalari, es. il prezzo di riferimento.
+
+Per le tabelle con una riga per metrica (``fin``: una colonna per periodo) il
+riferimento indica la riga e l'array contiene i valori dei periodi.
+
+``calcola`` valuta le metriche in ordine topologico; indicando gli input
+modificati vengono ricalcolate solo le metriche che ne dipendono, direttamente
+o indirettamente, e solo le tabelle interessate vengono copiate. I grafici
+seguono automaticamente: la cache delle figure (``fdj.figures``) è indicizzata
+dal contenuto del DataFrame, quindi si ricostruiscono solo quelli alimentati da
+una tabella cambiata.
+"""
+from collections import ChainMap
+from dataclasses import dataclass
+from functools import lru_cache
+from graphlib import TopologicalSorter
+
+import numpy as np
+
+PARAMETRI = 'parametri'
+
+# Tabelle con una riga per metrica: nome della colonna con le etichette delle righe
+TABELLE_PER_RIGA = {'fin': 'Metrica'}
+
+
+@dataclass(frozen=True)
+class Metrica:
+    tabella: str
+    colonna: str
+    dipendenze: tuple
+    calcolo: object
+
+    @property
+    def chiave(self):
+        return f"{self.tabella}.{self.colonna}"
+
+
+# Registro delle metriche derivate, nell'ordine di dichiarazione
+METRICHE = {}
+
+
+def metrica(tabella, colonna, *dipendenze):
+    """Registra la funzione decorata come calcolo di ``tabella.colonna``."""
+    def register(fn):
+        m = Metrica(tabella, colonna, dipendenze, fn)
+        METRICHE[m.chiave] = m
+        _ordine.cache_clear()
+        return fn
+    return register
+
+
+@lru_cache(maxsize=None)
+def _ordine():
+    grafo = {chiave: [d for d in m.dipendenze if d in METRICHE] for chiave, m in METRICHE.items()}
+    return tuple(METRICHE[chiave] for chiave in TopologicalSorter(grafo).static_order())
+
+
+def dipendenti(modificati):
+    """Metriche da ricalcolare (in ordine di valutazione) quando cambiano ``modificati``."""
+    coinvolti = set(modificati)
+    risultato = []
+    for m in _ordine():
+        if coinvolti.intersection(m.dipendenze):
+            coinvolti.add(m.chiave)
+            risultato.append(m)
+    return tuple(risultato)
+
+
+def _periodi(df, etichette):
+    return [c for c in df.select_dtypes('number').columns if c != etichette]
+
+
+def _leggi(tables, parametri, riferimento):
+    tabella, colonna = riferimento.split('.', 1)
+    if tabella == PARAMETRI:
+        return parametri[colonna]
+    df = tables[tabella]
+    etichette = TABELLE_PER_RIGA.get(tabella)
+    if etichette is None:
+        return df[colonna].to_numpy(dtype=float)
+    riga = df.loc[df[etichette] == colonna, _periodi(df, etichette)]
+    if riga.empty:
+        raise KeyError(riferimento)
+    return riga.to_numpy(dtype=float)[0]
+
+
+def _scrivi(df, m, valori):
+    etichette = TABELLE_PER_RIGA.get(m.tabella)
+    if etichette is None:
+        df[m.colonna] = valori
+        return
+    # Le righe derivate devono essere già presenti (con etichetta e note) nella tabella
+    riga = df[etichette] == m.colonna
+    if not riga.any():
+        raise KeyError(m.chiave)
+    df.loc[riga, _periodi(df, etichette)] = np.asarray(valori, dtype=float)
+
+
+def calcola(tables, parametri=None, modificati=None):
+    """Valuta le metriche derivate e restituisce un nuovo mapping di tabelle.
+
+    Senza ``modificati`` vengono calcolate tutte le metriche; altrimenti solo
+    quelle che dipendono dai riferimenti indicati. Il risultato è un
+    ``ChainMap`` con le tabelle ricalcolate davanti a ``tables``: quelle non
+    interessate sono lette da ``tables`` solo quando servono, senza copie.
+    """
+    parametri = dict(parametri or {})
+    da_calcolare = _ordine() if modificati is None else dipendenti(modificati)
+    tables = ChainMap({}, tables)
+    copiate = set()
+    for m in da_calcolare:
+        valori = m.calcolo(*(_leggi(tables, parametri, d) for d in m.dipendenze))
+        if m.tabella not in copiate:
+            tables[m.tabella] = tables[m.tabella].copy()
+            copiate.add(m.tabella)
+        _scrivi(tables[m.tabella], m, valori)
+    return tables
+
+
+# --- Metriche derivate della dashboard ---
+
+@metrica('fin', 'Free Cash Flow (FCF, €M)',
+         'fin.Cash Flow Operativo (CFO, €M)', 'fin.Capex (€M)')
+def _fcf(cfo, capex):
+    # Il Capex è riportato come outflow (negativo)
+    return cfo + capex
+
+
+@metrica('fin', 'Payout Ratio (DPS/EPS, %)',
+         'fin.Dividendo per Azione (DPS, €)', 'fin.EPS Diluito (€)')
+def _payout(dps, eps):
+    return dps / eps * 100
+
+
+@metrica('fin', 'Dividend Yield al Prezzo di Rif. (%)',
+         'fin.Dividendo per Azione (DPS, €)', 'parametri.prezzo')
+def _dividend_yield(dps, prezzo):
+    return dps / prezzo * 100
+
+
+@metrica('sustain', 'FCF post-Dividendo (€M)', 'sustain.FCF (€M)', 'sustain.Dividendo Totale (€M)')
+def _fcf_post_dividendo(fcf, dividendo):
+    return fcf - dividendo
+
+
+@metrica('sustain', 'FCF/Dividendo (x)', 'sustain.FCF (€M)', 'sustain.Dividendo Totale (€M)')
+def _copertura(fcf, dividendo):
+    return fcf / dividendo
+
+
+@metrica('debt', 'Leva (Debt/EBITDA)', 'debt.Debito Netto (€M)', 'debt.EBITDA (€M)')
+def _leva(debito_netto, ebitda):
+    # 0 = cassa netta
+    return np.round(np.maximum(debito_netto / ebitda, 0), 1)
+
+
+@metrica('cagr', 'CAGR (%)',
+         'dps.Anno Esercizio', 'dps.DPS (€)', 'forecast.Anno', 'forecast.DPS (€)', 'cagr.Da', 'cagr.A')
+def _cagr(anni_storici, dps_storici, anni_previsti, dps_previsti, da, a):
+    # Serie unica del DPS per anno; per gli anni in comune prevalgono le previsioni
+    anni = np.concatenate([anni_previsti, anni_storici])
+    dps = np.concatenate([dps_previsti, dps_storici])
+    anni, primo = np.unique(anni, return_index=True)
+    dps = dps[primo]
+    inizio = dps[np.searchsorted(anni, da)]
+    fine = dps[np.searchsorted(anni, a)]
+    return ((fine / inizio) ** (1 / (a - da)) - 1) * 100
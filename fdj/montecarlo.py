@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+"""Simulazione Monte Carlo vettorizzata del dividendo per azione (DPS).
+
+Tutti i percorsi vengono simulati in un'unica passata NumPy: ogni variabile
+aleatoria è una matrice ``(anni, percorsi)`` e il DPS si ottiene con
+operazioni elemento per elemento, senza cicli Python sui percorsi. La
+disposizione per anno mantiene contigua la memoria di ogni riga.
+
+Modello (in € milioni, per anno di proiezione t):
+
+    utile_t   = utile_base * prod(1 + crescita) - tasse_nette_t
+    utile_t  *= 1 + uplift_kindred          (dal 2026)
+    DPS_t     = utile_t * payout_t / azioni
+
+- ``utile_base`` è l'utile di riferimento per il dividendo, calibrato in modo
+  che al payout medio della politica (85%) restituisca il DPS 2024 atteso.
+  La calibrazione non dipende dal payout dello scenario: un payout più alto
+  produce un DPS più alto.
+- ``payout_t`` è estratto uniformemente nell'intervallo della politica
+  dichiarata (80-90% dell'utile netto).
+- ``tasse_nette_t`` è l'impatto EBITDA delle nuove tasse (metà nel 2025, pieno
+  dal 2026) al netto dell'imposta societaria, ridotto linearmente fino alla
+  quota di mitigazione raggiunta nel 2027.
+"""
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from fdj.data import DPS_ATTESO_2024_VAL
+
+PERCENTILI = (5, 25, 50, 75, 95)
+ANNI_PROIEZIONE = (2025, 2026, 2027)
+ANNO_BASE = 2024
+
+# Azioni in circolazione (M): Dividendo Totale 2023 (€340M) / DPS 2023 (€1,78)
+AZIONI_IN_CIRCOLAZIONE_M = 191.0
+# Aliquota dell'imposta societaria in Francia, per passare da EBITDA a utile netto
+ALIQUOTA_IS = 0.2583
+# Payout medio della politica dichiarata (80-90%), usato per calibrare l'utile base
+PAYOUT_RIFERIMENTO = 0.85
+
+
+@dataclass(frozen=True)
+class SimulationParams:
+    """Ipotesi della simulazione; i valori predefiniti riflettono l'analisi testuale."""
+    dps_base: float = DPS_ATTESO_2024_VAL      # DPS atteso esercizio 2024 [source: 54]
+    crescita_media: float = 0.04               # crescita organica annua dell'utile
+    crescita_std: float = 0.03
+    payout_min: float = 0.80                   # politica 80-90% [source: 3]
+    payout_max: float = 0.90
+    impatto_tasse_media: float = 90.0          # €M EBITDA/anno da metà 2025 [source: 180, 181]
+    impatto_tasse_std: float = 15.0
+    mitigazione_min: float = 0.5               # quota dell'impatto compensata entro il 2027 [source: 183]
+    mitigazione_max: float = 1.0
+    uplift_kindred_media: float = 0.10         # +10% dal 2026 [source: 57]
+    uplift_kindred_std: float = 0.04
+    anno_kindred: int = 2026
+
+
+def base_earnings(dps_base):
+    """Utile di riferimento per il dividendo (€M) implicito nel DPS dell'anno base."""
+    return dps_base * AZIONI_IN_CIRCOLAZIONE_M / PAYOUT_RIFERIMENTO
+
+
+def apply_drivers(utile, anni, impatto_tasse, mitigazione, uplift_kindred, anno_kindred):
+    """Applica in place a ``utile`` l'impatto delle tasse e l'effetto Kindred.
+
+    Tutti gli argomenti devono essere compatibili per broadcasting con
+    ``utile``; ``anni`` indica l'anno di ogni posizione lungo l'asse temporale.
+    È la parte del modello condivisa tra simulazione e cubo degli scenari.
+    """
+    dtype = utile.dtype
+    # Impatto tasse: 50% nel 2025 (da luglio), pieno dopo, ridotto dalla mitigazione
+    quota_anno = np.where(anni == 2025, 0.5, np.where(anni > 2025, 1.0, 0.0)).astype(dtype)
+    avanzamento = np.clip((anni - 2025) / 2, 0, 1).astype(dtype)
+    utile -= impatto_tasse * (quota_anno - mitigazione * avanzamento) * dtype.type(1 - ALIQUOTA_IS)
+    # Effetto Kindred sull'utile distribuibile dall'anno indicato
+    utile *= 1 + uplift_kindred * (anni >= anno_kindred).astype(dtype)
+    return utile
+
+
+def simulate_dps(params=SimulationParams(), n_paths=1_000_000, seed=0):
+    """Simula ``n_paths`` percorsi del DPS; restituisce una matrice ``(anni, n_paths)``.
+
+    Le righe corrispondono a ``ANNI_PROIEZIONE``. Il calcolo è interamente
+    vettorizzato in float32.
+    """
+    rng = np.random.default_rng(seed)
+    anni = np.asarray(ANNI_PROIEZIONE)[:, None]
+    n_anni = len(anni)
+    f32 = np.float32
+
+    utile_base = f32(base_earnings(params.dps_base))
+
+    # Utile prima delle tasse straordinarie: crescita composta anno su anno
+    crescita = rng.standard_normal((n_anni, n_paths), dtype=f32)
+    crescita *= f32(params.crescita_std)
+    crescita += f32(1 + params.crescita_media)
+    utile = np.cumprod(crescita, axis=0, out=crescita)
+    utile *= utile_base
+
+    impatto = rng.standard_normal((1, n_paths), dtype=f32)
+    impatto *= f32(params.impatto_tasse_std)
+    impatto += f32(params.impatto_tasse_media)
+    np.maximum(impatto, 0, out=impatto)
+    mitigazione = rng.uniform(params.mitigazione_min, params.mitigazione_max, (1, n_paths)).astype(f32)
+
+    uplift = rng.standard_normal((1, n_paths), dtype=f32)
+    uplift *= f32(params.uplift_kindred_std)
+    uplift += f32(params.uplift_kindred_media)
+    np.maximum(uplift, 0, out=uplift)
+
+    apply_drivers(utile, anni, impatto, mitigazione, uplift, params.anno_kindred)
+
+    payout = rng.uniform(params.payout_min, params.payout_max, (n_anni, n_paths)).astype(f32)
+    utile *= payout
+    utile /= f32(AZIONI_IN_CIRCOLAZIONE_M)
+    return utile
+
+
+def summarize_paths(dps_paths, percentili=PERCENTILI):
+    """Riepiloga i percorsi in una tabella (Anno, media, percentili)."""
+    bande = np.percentile(dps_paths, percentili, axis=1)
+    df = pd.DataFrame({'Anno': list(ANNI_PROIEZIONE), 'Media': dps_paths.mean(axis=1, dtype=np.float64)})
+    for p, valori in zip(percentili, bande):
+        df[f'P{p}'] = valori.astype(float)
+    return df
+
+
+@st.cache_data(show_spinner=False, max_entries=128)
+def dps_percentiles(params=SimulationParams(), n_paths=1_000_000, seed=0):
+    """Tabella dei percentili del DPS simulato, con la base 2024 come primo anno.
+
+    Il risultato (poche righe) è messo in cache per insieme di ipotesi.
+    """
+    df = summarize_paths(simulate_dps(params, n_paths, seed))
+    base = {'Anno': ANNO_BASE, 'Media': params.dps_base, **{f'P{p}': params.dps_base for p in PERCENTILI}}
+    return pd.concat([pd.DataFrame([base]), df], ignore_index=True)
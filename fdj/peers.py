@@ -0,0 +1,240 @@
+# -*- coding: utf-8 -*-
+"""Universo dei peer e confronto vettorizzato della società con i comparabili.
+
+L'universo è una tabella colonnare (Parquet) con una riga per società quotata::
+
+    ticker, nome, settore, dividend_yield, ev_ebitda, pe
+
+Viene letto una volta per processo (cache per firma del file) e tenuto come
+array NumPy: cambiare il filtro dei peer significa calcolare una maschera
+booleana e poche riduzioni per colonna, nell'ordine dei millisecondi anche con
+migliaia di società.
+
+Se il file dell'universo manca, i peer sono quelli delle tabelle di confronto
+del dataset della società (``yield_comp`` e ``valuation``), escluse le righe
+di indice.
+
+Conversione di un universo da CSV (stesse colonne)::
+
+    python -m fdj.peers universo.csv
+"""
+import os
+import sys
+import warnings
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+import streamlit as st
+
+from fdj.data import load_dataset
+from fdj.dataset import DATASET_DIR, dataset_path, signature
+
+# File dell'universo, sovrascrivibile con FDJ_UNIVERSE_PATH
+UNIVERSE_PATH = Path(os.environ.get("FDJ_UNIVERSE_PATH", DATASET_DIR / "universo.parquet"))
+
+# Colonne dell'universo -> etichette delle tabelle della dashboard
+METRICHE_PEER = {
+    'dividend_yield': 'Dividend Yield (%)',
+    'ev_ebitda': 'EV/EBITDA',
+    'pe': 'P/E',
+}
+COLONNE_UNIVERSO = ('ticker', 'nome', 'settore', *METRICHE_PEER)
+
+# Peer mostrati nei grafici: i più vicini alla società sulle metriche standardizzate
+N_PEER_GRAFICO = 10
+
+TIPO_INDICE = 'Indice'
+TIPO_MEDIANA = 'Mediana'
+
+
+@dataclass(frozen=True)
+class PeerUniverse:
+    """Universo in forma colonnare: una posizione per società in ogni array."""
+    ticker: np.ndarray
+    nome: np.ndarray
+    settori: tuple            # nomi dei settori, indicizzati dai codici
+    codici_settore: np.ndarray
+    valori: np.ndarray        # (società, metriche) float64, NaN = dato mancante
+
+    @classmethod
+    def from_frame(cls, df):
+        codici, settori = pd.factorize(df['settore'], sort=True)
+        return cls(
+            ticker=df['ticker'].to_numpy(dtype=object),
+            nome=df['nome'].to_numpy(dtype=object),
+            settori=tuple(settori),
+            codici_settore=codici.astype(np.int32),
+            valori=np.ascontiguousarray(df[list(METRICHE_PEER)].to_numpy(dtype=np.float64)),
+        )
+
+    def __len__(self):
+        return len(self.ticker)
+
+
+@dataclass(frozen=True)
+class PeerComparison:
+    """Risultato del confronto.
+
+    ``statistiche`` ha una riga per metrica (valore della società, mediane,
+    percentile e z-score rispetto ai peer filtrati); ``mediane_settore`` le
+    mediane di tutti i settori filtrati; ``grafico`` la società, i peer più
+    vicini e la mediana dei peer, con le colonne delle tabelle di confronto.
+    """
+    soggetto: str
+    n_peer: int
+    statistiche: pd.DataFrame
+    mediane_settore: pd.DataFrame
+    grafico: pd.DataFrame
+
+
+def universe_from_tables(tables, ticker, nome_peer):
+    """Universo ricavato dalle tabelle di confronto del dataset (righe di indice escluse)."""
+    df_yield = tables['yield_comp']
+    df_valuation = tables['valuation']
+    df = pd.merge(
+        df_yield[df_yield['Tipo'] != TIPO_INDICE],
+        df_valuation[df_valuation['Tipo'] != TIPO_INDICE].drop(columns='Tipo'),
+        on='Società', how='outer',
+    )
+    return pd.DataFrame({
+        'ticker': df['Società'].where(df['Società'] != nome_peer, ticker),
+        'nome': df['Società'],
+        'settore': df['Tipo'].fillna('n.d.'),
+        **{col: df[label] for col, label in METRICHE_PEER.items()},
+    })
+
+
+def _leggi_universo(path):
+    return pq.read_table(path, columns=list(COLONNE_UNIVERSO), memory_map=True).to_pandas()
+
+
+def _frame_dataset(ticker):
+    ds = load_dataset(ticker)
+    return universe_from_tables(ds.tables, ticker, ds.info.get('nome_peer', ds.info['nome']))
+
+
+@st.cache_resource(show_spinner=False, max_entries=4)
+def _universe_by_signature(path, mtime_ns, size):
+    return PeerUniverse.from_frame(_leggi_universo(path))
+
+
+@st.cache_resource(show_spinner=False, max_entries=32)
+def _universe_from_dataset(ticker, mtime_ns, size):
+    # La firma del bundle fa parte della chiave: l'universo segue le modifiche al dataset
+    return PeerUniverse.from_frame(_frame_dataset(ticker))
+
+
+@st.cache_resource(show_spinner=False, max_entries=32)
+def _universe_con_soggetto(path, mtime_ns, size, ticker, mtime_ns_dataset, size_dataset):
+    # Universo del file più la riga della società presa dal suo dataset (le firme di entrambi sono nella chiave)
+    soggetto = _frame_dataset(ticker)
+    soggetto = soggetto[soggetto['ticker'] == ticker]
+    return PeerUniverse.from_frame(pd.concat([_leggi_universo(path), soggetto], ignore_index=True))
+
+
+def load_universe(ticker, path=UNIVERSE_PATH):
+    """Universo dei peer: il file colonnare se presente, altrimenti i peer del dataset di ``ticker``.
+
+    Se il file non contiene ``ticker``, la società vi è aggiunta con le metriche
+    del proprio dataset, così da poterla confrontare con l'intero universo.
+    """
+    _, mtime_ns_dataset, size_dataset = signature(dataset_path(ticker))
+    if not Path(path).exists():
+        return _universe_from_dataset(ticker, mtime_ns_dataset, size_dataset)
+    universo = _universe_by_signature(*signature(path))
+    if ticker in universo.ticker:
+        return universo
+    return _universe_con_soggetto(*signature(path), ticker, mtime_ns_dataset, size_dataset)
+
+
+def compare(universe, soggetto, settori=None, n_grafico=N_PEER_GRAFICO):
+    """Confronta ``soggetto`` (ticker) con i peer dei ``settori`` indicati (tutti se vuoto).
+
+    Tutte le statistiche sono calcolate in un'unica passata sulle colonne
+    dell'universo; solleva ``KeyError`` se il ticker non è nell'universo.
+    """
+    posizioni = np.flatnonzero(universe.ticker == soggetto)
+    if not len(posizioni):
+        raise KeyError(soggetto)
+    i = posizioni[0]
+
+    peer = np.ones(len(universe), dtype=bool)
+    if settori:
+        codici = [universe.settori.index(s) for s in settori if s in universe.settori]
+        peer = np.isin(universe.codici_settore, codici)
+    peer[i] = False
+
+    x = universe.valori[i]
+    X = universe.valori[peer]
+    codici_peer = universe.codici_settore[peer]
+    presenti = ~np.isnan(X)
+    n_validi = presenti.sum(axis=0)
+
+    # Le colonne senza dati producono NaN (con avvisi di NumPy): è il risultato voluto
+    with np.errstate(invalid='ignore', divide='ignore'), warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        media = np.nanmean(X, axis=0)
+        std = np.nanstd(X, axis=0)
+        mediana = np.nanmedian(X, axis=0)
+        # Percentile del soggetto: quota di peer sotto il suo valore (i pari contano a metà)
+        percentile = ((X < x).sum(axis=0) + 0.5 * (X == x).sum(axis=0)) / n_validi * 100
+        z = np.where(std > 0, (x - media) / std, np.nan)
+        # Distanza sulle metriche standardizzate, ignorando i dati mancanti; i peer senza
+        # alcuna metrica confrontabile sono in fondo alla graduatoria, non a distanza zero
+        Z = (X - media) / np.where(std > 0, std, np.nan)
+        scarti = (Z - z) ** 2
+        distanza = np.where(np.isfinite(scarti).any(axis=1), np.nansum(scarti, axis=1), np.inf)
+
+    mediane_settore = pd.DataFrame(X, columns=list(METRICHE_PEER.values())).groupby(
+        pd.Categorical.from_codes(codici_peer, universe.settori), observed=True).median()
+    settore_soggetto = universe.settori[universe.codici_settore[i]]
+    if settore_soggetto in mediane_settore.index:
+        mediana_settore = mediane_settore.loc[settore_soggetto].to_numpy()
+    else:
+        mediana_settore = np.full(len(METRICHE_PEER), np.nan)
+
+    statistiche = pd.DataFrame({
+        'Valore': x,
+        f'Mediana {settore_soggetto}': mediana_settore,
+        'Mediana Peer': mediana,
+        'Percentile': percentile,
+        'Z-score': z,
+    }, index=pd.Index(list(METRICHE_PEER.values()), name='Metrica'))
+
+    indici_peer = np.flatnonzero(peer)
+    k = min(n_grafico, len(indici_peer))
+    scelti = np.argpartition(distanza, k - 1)[:k] if 0 < k < len(indici_peer) else np.arange(k)
+    scelti = scelti[np.argsort(distanza[scelti], kind='stable')]
+    righe = np.concatenate([[i], indici_peer[scelti]])
+    grafico = pd.DataFrame({
+        'Società': universe.nome[righe],
+        'Tipo': [universe.settori[c] for c in universe.codici_settore[righe]],
+        **{label: universe.valori[righe, j] for j, label in enumerate(METRICHE_PEER.values())},
+    })
+    grafico.loc[len(grafico)] = ['Mediana Peer', TIPO_MEDIANA, *mediana]
+    return PeerComparison(
+        soggetto=universe.nome[i],
+        n_peer=int(peer.sum()),
+        statistiche=statistiche,
+        mediane_settore=mediane_settore,
+        grafico=grafico,
+    )
+
+
+def convert_csv(csv_path, path=UNIVERSE_PATH):
+    """Converte un universo CSV nel file Parquet letto dalla dashboard."""
+    df = pd.read_csv(csv_path, usecols=list(COLONNE_UNIVERSO))
+    df = df.astype({col: 'float64' for col in METRICHE_PEER})
+    path = Path(path)
+    tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+    df.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, path)
+    return path, len(df)
+
+
+if __name__ == "__main__":
+    out, n = convert_csv(sys.argv[1])
+    print(f"Universo di {n} società salvato in {out}")
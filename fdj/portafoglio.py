@@ -0,0 +1,223 @@
+# -*- coding: utf-8 -*-
+"""Portafoglio caricato dall'utente e proiezione aggregata del reddito da dividendi.
+
+Il file delle posizioni è un CSV con una riga per lotto::
+
+    ticker, azioni, costo
+
+(``costo`` = prezzo di carico per azione, facoltativo; sono accettati anche
+i nomi ``shares`` e ``cost_basis``). I lotti dello stesso ticker vengono
+sommati. Lo yield on cost confronta reddito e costo delle stesse azioni:
+quelle con prezzo di carico di ticker con proiezione.
+
+Il DPS di ogni ticker per gli anni di proiezione viene da:
+
+- il dataset della società, se presente: le stesse previsioni della tabella
+  ``forecast`` (per il ticker con modello di scenario, quelle dello scenario
+  selezionato), con l'ultimo valore previsto mantenuto negli anni successivi;
+- altrimenti lo storico dei dividendi (``fdj.prezzi``): il DPS degli ultimi 12
+  mesi, mantenuto costante.
+
+Il calendario ripartisce il DPS annuo sui mesi di stacco degli ultimi 12 mesi
+di storico (mese ``0`` = non noto). Calendario e posizioni sono tabelle in
+formato lungo: la proiezione è un merge e poche ``groupby``, senza cicli
+sulle posizioni. Lettura e proiezione sono in cache per hash del file.
+"""
+import hashlib
+import io
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from fdj.data import hash_frame, list_tickers, load_dataset
+
+# Nomi alternativi delle colonne del file delle posizioni
+ALIAS_COLONNE = {
+    'shares': 'azioni',
+    'quantita': 'azioni',
+    'cost_basis': 'costo',
+    'cost basis': 'costo',
+    'prezzo_carico': 'costo',
+}
+MESI = ('n.d.', 'Gen', 'Feb', 'Mar', 'Apr', 'Mag', 'Giu', 'Lug', 'Ago', 'Set', 'Ott', 'Nov', 'Dic')
+GIORNI_TRAILING = 365
+
+FONTE_DATASET = 'Dataset'
+FONTE_STORICO = 'Storico (DPS 12 mesi costante)'
+
+
+@dataclass(frozen=True)
+class ProiezionePortafoglio:
+    """Risultato della proiezione.
+
+    ``per_anno`` riporta reddito e yield on cost per anno, ``calendario`` il
+    reddito per anno e mese di stacco, ``per_ticker`` il reddito di ogni
+    ticker (una colonna per anno) e ``senza_dati`` le posizioni senza DPS.
+    Lo yield on cost è calcolato sul solo ``costo_coperto`` (azioni con
+    prezzo di carico e proiezione); ``senza_costo`` riporta per ticker le
+    azioni con proiezione ma senza prezzo di carico, escluse dallo yield.
+    """
+    n_posizioni: int
+    costo_totale: float
+    costo_coperto: float
+    senza_costo: pd.DataFrame
+    per_anno: pd.DataFrame
+    calendario: pd.DataFrame
+    per_ticker: pd.DataFrame
+    senza_dati: pd.DataFrame
+
+
+def leggi_portafoglio(contenuto):
+    """Posizioni aggregate per ticker da un CSV; solleva ``ValueError`` se il file non è valido."""
+    try:
+        df = pd.read_csv(io.BytesIO(contenuto), dtype={0: str}, skipinitialspace=True)
+    except (pd.errors.ParserError, pd.errors.EmptyDataError, UnicodeDecodeError) as e:
+        raise ValueError(f"file delle posizioni non leggibile: {e}") from e
+    df = df.rename(columns=lambda c: ALIAS_COLONNE.get(str(c).strip().lower(), str(c).strip().lower()))
+    mancanti = [c for c in ('ticker', 'azioni') if c not in df.columns]
+    if mancanti:
+        raise ValueError(f"colonne mancanti nel file delle posizioni: {mancanti}")
+    if 'costo' not in df.columns:
+        df['costo'] = np.nan
+
+    azioni = pd.to_numeric(df['azioni'], errors='coerce')
+    costo = pd.to_numeric(df['costo'], errors='coerce')
+    non_validi = azioni.isna() | df['ticker'].isna()
+    if non_validi.any():
+        righe = (np.flatnonzero(non_validi) + 2)[:5].tolist()  # +2: intestazione e numerazione da 1
+        raise ValueError(f"{int(non_validi.sum())} righe con ticker o azioni non validi (es. righe {righe})")
+
+    lotti = pd.DataFrame({
+        'ticker': df['ticker'].astype(str).str.strip().str.upper(),
+        'azioni': azioni.astype(float),
+        'costo_totale': (azioni * costo).astype(float),
+        'azioni_con_costo': azioni.where(costo.notna(), 0.0).astype(float),
+    })
+    # min_count: il costo resta NaN se nessun lotto del ticker lo riporta
+    return lotti.groupby('ticker', as_index=False, sort=True).sum(min_count=1)
+
+
+@st.cache_data(show_spinner=False, max_entries=16)
+def _posizioni_by_hash(hash_file, _contenuto):
+    return leggi_portafoglio(_contenuto)
+
+
+def carica_portafoglio(contenuto):
+    """Posizioni del file, in cache per hash del contenuto: ``(hash, posizioni)``."""
+    hash_file = hashlib.sha256(contenuto).hexdigest()
+    return hash_file, _posizioni_by_hash(hash_file, contenuto)
+
+
+def previsioni_dataset(tickers, anni, sostituzioni=None):
+    """DPS previsti (formato lungo ``ticker, Anno, DPS (€)``) dei ticker con un dataset.
+
+    ``sostituzioni`` indica, per ticker, una tabella ``forecast`` da usare al
+    posto di quella del dataset (es. le proiezioni dello scenario selezionato).
+    """
+    sostituzioni = sostituzioni or {}
+    richiesti = set(tickers)
+    disponibili = [t for t in list_tickers() if t in richiesti]
+    righe = []
+    for ticker in disponibili:
+        ds = load_dataset(ticker)
+        forecast = sostituzioni.get(ticker, ds.tables['forecast'])
+        dps = forecast.set_index('Anno')['DPS (€)']
+        # Anni oltre l'ultima previsione: ultimo valore previsto
+        dps = dps.reindex(sorted(set(dps.index) | set(anni))).ffill().reindex(list(anni))
+        righe.append(pd.DataFrame({'ticker': ticker, 'Anno': list(anni), 'DPS (€)': dps.to_numpy(dtype=float)}))
+    if not righe:
+        return pd.DataFrame({'ticker': pd.Series(dtype=object), 'Anno': pd.Series(dtype='int64'), 'DPS (€)': pd.Series(dtype=float)})
+    return pd.concat(righe, ignore_index=True).dropna(subset=['DPS (€)'])
+
+
+def stacchi_recenti(storico, tickers):
+    """DPS degli ultimi 12 mesi di storico per ticker e mese di stacco (``ticker, Mese, DPS (€)``)."""
+    vuoto = pd.DataFrame({'ticker': pd.Series(dtype=object), 'Mese': pd.Series(dtype='int64'), 'DPS (€)': pd.Series(dtype=float)})
+    if storico is None:
+        return vuoto
+    codici = pd.Index(storico.tickers).get_indexer(pd.unique(np.asarray(tickers, dtype=object)))
+    codici = codici[codici >= 0]
+    if not len(codici):
+        return vuoto
+
+    # Ultima seduta di ogni ticker: la finestra dei 12 mesi è per ticker
+    n_sedute = np.diff(storico.inizio)
+    ultimo = np.where(n_sedute > 0, storico.giorno[np.maximum(storico.inizio[1:] - 1, 0)], np.iinfo(np.int32).min)
+    div_codice = np.repeat(np.arange(len(storico.tickers)), np.diff(storico.div_inizio))
+    fine = ultimo[div_codice]
+    scelti = np.isin(div_codice, codici) & (storico.div_giorno <= fine) & (storico.div_giorno > fine - GIORNI_TRAILING)
+
+    giorni = storico.div_giorno[scelti].astype('datetime64[D]')
+    return pd.DataFrame({
+        'ticker': np.asarray(storico.tickers, dtype=object)[div_codice[scelti]],
+        'Mese': giorni.astype('datetime64[M]').astype(np.int64) % 12 + 1,
+        'DPS (€)': storico.div_dps[scelti],
+    }).groupby(['ticker', 'Mese'], as_index=False)['DPS (€)'].sum()
+
+
+def calendario_dividendi(previsioni, recenti, anni):
+    """DPS per ticker, anno e mese (formato lungo), dalle previsioni dei dataset e dallo storico."""
+    # Quota del DPS annuo staccata in ogni mese, secondo gli ultimi 12 mesi di storico
+    quote = recenti.assign(Quota=recenti['DPS (€)'] / recenti.groupby('ticker')['DPS (€)'].transform('sum'))
+    da_dataset = previsioni.merge(quote[['ticker', 'Mese', 'Quota']], on='ticker', how='left')
+    da_dataset = da_dataset.fillna({'Mese': 0, 'Quota': 1.0}).astype({'Mese': 'int64'})
+    da_dataset['DPS (€)'] = da_dataset['DPS (€)'] * da_dataset['Quota']
+    da_dataset['Fonte'] = FONTE_DATASET
+
+    # Ticker senza dataset: DPS degli ultimi 12 mesi ripetuto negli anni di proiezione
+    da_storico = recenti[~recenti['ticker'].isin(previsioni['ticker'])].merge(
+        pd.DataFrame({'Anno': list(anni)}), how='cross')
+    da_storico['Fonte'] = FONTE_STORICO
+
+    colonne = ['ticker', 'Anno', 'Mese', 'DPS (€)', 'Fonte']
+    return pd.concat([da_dataset[colonne], da_storico[colonne]], ignore_index=True)
+
+
+def proietta(posizioni, calendario):
+    """Reddito da dividendi del portafoglio per anno, mese e ticker."""
+    df = posizioni.merge(calendario, on='ticker', how='inner')
+    df['Reddito (€)'] = df['azioni'] * df['DPS (€)']
+    # Reddito delle sole azioni con prezzo di carico: numeratore dello yield on cost
+    df['reddito_con_costo'] = df['azioni_con_costo'] * df['DPS (€)']
+
+    proiettate = posizioni['ticker'].isin(calendario['ticker'])
+    costo_coperto = float(posizioni.loc[proiettate, 'costo_totale'].sum())
+    per_anno = df.groupby('Anno', as_index=False)[['Reddito (€)', 'reddito_con_costo']].sum()
+    per_anno['Yield on Cost (%)'] = per_anno['reddito_con_costo'] / costo_coperto * 100 if costo_coperto > 0 else np.nan
+    per_anno = per_anno.drop(columns='reddito_con_costo')
+    senza_costo = posizioni.loc[proiettate, ['ticker']].assign(
+        azioni=posizioni['azioni'] - posizioni['azioni_con_costo'])
+
+    mensile = df.groupby(['Anno', 'Mese'], as_index=False)['Reddito (€)'].sum()
+    mensile['Mese'] = pd.Categorical.from_codes(mensile['Mese'], MESI)
+
+    per_ticker = df.pivot_table(index=['ticker', 'Fonte'], columns='Anno', values='Reddito (€)', aggfunc='sum')
+    per_ticker = per_ticker.sort_values(per_ticker.columns[0], ascending=False) if len(per_ticker.columns) else per_ticker
+    per_ticker.columns = [f"Reddito {anno} (€)" for anno in per_ticker.columns]
+
+    return ProiezionePortafoglio(
+        n_posizioni=len(posizioni),
+        costo_totale=float(posizioni['costo_totale'].sum()),
+        costo_coperto=costo_coperto,
+        senza_costo=senza_costo[senza_costo['azioni'] > 0].reset_index(drop=True),
+        per_anno=per_anno,
+        calendario=mensile,
+        per_ticker=per_ticker.reset_index().rename(columns={'ticker': 'Ticker'}),
+        senza_dati=posizioni[~posizioni['ticker'].isin(calendario['ticker'])].reset_index(drop=True),
+    )
+
+
+@st.cache_data(show_spinner=False, max_entries=16)
+def _proiezione_by_hash(hash_file, hash_previsioni, firma_storico, anni, _posizioni, _previsioni, _storico):
+    recenti = stacchi_recenti(_storico, _posizioni['ticker'])
+    return proietta(_posizioni, calendario_dividendi(_previsioni, recenti, anni))
+
+
+def proiezione_portafoglio(hash_file, posizioni, anni, storico=None, sostituzioni=None):
+    """Proiezione del portafoglio, in cache per hash del file, previsioni e storico dei dividendi."""
+    anni = tuple(int(a) for a in anni)
+    previsioni = previsioni_dataset(posizioni['ticker'], anni, sostituzioni)
+    firma_storico = storico.firma if storico is not None else None
+    return _proiezione_by_hash(hash_file, hash_frame(previsioni), firma_storico, anni, posizioni, previsioni, storico)
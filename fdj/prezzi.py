@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+"""Storico dei prezzi e dei dividendi (data ex) con rendimento trailing e forward.
+
+Ingestione offline da CSV::
+
+    python -m fdj.prezzi prezzi.csv dividendi.csv
+
+- ``prezzi.csv``: ``ticker, data, chiusura`` (una riga per seduta);
+- ``dividendi.csv``: ``ticker, data_ex, dps`` (una riga per stacco, anche
+  futuro se già annunciato).
+
+I due file vengono ordinati per ticker e data e salvati in ``datasets/prezzi``
+come tabelle Arrow IPC non compresse: all'avvio vengono aperte in memory-map
+e le colonne diventano array NumPy senza copie (Parquet richiederebbe la
+decompressione a ogni lettura).
+
+Il rendimento è calcolato per tutti i ticker in un'unica passata: ogni seduta
+e ogni stacco hanno una chiave ``(ticker, giorno)`` ordinata, i dividendi
+cumulati permettono di sommare una finestra di 365 giorni con due
+``searchsorted``. Il trailing usa gli stacchi in ``(t - 365, t]``, il forward
+quelli in ``(t, t + 365]``; le finestre non coperte dai dati sono NaN.
+"""
+import os
+import sys
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import streamlit as st
+
+from fdj.dataset import DATASET_DIR, signature
+
+# Cartella dello storico, sovrascrivibile con FDJ_PREZZI_DIR
+PREZZI_DIR = Path(os.environ.get("FDJ_PREZZI_DIR", DATASET_DIR / "prezzi"))
+FILE_PREZZI = "prezzi.arrow"
+FILE_DIVIDENDI = "dividendi.arrow"
+
+GIORNI_FINESTRA = 365
+# Frequenza dei punti inviati al grafico (ultima seduta di ogni settimana)
+FREQUENZA_GRAFICO = 'W-FRI'
+
+
+def _scrivi_arrow(df, path):
+    # Un solo record batch: le colonne restano contigue e leggibili senza copie
+    table = pa.Table.from_pandas(df, preserve_index=False).combine_chunks()
+    tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+    with pa.OSFile(str(tmp_path), "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table)
+    os.replace(tmp_path, path)
+
+
+def ingest(prezzi_csv, dividendi_csv, directory=PREZZI_DIR):
+    """Converte i CSV di prezzi e dividendi nelle tabelle Arrow lette dalla dashboard."""
+    prezzi = pd.read_csv(prezzi_csv, usecols=['ticker', 'data', 'chiusura'], parse_dates=['data'])
+    dividendi = pd.read_csv(dividendi_csv, usecols=['ticker', 'data_ex', 'dps'], parse_dates=['data_ex'])
+    # Codici dei ticker comuni alle due tabelle (ordine alfabetico)
+    tickers = pd.Index(sorted(set(prezzi['ticker']) | set(dividendi['ticker'])))
+
+    prezzi = (prezzi.dropna()
+              .drop_duplicates(['ticker', 'data'], keep='last')
+              .sort_values(['ticker', 'data']))
+    dividendi = (dividendi.dropna()
+                 .groupby(['ticker', 'data_ex'], as_index=False)['dps'].sum()
+                 .sort_values(['ticker', 'data_ex']))
+
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    _scrivi_arrow(pd.DataFrame({
+        'codice': tickers.get_indexer(prezzi['ticker']).astype(np.int32),
+        'giorno': prezzi['data'].to_numpy('datetime64[D]').astype(np.int32),
+        'chiusura': prezzi['chiusura'].to_numpy(np.float64),
+    }), directory / FILE_PREZZI)
+    _scrivi_arrow(pd.DataFrame({
+        'codice': tickers.get_indexer(dividendi['ticker']).astype(np.int32),
+        'giorno': dividendi['data_ex'].to_numpy('datetime64[D]').astype(np.int32),
+        'dps': dividendi['dps'].to_numpy(np.float64),
+    }), directory / FILE_DIVIDENDI)
+    with open(directory / "tickers.txt", 'w', encoding='utf-8') as f:
+        f.write("\n".join(tickers) + "\n")
+    return directory, len(tickers), len(prezzi), len(dividendi)
+
+
+def _leggi_arrow(path):
+    table = pa.ipc.open_file(pa.memory_map(str(path))).read_all()
+    return {name: table.column(name).chunk(0).to_numpy(zero_copy_only=True) for name in table.column_names}
+
+
+@dataclass(frozen=True)
+class StoricoRendimenti:
+    """Serie di tutti i ticker, ordinate per (ticker, giorno).
+
+    ``inizio`` e ``div_inizio`` indicizzano le sedute e gli stacchi di ogni
+    ticker; i giorni sono contati dal 1970-01-01. ``firma`` identifica i
+    file da cui è stato letto (chiave per le cache dei risultati derivati).
+    """
+    firma: tuple
+    tickers: tuple
+    inizio: np.ndarray
+    giorno: np.ndarray
+    chiusura: np.ndarray
+    trailing: np.ndarray
+    forward: np.ndarray
+    div_inizio: np.ndarray
+    div_giorno: np.ndarray
+    div_dps: np.ndarray
+
+    def sedute(self, ticker):
+        """Giorni e chiusure del ticker (viste sugli array condivisi, senza copie)."""
+        c = self.tickers.index(ticker)
+        s = slice(self.inizio[c], self.inizio[c + 1])
+        return self.giorno[s], self.chiusura[s]
+
+    def stacchi(self, ticker):
+        """Giorni di stacco (data ex) e DPS del ticker."""
+        c = self.tickers.index(ticker)
+        s = slice(self.div_inizio[c], self.div_inizio[c + 1])
+        return self.div_giorno[s], self.div_dps[s]
+
+    def serie(self, ticker):
+        """Serie giornaliera del ticker (Data, Chiusura, yield trailing e forward)."""
+        c = self.tickers.index(ticker)
+        s = slice(self.inizio[c], self.inizio[c + 1])
+        return pd.DataFrame({
+            'Data': self.giorno[s].astype('datetime64[D]').astype('datetime64[ns]'),
+            'Chiusura': self.chiusura[s],
+            'Yield Trailing (%)': self.trailing[s],
+            'Yield Forward (%)': self.forward[s],
+        })
+
+
+def calcola_rendimenti(codici, giorni, chiusura, div_codici, div_giorni, dps, n_tickers):
+    """Yield trailing e forward (%) di ogni seduta, per tutti i ticker in un'unica passata.
+
+    Gli input devono essere ordinati per (codice, giorno). Restituisce
+    ``(trailing, forward)``, array allineati alle sedute.
+    """
+    # Chiave (ticker, giorno) monotona: le finestre non attraversano mai due ticker
+    base = np.int64(1) << 32
+    chiave = codici.astype(np.int64) * base + giorni
+    chiave_div = div_codici.astype(np.int64) * base + div_giorni
+    cumulati = np.concatenate([[0.0], np.cumsum(dps)])
+
+    oggi = np.searchsorted(chiave_div, chiave, side='right')
+    passato = np.searchsorted(chiave_div, chiave - GIORNI_FINESTRA, side='right')
+    futuro = np.searchsorted(chiave_div, chiave + GIORNI_FINESTRA, side='right')
+    trailing = (cumulati[oggi] - cumulati[passato]) / chiusura * 100
+    forward = (cumulati[futuro] - cumulati[oggi]) / chiusura * 100
+
+    # Copertura dei dati per ticker: dal primo all'ultimo giorno noto tra sedute e stacchi
+    primo = np.full(n_tickers, np.iinfo(np.int32).max, dtype=np.int64)
+    ultimo = np.full(n_tickers, np.iinfo(np.int32).min, dtype=np.int64)
+    for c, g in ((codici, giorni), (div_codici, div_giorni)):
+        np.minimum.at(primo, c, g)
+        np.maximum.at(ultimo, c, g)
+    trailing[giorni - GIORNI_FINESTRA < primo[codici]] = np.nan
+    forward[giorni + GIORNI_FINESTRA > ultimo[codici]] = np.nan
+    return trailing, forward
+
+
+@st.cache_resource(show_spinner=False, max_entries=2)
+def _storico_by_signature(path_prezzi, mtime_prezzi, size_prezzi, path_dividendi, mtime_dividendi, size_dividendi):
+    prezzi = _leggi_arrow(path_prezzi)
+    dividendi = _leggi_arrow(path_dividendi)
+    with open(Path(path_prezzi).parent / "tickers.txt", 'r', encoding='utf-8') as f:
+        tickers = tuple(f.read().splitlines())
+    trailing, forward = calcola_rendimenti(
+        prezzi['codice'], prezzi['giorno'], prezzi['chiusura'],
+        dividendi['codice'], dividendi['giorno'], dividendi['dps'], len(tickers),
+    )
+    codici = np.arange(len(tickers) + 1)
+    return StoricoRendimenti(
+        firma=(path_prezzi, mtime_prezzi, size_prezzi, path_dividendi, mtime_dividendi, size_dividendi),
+        tickers=tickers,
+        inizio=np.searchsorted(prezzi['codice'], codici),
+        giorno=prezzi['giorno'],
+        chiusura=prezzi['chiusura'],
+        trailing=trailing,
+        forward=forward,
+        div_inizio=np.searchsorted(dividendi['codice'], codici),
+        div_giorno=dividendi['giorno'],
+        div_dps=dividendi['dps'],
+    )
+
+
+def load_storico(directory=PREZZI_DIR):
+    """Storico dei rendimenti di tutti i ticker, o ``None`` se i dati non sono stati importati."""
+    directory = Path(directory)
+    try:
+        firme = signature(directory / FILE_PREZZI) + signature(directory / FILE_DIVIDENDI)
+    except FileNotFoundError:
+        return None
+    return _storico_by_signature(*firme)
+
+
+@st.cache_resource(show_spinner=False, max_entries=64)
+def _serie_by_firma(firma, ticker, _storico):
+    # Una serie per (file dello storico, ticker), condivisa tra le sessioni (vedi serie_grafico)
+    df = _storico.serie(ticker)
+    if df.empty:
+        return None
+    return df.set_index('Data').resample(FREQUENZA_GRAFICO).last().dropna(subset=['Chiusura']).reset_index()
+
+
+def serie_grafico(storico, ticker):
+    """Serie del ticker campionata a ``FREQUENZA_GRAFICO``, o ``None`` se il ticker non ha storico.
+
+    La serie è calcolata una volta per processo; ogni chiamata ne restituisce
+    una vista copy-on-write, così le modifiche restano locali al chiamante.
+    """
+    if storico is None or ticker not in storico.tickers:
+        return None
+    serie = _serie_by_firma(storico.firma, ticker, storico)
+    return serie.copy(deep=False) if serie is not None else None
+
+
+if __name__ == "__main__":
+    out, n_tickers, n_prezzi, n_dividendi = ingest(sys.argv[1], sys.argv[2])
+    print(f"Storico salvato in {out}: {n_tickers} ticker, {n_prezzi} sedute, {n_dividendi} stacchi")
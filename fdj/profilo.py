@@ -0,0 +1,252 @@
+# -*- coding: utf-8 -*-
+"""Profilo dei run della dashboard, attivato con ``?profile=1``.
+
+Per ogni blocco marcato con ``sezione(nome)`` (KPI, sezione dei grafici
+attiva, analisi testuale, grafici di ``fdj.figures``) vengono registrati:
+
+- tempo (wall time) e picco delle allocazioni Python (``tracemalloc``), con i
+  blocchi annidati che contribuiscono anche al blocco esterno;
+- per ogni elemento inviato al browser: tipo (``plotly_chart``, ``markdown``,
+  ...), byte del messaggio serializzato e tempo trascorso dall'elemento
+  precedente dello stesso blocco (costruzione dei dati + serializzazione).
+
+I byte sono letti intercettando la coda dei messaggi della sessione
+(``ScriptRunContext``), solo per le sessioni con il profilo attivo. La coda è
+un attributo privato di Streamlit: se una versione non lo espone, il profilo
+misura solo tempi e allocazioni e lo segnala nel pannello. Senza il
+parametro, ``sezione()`` restituisce un context manager vuoto e il costo è
+trascurabile.
+
+Il pannello ``render_pannello`` mostra le misure del run in un expander; con la
+variabile d'ambiente ``FDJ_PROFILE_LOG`` ogni run profilato viene anche
+aggiunto al file indicato come una riga JSON, per l'aggregazione.
+
+Nota: ``tracemalloc`` vale per l'intero processo; mentre un profilo è attivo
+anche le altre sessioni sono rallentate. È uno strumento di diagnosi. Ogni
+sessione profilata tiene un riferimento (``_Traccia``) nel proprio stato:
+viene rilasciato quando il profilo è disattivato o quando la sessione termina
+(scheda chiusa o ricaricata), e l'ultimo riferimento ferma ``tracemalloc``.
+"""
+import contextlib
+import json
+import os
+import threading
+import time
+import tracemalloc
+import weakref
+from dataclasses import asdict, dataclass, field, replace
+from datetime import datetime, timezone
+
+import pandas as pd
+import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+PARAMETRO = 'profile'
+LOG_ENV = 'FDJ_PROFILE_LOG'
+_CHIAVE_STATO = '_profilo'
+_CHIAVE_TRACCIA = '_profilo_traccia'
+
+_lock = threading.Lock()
+_sessioni_tracemalloc = 0
+
+
+def _rilascia_tracemalloc():
+    global _sessioni_tracemalloc
+    with _lock:
+        _sessioni_tracemalloc -= 1
+        if _sessioni_tracemalloc == 0:
+            tracemalloc.stop()
+
+
+class _Traccia:
+    """Riferimento di una sessione a ``tracemalloc``, rilasciato quando l'oggetto viene scartato.
+
+    Il rilascio non dipende da un rerun successivo: lo stato della sessione
+    viene liberato anche quando la scheda è chiusa o ricaricata.
+    """
+
+    def __init__(self):
+        global _sessioni_tracemalloc
+        with _lock:
+            _sessioni_tracemalloc += 1
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+        self.rilascia = weakref.finalize(self, _rilascia_tracemalloc)
+
+
+@dataclass
+class Misura:
+    sezione: str
+    elemento: str            # "" = totale del blocco
+    messaggi: int = 0
+    tempo_s: float = 0.0
+    picco_alloc_b: int = 0
+    byte: int = 0
+
+
+@dataclass
+class _Blocco:
+    nome: str
+    inizio: float
+    memoria_iniziale: int
+    picco: int
+    ultimo_messaggio: float
+    elementi: dict = field(default_factory=dict)
+    messaggi_annidati: int = 0
+    byte_annidati: int = 0
+
+
+class _CodaProfilata:
+    """Sostituisce la coda dei messaggi della sessione e ne misura i byte per blocco."""
+
+    def __init__(self, originale, profilo):
+        self.originale = originale
+        self.profilo = profilo
+
+    def __call__(self, msg):
+        self.profilo.registra_messaggio(msg)
+        self.originale(msg)
+
+
+class Profilo:
+    """Misure di un run completo dello script."""
+
+    def __init__(self, byte_misurati=True):
+        self.misure = []
+        self._pila = []
+        self.inizio = time.perf_counter()
+        # False se la coda dei messaggi non è intercettabile: messaggi e byte restano a zero
+        self.byte_misurati = byte_misurati
+
+    @contextlib.contextmanager
+    def sezione(self, nome):
+        corrente, picco = tracemalloc.get_traced_memory()
+        if self._pila:
+            self._pila[-1].picco = max(self._pila[-1].picco, picco)
+        tracemalloc.reset_peak()
+        adesso = time.perf_counter()
+        blocco = _Blocco(nome, adesso, corrente, corrente, adesso)
+        self._pila.append(blocco)
+        posizione = len(self.misure)  # il blocco precede nella tabella quelli annidati
+        try:
+            yield
+        finally:
+            blocco.picco = max(blocco.picco, tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+            self._pila.pop()
+            nome_completo = " › ".join([b.nome for b in self._pila] + [nome])
+            totale = Misura(
+                nome_completo, "",
+                blocco.messaggi_annidati + sum(m.messaggi for m in blocco.elementi.values()),
+                time.perf_counter() - blocco.inizio, blocco.picco - blocco.memoria_iniziale,
+                blocco.byte_annidati + sum(m.byte for m in blocco.elementi.values()),
+            )
+            if self._pila:
+                # Il blocco esterno include quello annidato; il tempo del suo prossimo
+                # elemento parte da qui (es. grafico costruito in get_figure e poi inviato)
+                esterno = self._pila[-1]
+                esterno.picco = max(esterno.picco, blocco.picco)
+                esterno.messaggi_annidati += totale.messaggi
+                esterno.byte_annidati += totale.byte
+                esterno.ultimo_messaggio = time.perf_counter()
+            self.misure[posizione:posizione] = [totale] + [replace(m, sezione=nome_completo) for m in blocco.elementi.values()]
+
+    def registra_messaggio(self, msg):
+        if not self._pila or not msg.HasField('delta'):
+            return
+        blocco = self._pila[-1]
+        adesso = time.perf_counter()
+        delta = msg.delta
+        tipo = delta.WhichOneof('type')
+        elemento = delta.new_element.WhichOneof('type') if tipo == 'new_element' else tipo
+        misura = blocco.elementi.setdefault(elemento, Misura(blocco.nome, elemento))
+        misura.messaggi += 1
+        misura.byte += msg.ByteSize()
+        misura.tempo_s += adesso - blocco.ultimo_messaggio
+        blocco.ultimo_messaggio = adesso
+
+    def tabella(self):
+        return pd.DataFrame({
+            'Blocco': [m.sezione for m in self.misure],
+            'Elemento': [m.elemento or "(totale)" for m in self.misure],
+            'Messaggi': [m.messaggi if self.byte_misurati else None for m in self.misure],
+            'Tempo (ms)': [m.tempo_s * 1000 for m in self.misure],
+            'Picco Allocazioni (KB)': [m.picco_alloc_b / 1024 if not m.elemento else None for m in self.misure],
+            'Byte Inviati (KB)': [m.byte / 1024 if self.byte_misurati else None for m in self.misure],
+        })
+
+
+def _coda(ctx):
+    return getattr(ctx, '_enqueue', None)
+
+
+def avvia():
+    """Avvia il profilo del run se l'URL contiene ``?profile=1``; restituisce il ``Profilo`` o ``None``."""
+    ctx = get_script_run_ctx()
+    coda = _coda(ctx)
+    attivo = st.query_params.get(PARAMETRO) == '1'
+
+    if isinstance(coda, _CodaProfilata):
+        ctx._enqueue = coda.originale
+    if not attivo:
+        st.session_state.pop(_CHIAVE_STATO, None)
+        traccia = st.session_state.pop(_CHIAVE_TRACCIA, None)
+        if traccia is not None:
+            traccia.rilascia()
+        return None
+
+    if _CHIAVE_TRACCIA not in st.session_state:
+        st.session_state[_CHIAVE_TRACCIA] = _Traccia()
+    # Attributo privato di ScriptRunContext: se manca si misurano solo tempi e allocazioni
+    intercettabile = ctx is not None and hasattr(ctx, '_enqueue')
+    profilo = st.session_state[_CHIAVE_STATO] = Profilo(byte_misurati=intercettabile)
+    if intercettabile:
+        ctx._enqueue = _CodaProfilata(ctx._enqueue, profilo)
+    return profilo
+
+
+def sezione(nome):
+    """Blocco misurato nel profilo della sessione (context manager vuoto se il profilo non è attivo)."""
+    profilo = st.session_state.get(_CHIAVE_STATO) if get_script_run_ctx() is not None else None
+    if profilo is None:
+        return contextlib.nullcontext()
+    return profilo.sezione(nome)
+
+
+def scrivi_log(profilo, percorso=None):
+    """Aggiunge le misure del run al file JSON lines ``percorso`` (predefinito: ``$FDJ_PROFILE_LOG``)."""
+    percorso = percorso or os.environ.get(LOG_ENV)
+    if not percorso:
+        return
+    ctx = get_script_run_ctx()
+    riga = {
+        'data': datetime.now(timezone.utc).isoformat(timespec='milliseconds'),
+        'sessione': ctx.session_id if ctx is not None else None,
+        'query': dict(st.query_params),
+        'durata_s': time.perf_counter() - profilo.inizio,
+        'byte_misurati': profilo.byte_misurati,
+        'misure': [asdict(m) for m in profilo.misure],
+    }
+    with _lock, open(percorso, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(riga, ensure_ascii=False) + "\n")
+
+
+def render_pannello(profilo):
+    """Pannello di debug con le misure del run (e scrittura del log strutturato, se configurato)."""
+    scrivi_log(profilo)
+    with st.expander(f"🛠️ Profilo del run ({(time.perf_counter() - profilo.inizio) * 1000:.0f} ms)", expanded=False):
+        st.dataframe(
+            profilo.tabella(),
+            hide_index=True,
+            use_container_width=True,
+            column_config={
+                'Tempo (ms)': st.column_config.NumberColumn(format="%.1f"),
+                'Picco Allocazioni (KB)': st.column_config.NumberColumn(format="%.0f"),
+                'Byte Inviati (KB)': st.column_config.NumberColumn(format="%.1f"),
+            },
+        )
+        st.caption("Tempo dell'elemento: dall'elemento precedente dello stesso blocco (costruzione dei dati e serializzazione). "
+                   "I rerun dei soli frammenti (es. controlli dello scenario) non aggiornano il pannello. "
+                   f"Con la variabile {LOG_ENV} le misure sono aggiunte al file indicato (una riga JSON per run)."
+                   + ("" if profilo.byte_misurati else
+                      " Messaggi e byte inviati non sono disponibili: questa versione di Streamlit non espone la coda dei messaggi della sessione."))
@@ -0,0 +1,226 @@
+# -*- coding: utf-8 -*-
+"""Cubo degli scenari precalcolato e memory-mapped.
+
+Le proiezioni deterministiche (valori medi delle ipotesi di
+``fdj.montecarlo``) vengono calcolate una volta per l'intera griglia
+
+    payout × impatto tasse × effetto Kindred × anno
+
+e salvate in file ``.npy`` float32 aperti in sola lettura con ``mmap_mode='r'``.
+Tutti i processi del server condividono le stesse pagine tramite la page cache
+del sistema operativo; una variazione dei controlli di scenario diventa un
+accesso per indice al cubo, senza copie per sessione.
+
+Il cubo è composto da due array:
+
+- ``sostenibilita``: ``(payout, tasse, kindred, anno, metrica)`` con le metriche
+  della tabella di sostenibilità del dividendo (indipendenti dal prezzo);
+- ``debito``: ``(payout, tasse, kindred, anno, [debito netto, EBITDA])`` con il
+  piano del debito di ``fdj.debito`` avanzato dai flussi di ogni scenario.
+
+Il prezzo di riferimento non è un asse: il dividend yield è il DPS dello
+scenario diviso per il prezzo esatto scelto dall'utente.
+
+Costruzione esplicita (es. in fase di build o deploy)::
+
+    python -m fdj.scenari
+
+Se il cubo manca o è stato prodotto con ipotesi diverse, viene ricostruito al
+primo accesso.
+"""
+import hashlib
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from fdj.data import CACHE_DIR, get_tables
+from fdj.debito import ANNO_BASE_DEBITO, ebitda_scenario, esborsi_per_anno, piano_debito, tabella_debito
+from fdj.montecarlo import (
+    AZIONI_IN_CIRCOLAZIONE_M, SimulationParams, apply_drivers, base_earnings,
+)
+
+CUBE_VERSION = 3
+DEFAULT_CUBE_DIR = CACHE_DIR / "scenari"
+
+# Assi della griglia: (inizio, fine, passo); gli estremi sono inclusi
+ASSI = {
+    'payout': (50.0, 100.0, 1.0),   # % utile netto
+    'tasse': (0.0, 200.0, 10.0),    # €M EBITDA/anno a regime
+    'kindred': (0.0, 25.0, 1.0),    # % effetto sul dividendo
+}
+ANNI = (2023, 2024, 2025, 2026, 2027)
+ANNI_STORICI = (2023, 2024)
+# Anni del piano del debito (dopo l'ultimo debito netto riportato)
+ANNI_DEBITO = tuple(a for a in ANNI if a > ANNO_BASE_DEBITO)
+METRICHE = (
+    'Utile Netto (€M)',
+    'DPS (€)',
+    'Payout Ratio (%)',
+    'Dividendo Totale (€M)',
+    'FCF (€M)',
+    'FCF post-Dividendo (€M)',
+    'FCF/Dividendo (x)',
+)
+
+
+def axis_values(name):
+    start, stop, step = ASSI[name]
+    return np.round(np.arange(start, stop + step / 2, step), 6)
+
+
+def _fingerprint(storico):
+    # Identifica griglia, ipotesi e dati storici con cui è stato costruito il cubo
+    payload = json.dumps({
+        'version': CUBE_VERSION,
+        'assi': ASSI,
+        'anni': ANNI,
+        'metriche': METRICHE,
+        'ipotesi': repr(SimulationParams()),
+        'azioni': AZIONI_IN_CIRCOLAZIONE_M,
+        'storico': storico.to_json(),
+        'debito': {name: df.to_json() for name, df in _debt_inputs().items()},
+    }, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def _historical_rows():
+    df_sustain = get_tables()['sustain']
+    return df_sustain[df_sustain['Anno'].isin(ANNI_STORICI)].set_index('Anno')[list(METRICHE)]
+
+
+def _debt_inputs():
+    tables = get_tables()
+    inputs = {'debt': tables['debt'][['Anno', 'Debito Netto (€M)', 'EBITDA (€M)']]}
+    if 'acquisizioni' in tables:
+        inputs['acquisizioni'] = tables['acquisizioni']
+    return inputs
+
+
+def build_arrays(params=SimulationParams()):
+    """Calcola i due array del cubo in un'unica passata vettorizzata."""
+    f32 = np.float32
+    payout = axis_values('payout').astype(f32)[:, None, None, None] / 100
+    tasse = axis_values('tasse').astype(f32)[None, :, None, None]
+    kindred = axis_values('kindred').astype(f32)[None, None, :, None] / 100
+    anni = np.asarray(ANNI)[None, None, None, :]
+    storico = _historical_rows()
+    n_anni_storici = len(ANNI_STORICI)
+    anni_proiezione = anni[..., n_anni_storici:]
+
+    # Utile distribuibile: crescita media composta dal 2024, poi tasse ed effetto Kindred
+    utile_base = base_earnings(params.dps_base)
+    crescita = (1 + params.crescita_media) ** (anni_proiezione - 2024)
+    mitigazione = (params.mitigazione_min + params.mitigazione_max) / 2
+    shape = (1, tasse.shape[1], kindred.shape[2], anni_proiezione.shape[3])
+    utile = np.broadcast_to((utile_base * crescita).astype(f32), shape).copy()
+    apply_drivers(utile, anni_proiezione, tasse, f32(mitigazione), kindred, params.anno_kindred)
+
+    # Il flusso di cassa libero segue l'utile rispetto all'anno base (FCF 2024 / utile base)
+    fcf_2024 = storico.loc[2024, 'FCF (€M)']
+    fcf = utile * f32(fcf_2024 / utile_base)
+    dps = utile * payout / f32(AZIONI_IN_CIRCOLAZIONE_M)
+    dividendo = dps * f32(AZIONI_IN_CIRCOLAZIONE_M)
+
+    full_shape = (payout.shape[0], tasse.shape[1], kindred.shape[2], len(ANNI), len(METRICHE))
+    sostenibilita = np.empty(full_shape, dtype=f32)
+    sostenibilita[..., :n_anni_storici, :] = storico.to_numpy(dtype=f32)
+    proiezione = sostenibilita[..., n_anni_storici:, :]
+    proiezione[..., 0] = utile
+    proiezione[..., 1] = dps
+    proiezione[..., 2] = np.broadcast_to(payout * 100, dps.shape)
+    proiezione[..., 3] = dividendo
+    proiezione[..., 4] = fcf
+    proiezione[..., 5] = fcf - dividendo
+    proiezione[..., 6] = fcf / dividendo
+
+    # Piano del debito di tutti gli scenari: dividendi pagati = dividendo dell'esercizio precedente
+    inputs = _debt_inputs()
+    debt = inputs['debt'].set_index('Anno')
+    posizioni = [ANNI.index(a) for a in ANNI_DEBITO]
+    fcf = sostenibilita[..., posizioni, METRICHE.index('FCF (€M)')]
+    dividendi_pagati = sostenibilita[..., [p - 1 for p in posizioni], METRICHE.index('Dividendo Totale (€M)')]
+    debito = np.empty(fcf.shape + (2,), dtype=f32)
+    debito[..., 0] = piano_debito(f32(debt.loc[ANNO_BASE_DEBITO, 'Debito Netto (€M)']), fcf, dividendi_pagati,
+                                  esborsi_per_anno(inputs.get('acquisizioni'), ANNI_DEBITO).astype(f32))
+    debito[..., 1] = ebitda_scenario(debt.loc[list(ANNI_DEBITO), 'EBITDA (€M)'].to_numpy(dtype=float),
+                                     np.asarray(ANNI_DEBITO), tasse, mitigazione)
+    return sostenibilita, debito
+
+
+def build_cube(directory=DEFAULT_CUBE_DIR):
+    """Costruisce il cubo e lo salva in ``directory``; restituisce il percorso."""
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    sostenibilita, debito = build_arrays()
+    # Scrittura su file temporanei e rinomina: un altro processo non apre mai file parziali
+    suffix = f".{os.getpid()}.tmp"
+    for name, arr in (('sostenibilita', sostenibilita), ('debito', debito)):
+        with open(directory / f"{name}.npy{suffix}", 'wb') as f:
+            np.save(f, arr)
+        os.replace(directory / f"{name}.npy{suffix}", directory / f"{name}.npy")
+    # Array dei rendimenti per prezzo delle versioni precedenti del cubo
+    (directory / "rendimento.npy").unlink(missing_ok=True)
+    meta = {'fingerprint': _fingerprint(_historical_rows()), 'assi': ASSI, 'anni': ANNI, 'metriche': METRICHE}
+    with open(directory / f"cube.json{suffix}", 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+    os.replace(directory / f"cube.json{suffix}", directory / "cube.json")
+    return directory
+
+
+class ScenarioCube:
+    """Accesso in sola lettura al cubo memory-mapped."""
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        self.sostenibilita = np.load(self.directory / "sostenibilita.npy", mmap_mode='r')
+        self.debito = np.load(self.directory / "debito.npy", mmap_mode='r')
+
+    @staticmethod
+    def _index(axis, value):
+        start, stop, step = ASSI[axis]
+        return int(round((min(max(value, start), stop) - start) / step))
+
+    def sustainability(self, payout, tasse, kindred):
+        """Tabella di sostenibilità (anni × metriche) per lo scenario indicato."""
+        values = self.sostenibilita[self._index('payout', payout), self._index('tasse', tasse), self._index('kindred', kindred)]
+        df = pd.DataFrame(values, columns=list(METRICHE))
+        df.insert(0, 'Anno', ANNI)
+        return df
+
+    def debt(self, payout, tasse, kindred):
+        """Tabella del debito (anni storici del dataset e piano dello scenario) con la leva."""
+        values = self.debito[self._index('payout', payout), self._index('tasse', tasse), self._index('kindred', kindred)]
+        return tabella_debito(_debt_inputs()['debt'], ANNI_DEBITO, values[:, 0], values[:, 1])
+
+    def dividend_yield(self, prezzo, payout, tasse, kindred, anno):
+        """Dividend yield (%) del DPS dell'anno indicato al prezzo di riferimento (esatto, non arrotondato alla griglia)."""
+        dps = self.sostenibilita[self._index('payout', payout), self._index('tasse', tasse), self._index('kindred', kindred),
+                                 ANNI.index(anno), METRICHE.index('DPS (€)')]
+        return float(dps) / prezzo * 100
+
+
+def _is_current(directory):
+    try:
+        with open(Path(directory) / "cube.json", 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return False
+    return meta.get('fingerprint') == _fingerprint(_historical_rows())
+
+
+@st.cache_resource(show_spinner=False)
+def get_scenario_cube(directory=DEFAULT_CUBE_DIR):
+    """Cubo degli scenari del processo, ricostruito solo se mancante o non aggiornato."""
+    if not _is_current(directory):
+        build_cube(directory)
+    return ScenarioCube(directory)
+
+
+if __name__ == "__main__":
+    path = build_cube()
+    sizes = {p.name: p.stat().st_size for p in sorted(path.glob("*.npy"))}
+    print(f"Cubo degli scenari salvato in {path}: " + ", ".join(f"{n} {s / 1e6:.1f} MB" for n, s in sizes.items()))
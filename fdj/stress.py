@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+"""Stress test della copertura del dividendo e della leva finanziaria.
+
+Quattro shock sui driver delle tabelle di sostenibilità (``sustain``) e del
+debito (``debt``), combinati su una griglia completa::
+
+    tasse (€M EBITDA/anno) × ritardo Kindred (anni) × calo EBITDA (%) × rialzo tassi (bp)
+
+Tutte le combinazioni e tutti gli anni di proiezione sono valutati in
+un'unica passata NumPy (broadcasting sugli assi della griglia). Il dividendo
+resta quello dello scenario di base (la società mantiene la distribuzione
+annunciata) e la differenza di FCF rispetto alla base si accumula nel
+debito netto:
+
+    ΔFCF_t        = Δutile_t = -(Δtasse_t + calo_t · EBITDA_t) · (1 - IS)
+                    - Kindred perso_t - debito Kindred · rialzo · (1 - IS)
+    copertura_t   = (FCF_t + ΔFCF_t) / dividendo_t
+    debito_t      = debito_base_t - Σ_{s<=t} ΔFCF_s
+    leva_t        = max(debito_t / EBITDA stressato_t, 0)
+
+L'impatto delle tasse usa la stessa funzione del modello di scenario
+(``fdj.montecarlo.apply_drivers``). Un ritardo dell'integrazione sposta in
+avanti l'effetto Kindred sull'utile; il debito Kindred è l'aumento del debito
+netto nell'anno dell'acquisizione.
+
+Ogni combinazione ha una probabilità (prodotto delle probabilità dei singoli
+shock, vedi ``IpotesiStress``): le mappe e la tabella delle violazioni
+(copertura < 1x, leva > 2,5x) sono medie pesate sulla griglia.
+"""
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from fdj.montecarlo import ALIQUOTA_IS, SimulationParams, apply_drivers
+
+# Assi della griglia: (inizio, fine, passo); gli estremi sono inclusi
+ASSI_STRESS = {
+    'tasse': (0.0, 200.0, 10.0),     # €M EBITDA/anno a regime
+    'ritardo': (0.0, 2.0, 1.0),      # anni di ritardo dell'integrazione Kindred
+    'calo_ebitda': (0.0, 30.0, 2.5), # % EBITDA
+    'tassi': (0.0, 300.0, 25.0),     # bp sul debito Kindred
+}
+ETICHETTE_ASSI = {
+    'tasse': "Impatto tasse (€M EBITDA/anno)",
+    'ritardo': "Ritardo integrazione Kindred (anni)",
+    'calo_ebitda': "Calo EBITDA (%)",
+    'tassi': "Rialzo tassi debito Kindred (bp)",
+}
+
+SOGLIA_COPERTURA = 1.0
+SOGLIA_LEVA = 2.5
+ANNO_ACQUISIZIONE = 2025
+
+
+@dataclass(frozen=True)
+class IpotesiStress:
+    """Distribuzioni degli shock usate per pesare la griglia.
+
+    L'impatto delle tasse riprende le ipotesi della simulazione Monte Carlo;
+    le altre sono ipotesi di lavoro, non valori tratti dall'analisi.
+    """
+    tasse_media: float = SimulationParams.impatto_tasse_media   # [source: 180, 181]
+    tasse_std: float = SimulationParams.impatto_tasse_std
+    mitigazione: float = (SimulationParams.mitigazione_min + SimulationParams.mitigazione_max) / 2
+    prob_ritardo: tuple = (0.6, 0.3, 0.1)                        # 0, 1, 2 anni
+    calo_ebitda_scala: float = 5.0                              # % (seminormale)
+    tassi_scala: float = 75.0                                   # bp (seminormale)
+
+
+def axis_values(name):
+    start, stop, step = ASSI_STRESS[name]
+    return np.round(np.arange(start, stop + step / 2, step), 6)
+
+
+def _pesi(valori, densita):
+    pesi = densita(valori)
+    return pesi / pesi.sum()
+
+
+def probabilita_griglia(ipotesi=IpotesiStress()):
+    """Probabilità di ogni combinazione, matrice ``(tasse, ritardo, calo_ebitda, tassi)``."""
+    tasse = _pesi(axis_values('tasse'), lambda x: np.exp(-0.5 * ((x - ipotesi.tasse_media) / ipotesi.tasse_std) ** 2))
+    ritardo = np.asarray(ipotesi.prob_ritardo, dtype=float)
+    ritardo = ritardo / ritardo.sum()
+    calo = _pesi(axis_values('calo_ebitda'), lambda x: np.exp(-0.5 * (x / ipotesi.calo_ebitda_scala) ** 2))
+    tassi = _pesi(axis_values('tassi'), lambda x: np.exp(-0.5 * (x / ipotesi.tassi_scala) ** 2))
+    return np.einsum('a,b,c,d->abcd', tasse, ritardo, calo, tassi)
+
+
+@dataclass(frozen=True)
+class RisultatoStress:
+    """Copertura e leva per combinazione e anno, con la probabilità di ogni combinazione."""
+    anni: tuple
+    copertura: np.ndarray       # (tasse, ritardo, calo_ebitda, tassi, anni)
+    leva: np.ndarray
+    probabilita: np.ndarray     # (tasse, ritardo, calo_ebitda, tassi)
+
+    @property
+    def violazioni(self):
+        """Combinazioni (e anni) con copertura < 1x o leva > 2,5x."""
+        return (self.copertura < SOGLIA_COPERTURA) | (self.leva > SOGLIA_LEVA)
+
+    def mappa(self, asse_x, asse_y):
+        """Probabilità di violazione (%) per coppia di livelli di due shock, pesata sugli altri."""
+        assi = list(ASSI_STRESS)
+        ix, iy = assi.index(asse_x), assi.index(asse_y)
+        altri = tuple(i for i in range(len(assi)) if i not in (ix, iy))
+        violata = self.violazioni.any(axis=-1)
+        congiunta = (violata * self.probabilita).sum(axis=altri)
+        marginale = self.probabilita.sum(axis=altri)
+        # Probabilità condizionata ai due livelli; righe = asse_y, colonne = asse_x
+        condizionata = congiunta / marginale * 100
+        if ix < iy:
+            condizionata = condizionata.T
+        return pd.DataFrame(condizionata, index=pd.Index(axis_values(asse_y), name=ETICHETTE_ASSI[asse_y]),
+                            columns=pd.Index(axis_values(asse_x), name=ETICHETTE_ASSI[asse_x]))
+
+    def tabella_violazioni(self):
+        """Probabilità (%) delle violazioni per anno e sull'intero orizzonte."""
+        p = self.probabilita[..., None]
+        righe = {
+            f'Copertura < {SOGLIA_COPERTURA:.0f}x': (self.copertura < SOGLIA_COPERTURA),
+            f'Leva > {SOGLIA_LEVA:.1f}x': (self.leva > SOGLIA_LEVA),
+            'Almeno una violazione': self.violazioni,
+        }
+        df = pd.DataFrame({
+            nome: np.append((violata * p).sum(axis=(0, 1, 2, 3)), (violata.any(axis=-1) * self.probabilita).sum())
+            for nome, violata in righe.items()
+        }, index=pd.Index([str(a) for a in self.anni] + [f"{self.anni[0]}-{self.anni[-1]}"], name='Anno'))
+        return df * 100
+
+    def scenari_critici(self, n=10):
+        """Le ``n`` combinazioni più probabili tra quelle con almeno una violazione."""
+        violata = self.violazioni.any(axis=-1).ravel()
+        p = np.where(violata, self.probabilita.ravel(), -1.0)
+        k = min(n, int(violata.sum()))
+        scelti = np.argsort(p, kind='stable')[::-1][:k]
+        livelli = np.unravel_index(scelti, self.probabilita.shape)
+        copertura = self.copertura.reshape(-1, len(self.anni))[scelti]
+        leva = self.leva.reshape(-1, len(self.anni))[scelti]
+        return pd.DataFrame({
+            **{ETICHETTE_ASSI[a]: axis_values(a)[i] for a, i in zip(ASSI_STRESS, livelli)},
+            'Probabilità (%)': self.probabilita.ravel()[scelti] * 100,
+            'Copertura Minima (x)': copertura.min(axis=1),
+            'Leva Massima (x)': leva.max(axis=1),
+        })
+
+
+def stress_test(df_sustain, df_debt, tasse_base, kindred_base, ipotesi=IpotesiStress(), anno_kindred=SimulationParams.anno_kindred):
+    """Valuta tutte le combinazioni di shock sugli anni di proiezione comuni a ``df_sustain`` e ``df_debt``.
+
+    ``tasse_base`` (€M) e ``kindred_base`` (frazione) sono le ipotesi dello
+    scenario di base da cui provengono le tabelle.
+    """
+    sustain = df_sustain.set_index('Anno')
+    debt = df_debt.set_index('Anno')
+    anni = tuple(int(a) for a in sorted(set(sustain.index) & set(debt.index)) if a >= ANNO_ACQUISIZIONE)
+    debito_kindred = float(debt.loc[ANNO_ACQUISIZIONE, 'Debito Netto (€M)'] - debt.loc[ANNO_ACQUISIZIONE - 1, 'Debito Netto (€M)'])
+    sustain = sustain.loc[list(anni)]
+    debt = debt.loc[list(anni)]
+
+    # Assi della griglia per broadcasting: (tasse, ritardo, calo, tassi, anni)
+    tasse = axis_values('tasse')[:, None, None, None, None]
+    ritardo = axis_values('ritardo')[None, :, None, None, None]
+    calo = axis_values('calo_ebitda')[None, None, :, None, None] / 100
+    tassi = axis_values('tassi')[None, None, None, :, None] / 10_000
+    a = np.asarray(anni)
+    utile = sustain['Utile Netto (€M)'].to_numpy(dtype=float)
+    ebitda = debt['EBITDA (€M)'].to_numpy(dtype=float)
+
+    # Tasse: differenza rispetto allo scenario di base, con la stessa dinamica del modello
+    delta_utile = np.zeros(tasse.shape[:1] + (1, 1, 1, len(anni)))
+    apply_drivers(delta_utile, a, tasse - tasse_base, ipotesi.mitigazione, 0.0, anno_kindred)
+    delta_ebitda = delta_utile / (1 - ALIQUOTA_IS)
+    # Ritardo Kindred: l'effetto sull'utile parte da anno_kindred + ritardo
+    perso = (a >= anno_kindred) & (a < anno_kindred + ritardo)
+    delta_kindred = -np.where(perso, utile * kindred_base / (1 + kindred_base), 0.0)
+    delta_utile = delta_utile + delta_kindred
+    delta_ebitda = delta_ebitda + delta_kindred / (1 - ALIQUOTA_IS)
+    # Calo dell'EBITDA e rialzo dei tassi sul debito di acquisizione
+    delta_ebitda = delta_ebitda - calo * ebitda
+    delta_utile = delta_utile - calo * ebitda * (1 - ALIQUOTA_IS) - debito_kindred * tassi * (1 - ALIQUOTA_IS)
+
+    copertura = (sustain['FCF (€M)'].to_numpy(dtype=float) + delta_utile) / sustain['Dividendo Totale (€M)'].to_numpy(dtype=float)
+    debito = debt['Debito Netto (€M)'].to_numpy(dtype=float) - np.cumsum(delta_utile, axis=-1)
+    leva = np.maximum(debito / (ebitda + delta_ebitda), 0)
+
+    forma = tuple(len(axis_values(n)) for n in ASSI_STRESS) + (len(anni),)
+    return RisultatoStress(
+        anni=anni,
+        copertura=np.broadcast_to(copertura, forma),
+        leva=np.broadcast_to(leva, forma),
+        probabilita=probabilita_griglia(ipotesi),
+    )
+
+
+@st.cache_data(show_spinner=False, max_entries=64)
+def stress_summary(df_sustain, df_debt, tasse_base, kindred_base, asse_x, asse_y, ipotesi=IpotesiStress()):
+    """Mappa, tabella delle violazioni e scenari critici (poche righe, in cache per scenario)."""
+    risultato = stress_test(df_sustain, df_debt, tasse_base, kindred_base, ipotesi)
+    return risultato.mappa(asse_x, asse_y), risultato.tabella_violazioni(), risultato.scenari_critici()
@@ -1,15 +1,27 @@
 # -*- coding: utf-8 -*-
 import streamlit as st
 import pandas as pd
-import plotly.express as px
-import plotly.graph_objects as go
-from plotly.subplots import make_subplots
-import numpy as np
 import os # Importa il modulo os per verificare l'esistenza del file
+from collections import ChainMap
+
+from fdj.data import ANNO_ULTIMO_DPS, TICKER, get_arrow_table, get_info, get_tables, list_tickers, load_dataset
+from fdj.dataset import dataset_path
+from fdj.figures import get_figure
+from fdj.analysis import SOURCE_TAG_PATTERN, find_citations, load_documents, source_ids
+from fdj.ricerca import search
+from fdj.metriche import calcola
+from fdj.peers import N_PEER_GRAFICO, TIPO_INDICE, compare as compare_peers, load_universe
+from fdj.prezzi import load_storico, serie_grafico
+from fdj.drip import ORIZZONTI_ANNI, RITENUTA_PREDEFINITA, distribuzione, istogramma, proiezione_posizione
+from fdj.portafoglio import carica_portafoglio, proiezione_portafoglio
+from fdj.stress import ASSI_STRESS, ETICHETTE_ASSI, SOGLIA_COPERTURA, SOGLIA_LEVA, stress_summary
+from fdj.montecarlo import SimulationParams, dps_percentiles
+from fdj.scenari import get_scenario_cube
+from fdj import profilo
 
 # --- Configurazione Pagina ---
 st.set_page_config(
-    page_title="Analisi Dividendi FDJ",
+    page_title="Analisi Dividendi",
     page_icon="💰",
     layout="wide", # Utilizza l'intera larghezza della pagina
     initial_sidebar_state="collapsed"
@@ -35,6 +47,15 @@ def set_page_style():
         background-color: #4F8BF9;
         color: white;
     }
+    div[role="radiogroup"][aria-label="Sezione"] {
+        gap: 10px;
+    }
+    div[role="radiogroup"][aria-label="Sezione"] label {
+        background-color: #f0f2f6;
+        border-radius: 4px;
+        padding: 10px 15px;
+        font-weight: 500;
+    }
     .metric-card {
         background-color: white;
         border-radius: 10px;
@@ -49,779 +70,730 @@ def set_page_style():
 
 set_page_style()
 
-# --- Dati Chiave Estratti (da Testo e PDF) ---
-TICKER = "FDJ.PA"
-NOME_SOCIETA = "Française des Jeux"
-ULTIMO_DPS_PAGATO_VAL = 1.78 # Relativo all'esercizio 2023 [source: 4]
-ANNO_ULTIMO_DPS = 2023
-PREZZO_RIFERIMENTO_APPROX = 30.0 # Prezzo approssimativo menzionato nel testo [source: 13]
-POLITICA_PAYOUT = "80-90% Utile Netto (dal 2022)" # [source: 3]
-DPS_ATTESO_2024_VAL = 2.05 # [source: 54]
-CRESCITA_ATTESA_DPS_2024 = "+15%" # [source: 54]
-IMPATTO_KINDRED_DIVIDENDO = "+10% addizionale dal 2026 (utile 2025)" # [source: 57]
-RISCHIO_TASSE_2025 = "€90M impatto EBITDA/anno da metà 2025" # [source: 180, 181]
-MITIGAZIONE_TASSE = "Piani per compensare impatto entro 2027" # [source: 183]
-
-# Dati storici Dividendo Per Azione (DPS) [source: 4, 5, 6]
-dps_storico_data = {
-    'Anno Esercizio': [2019, 2020, 2021, 2022, 2023],
-    'DPS (€)': [0.45, 0.90, 1.24, 1.37, 1.78]
-}
-df_dps = pd.DataFrame(dps_storico_data)
-
-# Dati Finanziari Chiave (Estratti da PDF - 31/12 date) [source: 300, 306, 307]
-# Usiamo 2021, 2022, 2023, LTM (che nel PDF è colonna 31/12/24)
-fin_data = {
-    'Metrica': [
-        'Ricavi Totali (€M)',
-        'Utile Netto (€M)',
-        'EPS Diluito (€)',
-        'Cash Flow Operativo (CFO, €M)',
-        'Capex (€M)',
-        'Free Cash Flow (FCF, €M)',
-        'Debito Netto / EBITDA (Leva)',
-        'Dividendo per Azione (DPS, €)'
-    ],
-    '2021': [
-        2255.7, # Revenue
-        294.2,  # Net Income
-        1.54,   # Diluted EPS
-        602.9,  # CFO
-        -75.5,  # Capex (negativo nel PDF Cash Flow, ma è un outflow)
-        527.4,  # FCF (CFO + Capex - assumendo Capex sia negativo)
-        "Cassa Netta", # FDJ aveva cassa netta fino a fine 2023 [source: 254]
-        1.24    # DPS [source: 9]
-        ],
-    '2022': [
-        2461.1, # Revenue
-        307.9,  # Net Income
-        1.61,   # Diluted EPS
-        406.1,  # CFO
-        -104.1, # Capex
-        302.0,  # FCF
-        "Cassa Netta", # [source: 254]
-        1.37    # DPS [source: 9]
-        ],
-    '2023': [
-        2621.5, # Revenue
-        425.1,  # Net Income
-        2.23,   # Diluted EPS
-        628.9,  # CFO
-        -124.7, # Capex
-        504.2,  # FCF
-        "Cassa Netta", # Fine 2023 [source: 254]
-        1.78    # DPS [source: 10]
-        ],
-     # LTM nel PDF corrisponde alla colonna 31/12/24
-     # Nota: L'utile netto 2024 LTM nel PDF (398.8) è inferiore al 2023 (425.1).
-     # La leva è indicata come ~2x post-Kindred (2025) [source: 263]
-    'LTM (31/12/24 PDF)': [
-        3065.1, # Revenue
-        398.8,  # Net Income
-        2.16,   # Diluted EPS
-        577.0,  # CFO
-        -149.9, # Capex
-        427.1,  # FCF
-        "~2.0-2.2x (prospettico post-Kindred)", # [source: 263]
-        "2.05 (atteso ex. 2024)" # [source: 54]
-        ]
-}
-df_fin = pd.DataFrame(fin_data)
-
-# Nuovi dati per grafici aggiuntivi
-
-# 1. Dati Payout Ratio
-payout_data = {
-    'Anno': [2019, 2020, 2021, 2022, 2023, 2024],
-    'Payout Ratio (%)': [80, 80, 83, 80, 80, 82],  # Stime basate sul testo [source: 9, 10]
-    'Note': ['~80% (stima)', '~80% (stima)', '~80-85% (stima)', '~80%', '80%', '~82% (stima)']
-}
-df_payout = pd.DataFrame(payout_data)
-
-# 2. Dati Dividend Yield comparativo
-yield_comp_data = {
-    'Società': ['FDJ', 'OPAP', 'Entain', 'Flutter', 'Media Mercato FR'],
-    'Dividend Yield (%)': [6.0, 7.5, 3.0, 0.5, 3.2],  # Basato su [source: 245, 247]
-    'Tipo': ['Lotterie & Scommesse', 'Lotterie & Scommesse', 'Scommesse Online', 'Scommesse Online', 'Indice']
-}
-df_yield_comp = pd.DataFrame(yield_comp_data)
-
-# 3. Dati Proiezione Dividendi
-forecast_data = {
-    'Anno': [2023, 2024, 2025, 2026],
-    'DPS (€)': [1.78, 2.05, 2.15, 2.37],  # 2025-2026 sono stime basate su testo [source: 57]
-    'Tipo': ['Storico', 'Stima Consenso', 'Proiezione', 'Proiezione Post-Kindred'],
-    'Note': ['Pagato', 'Consenso Analisti', 'Pre-effetto Kindred', 'Con effetto Kindred (+10%)']
-}
-df_forecast = pd.DataFrame(forecast_data)
-
-# 4. Dati Composizione Ricavi
-business_mix_data = {
-    'Segmento': ['Lotterie Francia', 'Scommesse Sportive & Online', 'Lotteria Irlanda', 'Altre Attività'],
-    'Percentuale (%)': [80, 15, 3, 2],  # Basato su [source: 95, 97, 98]
-    'Margine Op. (%)': [30, 20, 28, 15]  # Stime margini operativi dalle descrizioni
-}
-df_business_mix = pd.DataFrame(business_mix_data)
-
-# 5. Dati per Mappa di Calore Rischi
-risk_data = {
-    'Categoria': ['Rischio Normativo (Tasse)', 'Rischio Integrazione M&A', 
-                 'Rischio Leva Finanziaria', 'Rischio Concorrenza Online', 
-                 'Rischio Rinnovo Concessioni'],
-    'Livello (1-10)': [8, 6, 4, 7, 2],  # Basato sull'analisi testuale
-    'Impatto Dividendo': ['Alto', 'Medio', 'Basso', 'Medio', 'Basso'],
-    'Orizzonte': ['Breve (2025)', 'Medio (2025-26)', 'Medio (2025-26)', 'Continuo', 'Lungo (2040+)']
-}
-df_risk = pd.DataFrame(risk_data)
-
-# 6. Dati per Evoluzione Debito e Impatto
-debt_data = {
-    'Anno': [2021, 2022, 2023, 2024, 2025, 2026, 2027],
-    'Debito Netto (€M)': [-450, -350, -671, 300, 1850, 1650, 1450],  # Negativo = cassa netta
-    'EBITDA (€M)': [522, 580, 657, 750, 850, 920, 970],  # Basati su testo e trend
-    'Leva (Debt/EBITDA)': [0, 0, 0, 0.4, 2.2, 1.8, 1.5]  # 0 = cassa netta
+# Profilo del run con ?profile=1 (tempi, allocazioni e byte per blocco, vedi fdj/profilo.py)
+profilo_run = profilo.avvia()
+pannello_profilo = st.container() if profilo_run is not None else None
+
+# --- Società analizzata ---
+# Il ticker è sincronizzato con il parametro ?ticker=... dell'URL; l'elenco viene
+# dal solo indice dei dataset, il bundle viene letto quando il ticker è mostrato
+TICKERS = list_tickers()
+if 'ticker' not in st.session_state:
+    ticker_richiesto = st.query_params.get('ticker')
+    st.session_state['ticker'] = ticker_richiesto if ticker_richiesto in TICKERS else TICKER
+if len(TICKERS) > 1:
+    st.selectbox("Società", options=list(TICKERS), format_func=lambda t: f"{TICKERS[t]} ({t})", key='ticker')
+ticker = st.session_state['ticker']
+if st.query_params.get('ticker', TICKER) != ticker:
+    st.query_params['ticker'] = ticker
+
+# --- Dati della dashboard (costruiti una volta per processo, vedi fdj/data.py) ---
+with profilo.sezione("dati"):
+    info = get_info(ticker)
+    societa = info['nome']
+    tables = get_tables(ticker)
+    df_dps = tables['dps']
+    df_fin = tables['fin']
+    df_payout = tables['payout']
+    df_yield_comp = tables['yield_comp']
+    df_forecast = tables['forecast']
+    df_business_mix = tables['business_mix']
+    df_risk = tables['risk']
+    df_debt = tables['debt']
+    # Storico prezzi e rendimenti (None se non importato, vedi fdj/prezzi.py)
+    storico_prezzi = load_storico()
+    df_storico_prezzi = serie_grafico(storico_prezzi, ticker)
+
+    # File di analisi del ticker (percorsi relativi alla cartella del dataset).
+    # Il parsing in sezioni e l'indice delle citazioni avvengono una volta per processo, vedi fdj/analysis.py
+    analysis_documents, analysis_errors = load_documents(
+        [os.path.join(os.path.dirname(dataset_path(ticker)), name) for name in info.get('analisi', [])]
+    )
+    fonti_dataset = load_dataset(ticker).fonti
+
+# Lunghezza massima dei passaggi citati riportati nei tooltip
+CARATTERI_PASSAGGIO = 200
+
+def tag_fonti(chiave):
+    """Tag ``[source: ...]`` del dato ``chiave`` secondo i riferimenti del dataset ("" se assenti)."""
+    ids = fonti_dataset.get(chiave, ())
+    return f" [source: {', '.join(str(n) for n in ids)}]" if ids else ""
+
+def commento(testo):
+    """Commento dell'analisi FDJ da aggiungere a una didascalia: mostrato solo per il ticker predefinito."""
+    return f" {testo}" if ticker == TICKER else ""
+
+def cita(testo, passaggi=False):
+    """Collega i tag ``[source: N]`` di ``testo`` ai passaggi citati nell'analisi.
+
+    Ogni id presente nell'indice delle citazioni diventa un link ``?fonte=N``
+    che apre la sezione del passaggio; con ``passaggi=True`` (tooltip) il
+    testo citato è riportato in coda. I tag senza passaggi restano invariati.
+    """
+    citati = []
+
+    def sostituisci(match):
+        ids = source_ids(match.group())
+        trovati = {n: find_citations(analysis_documents, n) for n in ids}
+        if not any(trovati.values()):
+            return match.group()
+        citati.extend((n, d, c) for n in ids for d, c in trovati[n])
+        sezione = st.query_params.get('sezione', 'storico')
+        return " [" + ", ".join(f"[{n}](?ticker={ticker}&sezione={sezione}&fonte={n})" if trovati[n] else str(n) for n in ids) + "]"
+
+    testo = SOURCE_TAG_PATTERN.sub(sostituisci, testo)
+    if passaggi and citati:
+        testo += "".join(
+            f"\n\n> [{n}] «{analysis_documents[d].passage(c)[:CARATTERI_PASSAGGIO]}» (*{analysis_documents[d].sections[c.section].title}*)"
+            for n, d, c in citati
+        )
+    return testo
+
+# Numero di percorsi della simulazione Monte Carlo del dividendo
+N_PERCORSI_SIMULAZIONE = 1_000_000
+# Esercizi proiettati per il portafoglio, dal primo successivo all'ultimo DPS pagato
+N_ANNI_PORTAFOGLIO = 3
+
+# --- Scenario (input dell'utente) ---
+# Valori iniziali dei controlli di scenario. Riassegnarli a ogni rerun evita che
+# Streamlit li scarti quando il widget non è visibile (es. sezione non attiva).
+# Con lo storico dei prezzi il prezzo iniziale è l'ultima chiusura (nei limiti del controllo)
+if df_storico_prezzi is not None:
+    prezzo_iniziale = min(max(round(float(df_storico_prezzi['Chiusura'].iloc[-1]), 2), 10.0), 60.0)
+else:
+    prezzo_iniziale = info['prezzo_riferimento']
+SCENARIO_DEFAULTS = {
+    'scenario_prezzo': prezzo_iniziale,
+    'scenario_payout': (80, 90),
+    'scenario_tasse': 90,
+    'scenario_kindred': 10,
+    'drip_investimento': 10_000,
+    'drip_ritenuta': RITENUTA_PREDEFINITA * 100,
+    'drip_orizzonte': 5,
+    'stress_asse_x': 'tasse',
+    'stress_asse_y': 'calo_ebitda',
 }
-df_debt = pd.DataFrame(debt_data)
+for scenario_key, scenario_default in SCENARIO_DEFAULTS.items():
+    st.session_state[scenario_key] = st.session_state.get(scenario_key, scenario_default)
+# Settori del confronto con i peer (nessuno = intero universo)
+st.session_state['peer_settori'] = st.session_state.get('peer_settori', [])
+
+# Cubo degli scenari precalcolato (memory-mapped, condiviso tra processi, vedi fdj/scenari.py).
+# Il modello di scenario (tasse 2025, Kindred) è calibrato sull'analisi FDJ: per le
+# società senza modello le sezioni mostrano solo i dati del dataset
+modello_scenari = info.get('modello_scenari', False)
+scenario_cube = get_scenario_cube() if modello_scenari else None
+
+def scenario_corrente():
+    """Coordinate dello scenario selezionato nel cubo (payout al centro dell'intervallo scelto)."""
+    payout_min, payout_max = st.session_state['scenario_payout']
+    return dict(
+        payout=(payout_min + payout_max) / 2,
+        tasse=st.session_state['scenario_tasse'],
+        kindred=st.session_state['scenario_kindred']
+    )
 
-# Calcolo Trailing Dividend Yield
-trailing_yield = (ULTIMO_DPS_PAGATO_VAL / PREZZO_RIFERIMENTO_APPROX) * 100 if PREZZO_RIFERIMENTO_APPROX else None
+def forecast_scenario(scenario, cube):
+    """Tabella ``forecast`` con le proiezioni dello scenario indicato lette dal cubo."""
+    dps_scenario = cube.sustainability(**scenario).set_index('Anno')['DPS (€)']
+    df_forecast_scenario = get_tables(TICKER)['forecast'].copy()
+    proiezione = df_forecast_scenario['Tipo'].str.startswith('Proiezione')
+    df_forecast_scenario.loc[proiezione, 'DPS (€)'] = df_forecast_scenario.loc[proiezione, 'Anno'].map(dps_scenario).round(2)
+    df_forecast_scenario.loc[df_forecast_scenario['Tipo'] == 'Proiezione Post-Kindred', 'Note'] = f"Con effetto Kindred (+{scenario['kindred']}%)"
+    return df_forecast_scenario
 
 # --- Titolo e Header ---
-st.title(f"💰 Analisi Dividendi: {NOME_SOCIETA} ({TICKER})")
-st.caption(f"Analisi aggiornata al: April 15, 2024. Dati finanziari storici fino a LTM (31/12/2024 dal PDF).")
+st.set_page_config(page_title=f"Analisi Dividendi {societa}")
+st.title(f"💰 Analisi Dividendi: {societa} ({ticker})")
+st.caption(f"Analisi aggiornata al: {info['aggiornamento']}." + commento("Dati finanziari storici fino a LTM (31/12/2024 dal PDF)."))
 st.markdown("---")
 
 # --- Metriche Chiave Dividendo ---
-st.subheader("📊 Indicatori Chiave del Dividendo")
-col1, col2, col3, col4 = st.columns(4)
-with col1:
-    st.metric(
-        label=f"Ultimo DPS Pagato (Esercizio {ANNO_ULTIMO_DPS})",
-        value=f"€ {ULTIMO_DPS_PAGATO_VAL:.2f}",
-        help="Dividendo pagato nel 2024 relativo all'esercizio 2023."
-    )
-with col2:
-    st.metric(
-        label=f"Dividend Yield (Trailing Approx.)",
-        value=f"{trailing_yield:.1f}%" if trailing_yield is not None else "N/A",
-        help=f"Basato sull'ultimo DPS (€{ULTIMO_DPS_PAGATO_VAL:.2f}) e un prezzo di riferimento approssimativo di €{PREZZO_RIFERIMENTO_APPROX:.2f}. Il testo menziona stime forward yield del 6-7% [source: 13, 14]."
-    )
-with col3:
-    st.metric(
-        label="Politica di Payout",
-        value=POLITICA_PAYOUT,
-        help="Politica dichiarata dalla società per la distribuzione degli utili netti. [source: 3]"
-    )
-with col4:
-    st.metric(
-        label="DPS Atteso (Esercizio 2024)",
-        value=f"€ {DPS_ATTESO_2024_VAL:.2f} ({CRESCITA_ATTESA_DPS_2024})",
-        help=f"Previsione basata su analisi [source: 54]. Ulteriore potenziale rialzo {IMPATTO_KINDRED_DIVIDENDO} [source: 57]."
-    )
+# Frammento: cambiare il prezzo di riferimento riesegue solo questo blocco
+@st.fragment
+def render_kpi():
+    col_titolo, col_prezzo = st.columns([3, 1])
+    with col_titolo:
+        st.subheader("📊 Indicatori Chiave del Dividendo")
+    with col_prezzo:
+        st.number_input(
+            "Prezzo di riferimento (€)",
+            min_value=10.0,
+            max_value=60.0,
+            step=0.5,
+            format="%.2f",
+            key='scenario_prezzo',
+            help=cita("Prezzo usato per il calcolo del dividend yield. Il valore iniziale è il prezzo approssimativo menzionato nel testo" + tag_fonti('prezzo_riferimento') + ".", passaggi=True)
+        )
+    prezzo_riferimento = st.session_state['scenario_prezzo']
+
+    # Trailing Dividend Yield: DPS dell'ultimo esercizio pagato al prezzo di riferimento (lettura dal cubo)
+    if scenario_cube is not None:
+        trailing_yield = scenario_cube.dividend_yield(prezzo_riferimento, anno=info['anno_ultimo_dps'], **scenario_corrente())
+    else:
+        trailing_yield = info['ultimo_dps'] / prezzo_riferimento * 100
+
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        st.metric(
+            label=f"Ultimo DPS Pagato (Esercizio {info['anno_ultimo_dps']})",
+            value=f"€ {info['ultimo_dps']:.2f}",
+            help=cita(f"Dividendo pagato nel {info['anno_ultimo_dps'] + 1} relativo all'esercizio {info['anno_ultimo_dps']}." + tag_fonti('ultimo_dps'), passaggi=True)
+        )
+    with col2:
+        st.metric(
+            label=f"Dividend Yield (Trailing Approx.)",
+            value=f"{trailing_yield:.1f}%" if trailing_yield is not None else "N/A",
+            help=cita(f"Basato sull'ultimo DPS (€{info['ultimo_dps']:.2f}) e un prezzo di riferimento di €{prezzo_riferimento:.2f}." + commento("Il testo menziona stime forward yield del 6-7% [source: 13, 14]."), passaggi=True)
+        )
+    with col3:
+        st.metric(
+            label="Politica di Payout",
+            value=info['politica_payout'],
+            help=cita("Politica dichiarata dalla società per la distribuzione degli utili netti." + tag_fonti('politica_payout'), passaggi=True)
+        )
+    with col4:
+        st.metric(
+            label=f"DPS Atteso (Esercizio {info['anno_ultimo_dps'] + 1})",
+            value=f"€ {info['dps_atteso']:.2f} ({info['crescita_attesa_dps']})",
+            help=cita("Previsione basata su analisi" + tag_fonti('dps_atteso') + "."
+                      + (f" Ulteriore potenziale rialzo {info['impatto_kindred_dividendo']}" + tag_fonti('impatto_kindred_dividendo') + "." if 'impatto_kindred_dividendo' in info else ""),
+                      passaggi=True)
+        )
+
+with profilo.sezione("KPI"):
+    render_kpi()
 st.markdown("---")
 
-# --- Tab per organizzare i grafici ---
-tabs = st.tabs(["Dividendi Storici", "Proiezioni Future", "Mix di Business", "Analisi Comparativa", "Rischi e Debito"])
+# --- Sezioni dei grafici ---
+# Ogni sezione è una funzione: viene eseguita (e i suoi grafici inviati al browser)
+# solo quando è quella selezionata, invece di costruire tutte le schede a ogni rerun.
 
 # TAB 1: Dividendi Storici
-with tabs[0]:
+def render_payout():
+    st.subheader("🔄 Evoluzione del Payout Ratio")
+    st.plotly_chart(get_figure('payout', df_payout, societa=societa), use_container_width=True)
+    st.caption("Fonte: Analisi del testo e dati finanziari." + commento(f"{societa} ha mantenuto un payout ratio consistente nell'intervallo 80-85% in linea con la politica dichiarata."))
+
+def render_dividendi_storici():
     col1, col2 = st.columns(2)
     
     with col1:
         # --- Grafico Storico DPS ---
         st.subheader("📈 Crescita Storica del Dividendo per Azione")
-        fig_dps = px.line(
-            df_dps,
-            x='Anno Esercizio',
-            y='DPS (€)',
-            title="Andamento DPS FDJ (Esercizi 2019-2023)",
-            markers=True,
-            text='DPS (€)'  # Mostra i valori sul grafico
-        )
-        fig_dps.update_traces(textposition="top center", line=dict(width=3, color='#1f77b4'))
-        fig_dps.update_layout(xaxis_title="Anno Esercizio Fiscale", yaxis_title="Dividendo per Azione (€)",
-                            hovermode="x unified", height=400)
-        st.plotly_chart(fig_dps, use_container_width=True)
-        st.caption("Fonte: Dati estratti da Analisi_FDJ.txt [source: 4, 5, 6] e TIKR PDF [source: 300]. Nota la forte crescita post-IPO.")
+        st.plotly_chart(get_figure('dps', df_dps, societa=societa), use_container_width=True)
+        st.caption(cita(f"Fonte: Dati estratti dall'analisi di {societa}{tag_fonti('tables.dps')} e dai dati finanziari{tag_fonti('tables.fin')}."
+                        + commento("Nota la forte crescita post-IPO.")))
     
     with col2:
-        # NUOVO GRAFICO 1: Payout Ratio
-        st.subheader("🔄 Evoluzione del Payout Ratio")
-        fig_payout = px.bar(
-            df_payout,
-            x='Anno',
-            y='Payout Ratio (%)',
-            text='Payout Ratio (%)',
-            color='Payout Ratio (%)',
-            color_continuous_scale='Blues',
-            title="Payout Ratio FDJ (% Utile Netto Distribuito)",
-            hover_data=['Note']
-        )
-        fig_payout.update_layout(coloraxis_showscale=False)
-        fig_payout.update_traces(texttemplate='%{text}%', textposition='inside')
-        fig_payout.update_layout(yaxis_range=[0, 100], height=400)
-        st.plotly_chart(fig_payout, use_container_width=True)
-        st.caption("Fonte: Analisi del testo e dati finanziari. FDJ ha mantenuto un payout ratio consistente nell'intervallo 80-85% in linea con la politica dichiarata.")
+        if df_storico_prezzi is not None:
+            # Rendimento storico giorno per giorno (punti settimanali) accanto al DPS
+            st.subheader("📉 Dividend Yield Storico")
+            st.plotly_chart(get_figure('yield_history', df_storico_prezzi), use_container_width=True)
+            st.caption("Trailing: dividendi con data ex negli ultimi 12 mesi; forward: stacchi noti nei 12 mesi successivi. Fonte: storico prezzi e dividendi importato (fdj/prezzi.py).")
+        else:
+            # NUOVO GRAFICO 1: Payout Ratio
+            render_payout()
+
+    if df_storico_prezzi is not None:
+        render_payout()
     
     # --- Tabella Finanziaria Riassuntiva ---
     st.subheader("🔢 Tabella Finanziaria Riassuntiva")
-    st.dataframe(df_fin.set_index('Metrica'), use_container_width=True)
-    st.caption("Fonte: Dati estratti da TIKR PDF (colonna 31/12/24 usata come LTM) [source: 300, 303, 306]. FCF calcolato come CFO - Capex. Leva Finanziaria indicata come da testo analisi. L'Utile Netto LTM 2024 è risultato inferiore al 2023 nel PDF.")
+    # Tabella Arrow in memory-map: passata a st.dataframe senza conversione da pandas
+    st.dataframe(
+        get_arrow_table('fin', ticker),
+        hide_index=True,
+        use_container_width=True,
+        column_config={periodo: st.column_config.NumberColumn(format="%.2f") for periodo in df_fin.select_dtypes('number').columns},
+    )
+    st.caption(cita("Fonte: Dati estratti da TIKR PDF (colonna 31/12/24 usata come LTM) [source: 300, 303, 306]. FCF, payout (DPS/EPS) e yield al prezzo di riferimento sono metriche derivate. Celle vuote = dato non applicabile (es. leva in presenza di cassa netta), vedi colonna Note. L'Utile Netto LTM 2024 è risultato inferiore al 2023 nel PDF."))
 
+    render_reinvestimento()
+
+
+# Reinvestimento dei dividendi e rendimento totale di una posizione (vedi fdj/drip.py)
+# Frammento: importo, ritenuta e orizzonte rieseguono solo questo blocco
+@st.fragment
+def render_reinvestimento():
+    st.subheader("♻️ Reinvestimento dei Dividendi (DRIP)")
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        investimento = st.number_input("Importo investito (€)", min_value=1_000, max_value=10_000_000, step=1_000, key='drip_investimento')
+    with col2:
+        ritenuta = st.slider("Ritenuta sui dividendi (%)", min_value=0.0, max_value=50.0, step=0.1, key='drip_ritenuta',
+                             help="Ritenuta applicata a ogni dividendo prima del reinvestimento. Valore iniziale: ritenuta francese per i non residenti (12,8%).") / 100
+    with col3:
+        anni = st.selectbox("Orizzonte storico (anni)", options=ORIZZONTI_ANNI, key='drip_orizzonte')
+    prezzo = st.session_state['scenario_prezzo']
 
-# TAB 2: Proiezioni Future
-with tabs[1]:
     col1, col2 = st.columns(2)
-    
+    with col1:
+        # Posizione acquistata oggi con i DPS attesi del dataset, reinvestiti al prezzo di riferimento
+        previsti = df_forecast[df_forecast['Anno'] > info['anno_ultimo_dps']]
+        df_posizione = proiezione_posizione(previsti['Anno'], previsti['DPS (€)'], prezzo, investimento, ritenuta)
+        st.dataframe(
+            df_posizione,
+            hide_index=True,
+            use_container_width=True,
+            column_config={
+                'Anno': st.column_config.NumberColumn(format="%d"),
+                **{c: st.column_config.NumberColumn(format="%.2f") for c in df_posizione.columns if c != 'Anno'},
+            },
+        )
+        st.caption(f"Posizione di €{investimento:,.0f} al prezzo di riferimento (€{prezzo:.2f}) con i DPS attesi del dataset, "
+                   f"al netto della ritenuta del {ritenuta:.1%}; con il DRIP ogni dividendo è reinvestito allo stesso prezzo.")
+
+    with col2:
+        if df_storico_prezzi is None:
+            st.info("Senza storico dei prezzi (vedi fdj/prezzi.py) la simulazione sulle date di acquisto storiche non è disponibile.")
+            return
+        # Tutte le date di acquisto dello storico, in un'unica passata
+        sedute = storico_prezzi.sedute(ticker)
+        stacchi = storico_prezzi.stacchi(ticker)
+        df_istogramma = istogramma(*sedute, *stacchi, anni, ritenuta)
+        if df_istogramma is None:
+            st.info(f"Lo storico dei prezzi è più breve dell'orizzonte di {anni} anni.")
+        else:
+            st.plotly_chart(get_figure('drip', df_istogramma, anni=anni), use_container_width=True)
+            st.caption("Ogni data dello storico è un possibile acquisto in chiusura: il DRIP reinveste i dividendi netti alla chiusura della data ex, "
+                       "l'alternativa li incassa senza reinvestirli.")
+
+    df_distribuzione = distribuzione(*sedute, *stacchi, ritenuta)
+    st.dataframe(df_distribuzione, hide_index=True, use_container_width=True,
+                 column_config={c: st.column_config.NumberColumn(format="%.1f") for c in df_distribuzione.columns if c.endswith('(%)')})
+    st.caption("Percentili del rendimento annuo composto (prezzo + dividendi netti) su tutte le date di acquisto con orizzonte completo.")
+
+
+# Proiezioni dello scenario selezionato (cubo degli scenari) e simulazione Monte Carlo del DPS
+# Frammento: i controlli di scenario rieseguono solo questo blocco
+def render_controlli_scenario():
+    """Controlli dello scenario (condivisi dalle sezioni Proiezioni Future e Rischi e Debito)."""
+    st.subheader("🎛️ Scenario di Proiezione")
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.slider("Payout ratio (% utile netto)", min_value=50, max_value=100, step=1, key='scenario_payout',
+                  help=cita("Intervallo in cui viene estratto il payout di ogni anno. Politica dichiarata: 80-90% [source: 3].", passaggi=True))
+    with col2:
+        st.slider("Impatto tasse 2025 (€M EBITDA/anno)", min_value=0, max_value=200, step=10, key='scenario_tasse',
+                  help=cita("Impatto annuo pieno delle nuove tasse sul gioco in Francia, da metà 2025 [source: 180, 181].", passaggi=True))
+    with col3:
+        st.slider("Effetto Kindred sul dividendo (%)", min_value=0, max_value=25, step=1, key='scenario_kindred',
+                  help=cita(f"Incremento del dividendo dal 2026 grazie a Kindred. Indicazione societaria: {info['impatto_kindred_dividendo']} [source: 57].", passaggi=True))
+    return scenario_corrente()
+
+
+@st.fragment
+def render_scenario_proiezioni():
+    scenario = render_controlli_scenario()
+
+    col1, col2 = st.columns(2)
+
     with col1:
         # NUOVO GRAFICO 2: Proiezione Futura Dividendi
         st.subheader("🔮 Proiezione Dividendi 2023-2026")
-        fig_forecast = px.line(
-            df_forecast,
-            x='Anno',
-            y='DPS (€)',
-            color='Tipo',
-            title="Proiezione Dividendi FDJ 2023-2026",
-            markers=True,
-            text='DPS (€)',
-            hover_data=['Note']
-        )
-        fig_forecast.update_traces(textposition="top right")
-        
-        # Aggiungiamo l'annotazione per l'impatto Kindred
-        fig_forecast.add_annotation(
-            x=2026, y=2.37,
-            text="Effetto Kindred (+10%)",
-            showarrow=True,
-            arrowhead=1,
-            ax=-40, ay=-40
-        )
-        
-        # Aggiungiamo l'annotazione per le nuove tasse
-        fig_forecast.add_annotation(
-            x=2025, y=2.15,
-            text="Impatto nuove tasse 2025",
-            showarrow=True,
-            arrowhead=1,
-            ax=40, ay=40
-        )
-        
-        fig_forecast.update_layout(height=450)
-        st.plotly_chart(fig_forecast, use_container_width=True)
-        st.caption("Fonte: Analisi del testo e comunicazioni societarie. Il valore 2024 basato su consenso analisti, 2025-2026 sono proiezioni che considerano l'impatto delle nuove tasse e l'acquisizione di Kindred (effetto +10% atteso dal 2026).")
-    
+        # Le proiezioni 2025-2026 sono lette dal cubo per lo scenario selezionato
+        df_forecast_scenario = forecast_scenario(scenario, scenario_cube)
+        st.plotly_chart(get_figure('forecast', df_forecast_scenario, societa=societa), use_container_width=True)
+        st.caption(f"Fonte: Analisi del testo e comunicazioni societarie. Il valore 2024 basato su consenso analisti, 2025-2026 sono proiezioni dello scenario selezionato "
+                   f"(payout {scenario['payout']:.0f}%, tasse €{scenario['tasse']}M/anno, effetto Kindred +{scenario['kindred']}% dal 2026) con le ipotesi medie della simulazione.")
+
     with col2:
-        # NUOVO GRAFICO 3: Crescita CAGR
-        st.subheader("📊 Tasso di Crescita Composto (CAGR)")
-        
-        # Calcoliamo CAGR per diversi periodi
-        cagr_data = {
-            'Periodo': ['2019-2023', '2021-2023', '2023-2026E'],
-            'CAGR (%)': [
-                ((df_dps['DPS (€)'].iloc[-1] / df_dps['DPS (€)'].iloc[0]) ** (1/4) - 1) * 100,
-                ((df_dps['DPS (€)'].iloc[-1] / df_dps['DPS (€)'].iloc[2]) ** (1/2) - 1) * 100,
-                ((df_forecast['DPS (€)'].iloc[-1] / df_forecast['DPS (€)'].iloc[0]) ** (1/3) - 1) * 100
-            ],
-            'Descrizione': [
-                'CAGR dall\'IPO',
-                'CAGR ultimi 2 anni',
-                'CAGR proiettato'
-            ]
-        }
-        df_cagr = pd.DataFrame(cagr_data)
-        
-        # Grafico CAGR
-        fig_cagr = px.bar(
-            df_cagr,
-            y='Periodo',
-            x='CAGR (%)',
-            text='CAGR (%)',
-            color='CAGR (%)',
-            color_continuous_scale='Greens',
-            orientation='h',
-            title="Tasso di Crescita Composto (CAGR) Dividendo FDJ",
-            hover_data=['Descrizione']
+        # Simulazione Monte Carlo del DPS (vedi fdj/montecarlo.py)
+        st.subheader("🎲 Simulazione Monte Carlo 2025-2027")
+        payout_min, payout_max = st.session_state['scenario_payout']
+        sim_params = SimulationParams(
+            payout_min=payout_min / 100,
+            payout_max=payout_max / 100,
+            impatto_tasse_media=float(scenario['tasse']),
+            uplift_kindred_media=scenario['kindred'] / 100
         )
-        fig_cagr.update_traces(texttemplate='%{x:.1f}%', textposition='outside')
-        fig_cagr.update_layout(coloraxis_showscale=False, height=450)
-        st.plotly_chart(fig_cagr, use_container_width=True)
-        st.caption("Fonte: Calcoli basati sui dati dividendi storici e proiezioni. Il CAGR dall'IPO (2019) è influenzato dal raddoppio iniziale del dividendo.")
-        
+        df_dps_sim = dps_percentiles(sim_params, n_paths=N_PERCORSI_SIMULAZIONE)
+        st.plotly_chart(get_figure('dps_fan', df_dps_sim, societa=societa), use_container_width=True)
+        st.caption(cita(f"Simulazione su {format(N_PERCORSI_SIMULAZIONE, '_').replace('_', '.')} percorsi: crescita dell'utile {sim_params.crescita_media:.0%} ± {sim_params.crescita_std:.0%} annuo, "
+                   f"payout estratto nell'intervallo {sim_params.payout_min:.0%}-{sim_params.payout_max:.0%} [source: 3], "
+                   f"impatto tasse €{sim_params.impatto_tasse_media:.0f}M ± {sim_params.impatto_tasse_std:.0f}M di EBITDA/anno da metà 2025 con mitigazione del "
+                   f"{sim_params.mitigazione_min:.0%}-{sim_params.mitigazione_max:.0%} entro il 2027 [source: 180, 183], "
+                   f"effetto Kindred +{sim_params.uplift_kindred_media:.0%} ± {sim_params.uplift_kindred_std:.0%} dal {sim_params.anno_kindred} [source: 57]. "
+                   f"Le bande indicano gli intervalli 5-95% e 25-75% dei percorsi simulati."))
+
+    # NUOVO GRAFICO 3: Crescita CAGR
+    st.subheader("📊 Tasso di Crescita Composto (CAGR)")
+
+    # Il DPS proiettato dello scenario è un input del CAGR: si ricalcolano solo le metriche che ne dipendono
+    # (ChainMap: le altre tabelle non vengono lette né copiate)
+    tables_scenario = calcola(ChainMap({'forecast': df_forecast_scenario}, tables), modificati={'forecast.DPS (€)'})
+    st.plotly_chart(get_figure('cagr', tables_scenario['cagr'], societa=societa), use_container_width=True)
+    st.caption("Fonte: Calcoli basati sui dati dividendi storici e proiezioni; il CAGR 2023-2026E segue lo scenario selezionato. Il CAGR dall'IPO (2019) è influenzato dal raddoppio iniziale del dividendo.")
+
+
+# TAB 2: Proiezioni Future
+def render_proiezioni_future():
+    if modello_scenari:
+        render_scenario_proiezioni()
+    else:
+        st.subheader("🔮 Proiezione Dividendi")
+        st.plotly_chart(get_figure('forecast', df_forecast, societa=societa), use_container_width=True)
+        st.plotly_chart(get_figure('cagr', tables['cagr'], societa=societa), use_container_width=True)
+        st.info("Il modello di scenario e la simulazione Monte Carlo non sono disponibili per questa società.")
+        return
+
     # Analisi impatto tasse e acquisizione Kindred
     st.subheader("⚠️ Impatto delle Nuove Tasse 2025 e Acquisizione Kindred")
     
     col1, col2, col3 = st.columns([1, 1, 1])
     with col1:
-        st.info(f"**Rischio Tasse 2025**\n\n{RISCHIO_TASSE_2025}\n\nImpatto semestrale 2025: €45M\nImpatto annuo pieno: €90M", icon="⚠️")
+        st.info(f"**Rischio Tasse 2025**\n\n{info['rischio_tasse']}\n\nImpatto semestrale 2025: €45M\nImpatto annuo pieno: €90M", icon="⚠️")
     with col2:
-        st.success(f"**Mitigazione Tasse**\n\n{MITIGAZIONE_TASSE}\n\nLa società ha annunciato un piano per compensare completamente l'effetto entro il 2027.", icon="✅")
+        st.success(f"**Mitigazione Tasse**\n\n{info['mitigazione_tasse']}\n\nLa società ha annunciato un piano per compensare completamente l'effetto entro il 2027.", icon="✅")
     with col3:
-        st.info(f"**Effetto Kindred sul Dividendo**\n\n{IMPATTO_KINDRED_DIVIDENDO}\n\nL'acquisizione dovrebbe generare sinergie e flussi di cassa aggiuntivi che supporteranno la crescita del dividendo.", icon="📈")
+        st.info(f"**Effetto Kindred sul Dividendo**\n\n{info['impatto_kindred_dividendo']}\n\nL'acquisizione dovrebbe generare sinergie e flussi di cassa aggiuntivi che supporteranno la crescita del dividendo.", icon="📈")
 
 
 # TAB 3: Mix di Business
-with tabs[2]:
+def render_mix_business():
     col1, col2 = st.columns(2)
     
     with col1:
         # NUOVO GRAFICO 4: Composizione del Business
-        st.subheader("🧩 Composizione del Business FDJ")
-        fig_mix = px.pie(
-            df_business_mix,
-            values='Percentuale (%)',
-            names='Segmento',
-            title="Mix di Business FDJ (% Ricavi)",
-            hole=0.4,
-            color_discrete_sequence=px.colors.qualitative.Set2
-        )
-        fig_mix.update_traces(textposition='inside', textinfo='percent+label')
-        fig_mix.update_layout(height=450)
-        st.plotly_chart(fig_mix, use_container_width=True)
-        st.caption("Fonte: Analisi del testo. Le lotterie francesi costituiscono ancora la maggioranza dei ricavi. Con l'integrazione di Kindred, la componente scommesse e online aumenterà significativamente.")
+        st.subheader(f"🧩 Composizione del Business {societa}")
+        st.plotly_chart(get_figure('mix', df_business_mix, societa=societa), use_container_width=True)
+        st.caption("Fonte: Analisi del testo." + commento("Le lotterie francesi costituiscono ancora la maggioranza dei ricavi. Con l'integrazione di Kindred, la componente scommesse e online aumenterà significativamente."))
     
     with col2:
         # NUOVO GRAFICO 5: Profittabilità per Segmento
         st.subheader("💹 Margine Operativo per Segmento")
-        fig_margin = px.bar(
-            df_business_mix,
-            x='Segmento',
-            y='Margine Op. (%)',
-            text='Margine Op. (%)',
-            color='Segmento',
-            title="Margini Operativi Stimati per Segmento",
-            color_discrete_sequence=px.colors.qualitative.Set2
-        )
-        fig_margin.update_traces(texttemplate='%{text}%', textposition='outside')
-        fig_margin.update_layout(height=450)
-        st.plotly_chart(fig_margin, use_container_width=True)
-        st.caption("Fonte: Stime basate sull'analisi del testo. Le lotterie offrono margini operativi più elevati grazie al regime di monopolio, mentre il segmento delle scommesse online presenta maggiore concorrenza e margini inferiori.")
+        st.plotly_chart(get_figure('margin', df_business_mix), use_container_width=True)
+        st.caption("Fonte: Stime basate sull'analisi del testo." + commento("Le lotterie offrono margini operativi più elevati grazie al regime di monopolio, mentre il segmento delle scommesse online presenta maggiore concorrenza e margini inferiori."))
     
     # Timeline acquisizioni e tappe strategiche
-    st.subheader("📅 Timeline Strategica FDJ")
+    st.subheader(f"📅 Timeline Strategica {societa}")
     
-    timeline_data = {
-        'Anno': ['2019', '2023 (Q2)', '2023 (Q4)', '2024-25', '2025 (H2)', '2027'],
-        'Evento': ['IPO e Concessione Lotterie fino 2044', 
-                  'Acquisizione ZEturf (€175M)', 
-                  'Acquisizione Lotteria Irlanda (€350M)', 
-                  'OPA Kindred (€2,6Mld EV)', 
-                  'Aumento tasse gioco in Francia', 
-                  'Compensazione completa impatto tasse'],
-        'Tipo': ['Milestone', 'M&A', 'M&A', 'M&A', 'Regolatorio', 'Strategia'],
-        'Descrizione': [
-            'Quotazione in borsa e ottenimento concessione esclusiva fino al 2044 per €380M',
-            'Ingresso nel segmento scommesse ippiche online',
-            'Acquisizione del 100% di Premier Lotteries Ireland (PLI), operatore in esclusiva fino al 2034',
-            'Acquisizione trasformativa: creazione di un campione europeo del gioco, diversificazione geografica',
-            'Aumento tasse sui giochi d\'azzardo in Francia - impatto €90M/anno',
-            'Obiettivo di neutralizzare completamente l\'impatto fiscale attraverso efficienze e sinergie'
-        ]
-    }
-    df_timeline = pd.DataFrame(timeline_data)
+    df_timeline = tables['timeline']
     
     # Visualizzazione della timeline
-    fig_timeline = px.scatter(
-        df_timeline, 
-        x='Anno', 
-        y='Tipo',
-        color='Tipo',
-        size=[15]*len(df_timeline),
-        text='Evento',
-        hover_data=['Descrizione'],
-        title="Timeline Strategica di FDJ (2019-2027)"
-    )
-    
-    # Aggiungere connettori tra i punti
-    fig_timeline.update_traces(marker=dict(symbol='diamond', opacity=0.8), selector=dict(mode='markers'))
-    fig_timeline.add_shape(type="line", x0="2019", y0="Milestone", x1="2027", y1="Strategia", 
-                          line=dict(color="lightgrey", width=1, dash="dot"))
-    
-    # Formattare il layout
-    fig_timeline.update_layout(
-        height=300,
-        xaxis=dict(showgrid=False),
-        yaxis=dict(showgrid=False)
-    )
-    
-    st.plotly_chart(fig_timeline, use_container_width=True)
-    st.caption("Fonte: Eventi chiave menzionati nell'analisi testuale. La timeline evidenzia la strategia di trasformazione di FDJ da operatore nazionale di lotterie a gruppo diversificato europeo.")
-
+    st.plotly_chart(get_figure('timeline', df_timeline, societa=societa), use_container_width=True)
+    st.caption("Fonte: Eventi chiave menzionati nell'analisi testuale." + commento(f"La timeline evidenzia la strategia di trasformazione di {societa} da operatore nazionale di lotterie a gruppo diversificato europeo."))
+
+
+# Confronto con l'universo dei peer (vedi fdj/peers.py)
+# Frammento: cambiare il filtro dei settori riesegue solo questo blocco
+@st.fragment
+def render_confronto_peer():
+    universo = load_universe(ticker)
+    # I settori selezionati restano validi anche cambiando universo (es. altro ticker)
+    st.session_state['peer_settori'] = [s for s in st.session_state.get('peer_settori', []) if s in universo.settori]
+    settori = st.multiselect("Settori dei peer", options=list(universo.settori), key='peer_settori', placeholder="Tutti i settori",
+                             help="Limita il confronto alle società dei settori selezionati (nessuna selezione = intero universo).")
+    try:
+        confronto = compare_peers(universo, ticker, settori)
+    except KeyError:
+        st.warning(f"{ticker} non è presente nell'universo dei peer né nelle tabelle di confronto del dataset: confronto non disponibile.")
+        return
 
-# TAB 4: Analisi Comparativa
-with tabs[3]:
     col1, col2 = st.columns(2)
     
     with col1:
         # NUOVO GRAFICO 6: Dividend Yield Comparativo
         st.subheader("📊 Dividend Yield Comparativo")
-        fig_yield = px.bar(
-            df_yield_comp,
-            x='Società',
-            y='Dividend Yield (%)',
-            text='Dividend Yield (%)',
-            color='Tipo',
-            title="Confronto Dividend Yield vs. Competitors",
-            hover_data=['Tipo']
-        )
-        fig_yield.update_traces(texttemplate='%{text:.1f}%', textposition='outside')
-        fig_yield.update_layout(height=450)
-        
-        # Aggiungere linea per la media
-        fig_yield.add_shape(
-            type='line',
-            x0=-0.5,
-            y0=df_yield_comp['Dividend Yield (%)'].mean(),
-            x1=len(df_yield_comp)-0.5,
-            y1=df_yield_comp['Dividend Yield (%)'].mean(),
-            line=dict(color='red', width=2, dash='dash')
-        )
-        
-        fig_yield.add_annotation(
-            x=len(df_yield_comp)-1,
-            y=df_yield_comp['Dividend Yield (%)'].mean(),
-            text=f"Media: {df_yield_comp['Dividend Yield (%)'].mean():.1f}%",
-            showarrow=False,
-            yshift=10
-        )
-        
-        st.plotly_chart(fig_yield, use_container_width=True)
-        st.caption("Fonte: Dati comparativi menzionati nell'analisi testuale. FDJ offre un yield significativamente superiore ai peer delle scommesse online (Entain, Flutter) e leggermente inferiore a OPAP.")
+        # Società, peer più vicini e mediana dei peer, con gli indici di mercato del dataset come riferimento
+        df_yield_peer = pd.concat([confronto.grafico, df_yield_comp[df_yield_comp['Tipo'] == TIPO_INDICE]], ignore_index=True)
+        st.plotly_chart(get_figure('yield', df_yield_peer[['Società', 'Dividend Yield (%)', 'Tipo']], evidenzia=confronto.soggetto,
+                                   mediana=float(confronto.statistiche.loc['Dividend Yield (%)', 'Mediana Peer'])),
+                        use_container_width=True)
+        st.caption("Fonte: Dati comparativi menzionati nell'analisi testuale." + commento(f"{societa} offre un yield significativamente superiore ai peer delle scommesse online (Entain, Flutter) e leggermente inferiore a OPAP."))
     
     with col2:
         # NUOVO GRAFICO 7: Multipli Valutativi (EV/EBITDA)
         st.subheader("🔍 Multipli Valutativi Comparativi")
         
-        valuation_data = {
-            'Società': ['FDJ', 'OPAP', 'Entain', 'Flutter', 'Media Settore'],
-            'EV/EBITDA': [9.8, 8.5, 10.0, 12.5, 10.2],
-            'P/E': [15.0, 13.5, 18.0, 22.0, 17.1],
-            'Tipo': ['Lotterie & Scommesse', 'Lotterie & Scommesse', 'Scommesse Online', 'Scommesse Online', 'Indice']
-        }
-        df_valuation = pd.DataFrame(valuation_data)
-        
         # Grafico multipli
-        fig_multiples = make_subplots(specs=[[{"secondary_y": True}]])
-        
-        fig_multiples.add_trace(
-            go.Bar(
-                x=df_valuation['Società'],
-                y=df_valuation['EV/EBITDA'],
-                name='EV/EBITDA',
-                marker_color='royalblue',
-                text=df_valuation['EV/EBITDA'],
-                textposition='outside'
-            ),
-            secondary_y=False
-        )
-        
-        fig_multiples.add_trace(
-            go.Scatter(
-                x=df_valuation['Società'],
-                y=df_valuation['P/E'],
-                name='P/E',
-                mode='markers+lines+text',
-                marker=dict(size=12, color='firebrick'),
-                line=dict(width=2, dash='dot'),
-                text=df_valuation['P/E'],
-                textposition='top center'
-            ),
-            secondary_y=True
-        )
-        
-        fig_multiples.update_layout(
-            title='Confronto Multipli Valutativi',
-            legend=dict(orientation='h', yanchor='bottom', y=1.02, xanchor='center', x=0.5),
-            height=450
-        )
-        
-        fig_multiples.update_yaxes(title_text="EV/EBITDA", secondary_y=False)
-        fig_multiples.update_yaxes(title_text="P/E", secondary_y=True)
-        
-        st.plotly_chart(fig_multiples, use_container_width=True)
-        st.caption("Fonte: Stime basate sull'analisi testuale e dati di mercato menzionati. FDJ scambia a multipli ragionevoli rispetto al settore, rappresentando un mix di difensività (lotterie) e crescita (espansione digitale/internazionale).")
-    
+        st.plotly_chart(get_figure('multiples', confronto.grafico[['Società', 'EV/EBITDA', 'P/E', 'Tipo']], evidenzia=confronto.soggetto),
+                        use_container_width=True)
+        st.caption("Fonte: Stime basate sull'analisi testuale e dati di mercato menzionati." + commento(f"{societa} scambia a multipli ragionevoli rispetto al settore, rappresentando un mix di difensività (lotterie) e crescita (espansione digitale/internazionale)."))
+
+    # Posizione della società nell'universo filtrato
+    st.dataframe(
+        confronto.statistiche,
+        use_container_width=True,
+        column_config={
+            'Percentile': st.column_config.ProgressColumn(format="%.0f", min_value=0, max_value=100),
+            'Z-score': st.column_config.NumberColumn(format="%+.2f"),
+        },
+    )
+    st.caption(f"Confronto con {confronto.n_peer} peer: mediane, percentile (quota di peer con valore inferiore) e z-score della società. "
+               f"I grafici mostrano i {min(N_PEER_GRAFICO, confronto.n_peer)} peer più vicini sulle metriche standardizzate.")
+
+
+# TAB 4: Analisi Comparativa
+def render_analisi_comparativa():
+    render_confronto_peer()
+
     # Analisi competitiva
-    st.subheader("🔎 Posizionamento Competitivo di FDJ")
-    
-    # Definizione dei dati per la radar chart
-    competitive_data = {
-        'Dimensione': ['Stabilità Flussi di Cassa', 'Rendimento Dividendo', 'Crescita', 'Diversificazione Geografica', 'Barriere all\'Entrata', 'Innovazione Digitale'],
-        'FDJ': [9, 8, 7, 5, 9, 6],
-        'OPAP': [8, 9, 5, 3, 8, 5],
-        'Entain': [6, 4, 8, 8, 4, 8],
-        'Flutter': [5, 1, 9, 9, 4, 9]
-    }
-    df_competitive = pd.DataFrame(competitive_data)
+    st.subheader(f"🔎 Posizionamento Competitivo di {societa}")
     
-    # Conversione a formato "lungo" per radar chart
-    df_comp_long = pd.melt(df_competitive, id_vars=['Dimensione'], var_name='Società', value_name='Punteggio')
+    # Dati per la radar chart in formato "lungo"
+    df_comp_long = tables['competitive_long']
     
     # Creazione radar chart
-    fig_radar = px.line_polar(
-        df_comp_long, 
-        r='Punteggio', 
-        theta='Dimensione', 
-        color='Società', 
-        line_close=True,
-        range_r=[0, 10],
-        title="Analisi Competitiva Radar (Scala 1-10)"
-    )
-    fig_radar.update_traces(fill='toself', opacity=0.4)
-    
-    # Layout
-    fig_radar.update_layout(
-        polar=dict(radialaxis=dict(visible=True, range=[0, 10])),
-        height=500
-    )
-    
-    st.plotly_chart(fig_radar, use_container_width=True)
-    st.caption("Fonte: Analisi qualitativa basata sul testo. FDJ eccelle in stabilità dei flussi di cassa e barriere all'entrata grazie al monopolio delle lotterie, mentre le società più focalizzate sulle scommesse online hanno maggiori punti di forza nella crescita e nell'espansione geografica.")
+    st.plotly_chart(get_figure('radar', df_comp_long), use_container_width=True)
+    st.caption("Fonte: Analisi qualitativa basata sul testo." + commento(f"{societa} eccelle in stabilità dei flussi di cassa e barriere all'entrata grazie al monopolio delle lotterie, mentre le società più focalizzate sulle scommesse online hanno maggiori punti di forza nella crescita e nell'espansione geografica."))
 
 
 # TAB 5: Rischi e Debito
-with tabs[4]:
+# Frammento: i controlli di scenario aggiornano piano del debito, sostenibilità e stress test
+@st.fragment
+def render_rischi_debito():
+    # Debito e sostenibilità dello scenario selezionato (lettura dal cubo, vedi fdj/debito.py)
+    if scenario_cube is not None:
+        scenario = render_controlli_scenario()
+        df_debt_scenario = scenario_cube.debt(**scenario)
+        df_sustain = scenario_cube.sustainability(**scenario)
+    else:
+        df_debt_scenario = df_debt
+        df_sustain = tables['sustain']
+
     col1, col2 = st.columns(2)
     
     with col1:
         # NUOVO GRAFICO 8: Heatmap Rischi
         st.subheader("🔥 Mappa di Calore dei Rischi")
         
-        # Conversione valori categorici in numerici
-        impact_map = {'Basso': 1, 'Medio': 2, 'Alto': 3}
-        df_risk['Impatto_Num'] = df_risk['Impatto Dividendo'].map(impact_map)
-        
         # Creazione heatmap
-        fig_heatmap = px.imshow(
-            df_risk[['Livello (1-10)', 'Impatto_Num']].T,
-            x=df_risk['Categoria'],
-            y=['Probabilità', 'Impatto Dividendo'],
-            color_continuous_scale='Reds',
-            labels=dict(color="Intensità"),
-            title="Mappa di Calore dei Rischi per il Dividendo",
-            text_auto=True
-        )
-        
-        fig_heatmap.update_layout(height=450)
-        st.plotly_chart(fig_heatmap, use_container_width=True)
-        st.caption("Fonte: Analisi qualitativa dei rischi menzionati nel testo. L'aumento delle tasse nel 2025 rappresenta il rischio più rilevante a breve termine per il dividendo.")
+        st.plotly_chart(get_figure('heatmap', df_risk), use_container_width=True)
+        st.caption("Fonte: Analisi qualitativa dei rischi menzionati nel testo." + commento("L'aumento delle tasse nel 2025 rappresenta il rischio più rilevante a breve termine per il dividendo."))
     
     with col2:
         # NUOVO GRAFICO 9: Evoluzione del Debito e Leva Finanziaria
         st.subheader("💰 Evoluzione Debito e Leva Finanziaria")
         
         # Creazione grafico debito e leva
-        fig_debt = make_subplots(specs=[[{"secondary_y": True}]])
-        
-        # Aggiungiamo barre per il debito netto
-        fig_debt.add_trace(
-            go.Bar(
-                x=df_debt['Anno'],
-                y=df_debt['Debito Netto (€M)'],
-                name='Debito Netto (€M)',
-                marker_color=['green' if x < 0 else 'orangered' for x in df_debt['Debito Netto (€M)']],
-                text=[f"Cassa: {-x}M" if x < 0 else f"Debito: {x}M" for x in df_debt['Debito Netto (€M)']],
-                textposition='outside'
-            ),
-            secondary_y=False
-        )
-        
-        # Aggiungiamo linea per la leva
-        fig_debt.add_trace(
-            go.Scatter(
-                x=df_debt['Anno'],
-                y=df_debt['Leva (Debt/EBITDA)'],
-                name='Leva (Debt/EBITDA)',
-                mode='lines+markers+text',
-                marker=dict(size=10),
-                line=dict(width=3, color='navy'),
-                text=df_debt['Leva (Debt/EBITDA)'],
-                textposition='top center'
-            ),
-            secondary_y=True
-        )
-        
-        # Aggiungiamo linea EBITDA
-        fig_debt.add_trace(
-            go.Scatter(
-                x=df_debt['Anno'],
-                y=df_debt['EBITDA (€M)'],
-                name='EBITDA (€M)',
-                mode='lines+markers',
-                marker=dict(size=8),
-                line=dict(width=2, color='green', dash='dash')
-            ),
-            secondary_y=False
-        )
-        
-        # Evidenziamo l'effetto Kindred
-        fig_debt.add_annotation(
-            x=2024.5, 
-            y=1500,
-            text="Acquisizione<br>Kindred",
-            showarrow=True,
-            arrowhead=1,
-            ax=0, 
-            ay=-40
-        )
-        
-        # Evidenziamo l'effetto tasse
-        fig_debt.add_annotation(
-            x=2025, 
-            y=850,
-            text="Impatto<br>Tasse<br>-€90M",
-            showarrow=True,
-            arrowhead=1,
-            ax=0, 
-            ay=-70
-        )
-        
-        # Layout
-        fig_debt.update_layout(
-            title="Evoluzione Debito Netto, EBITDA e Leva Finanziaria (2021-2027E)",
-            legend=dict(orientation='h', yanchor='bottom', y=1.02, xanchor='center', x=0.5),
-            height=450
-        )
-        
-        fig_debt.update_yaxes(title_text="€ Milioni", secondary_y=False)
-        fig_debt.update_yaxes(title_text="Leva (Debt/EBITDA)", secondary_y=True, range=[0, 3])
-        
-        st.plotly_chart(fig_debt, use_container_width=True)
-        st.caption("Fonte: Dati storici e proiezioni basate sull'analisi del testo. FDJ passerà da una posizione di cassa netta a una leva di ~2.2x post-acquisizione di Kindred, per poi ridurla progressivamente nei anni successivi.")
+        if scenario_cube is not None:
+            st.plotly_chart(get_figure('debt', df_debt_scenario, tasse=scenario['tasse']), use_container_width=True)
+            st.caption("Fonte: Debito netto 2021-2023 ed EBITDA dall'analisi; dal 2024 il debito netto avanza con FCF, dividendi pagati ed esborsi per "
+                       "acquisizioni (Kindred €2,6Mld EV), l'EBITDA riflette l'impatto tasse dello scenario. Post-Kindred la leva sale a ~2x "
+                       "per poi ridursi progressivamente.")
+        else:
+            st.plotly_chart(get_figure('debt', df_debt_scenario), use_container_width=True)
+            st.caption("Fonte: Dati storici e proiezioni del dataset della società.")
     
     # Impatto sul Dividendo
     st.subheader("⚖️ Analisi dell'Indebitamento e Sostenibilità del Dividendo")
     
-    # Dati sostenibilità dividendo
-    sustainability_data = {
-        'Anno': [2023, 2024, 2025, 2026, 2027],
-        'Utile Netto (€M)': [425, 399, 380, 430, 470],  # Considerando impatto tasse 2025
-        'DPS (€)': [1.78, 2.05, 2.15, 2.37, 2.50],      # Proiezioni dal testo
-        'Payout Ratio (%)': [80, 82, 85, 83, 80],        # Stimato
-        'Dividendo Totale (€M)': [340, 380, 395, 440, 465]  # Stime approssimative
-    }
-    df_sustain = pd.DataFrame(sustainability_data)
-    
-    # Calcolo FCF - Dividendi
-    df_sustain['FCF (€M)'] = [504, 427, 400, 450, 500]  # Basato su trend e impatto tasse
-    df_sustain['FCF post-Dividendo (€M)'] = df_sustain['FCF (€M)'] - df_sustain['Dividendo Totale (€M)']
-    df_sustain['FCF/Dividendo (x)'] = df_sustain['FCF (€M)'] / df_sustain['Dividendo Totale (€M)']
-    
     # Visualizzazione grafico sostenibilità
-    fig_sustainability = make_subplots(specs=[[{"secondary_y": True}]])
-    
-    # Barre FCF e Dividendo
-    fig_sustainability.add_trace(
-        go.Bar(
-            x=df_sustain['Anno'],
-            y=df_sustain['FCF (€M)'],
-            name='Free Cash Flow (€M)',
-            marker_color='lightblue',
-            opacity=0.7
-        ),
-        secondary_y=False
-    )
-    
-    fig_sustainability.add_trace(
-        go.Bar(
-            x=df_sustain['Anno'],
-            y=df_sustain['Dividendo Totale (€M)'],
-            name='Dividendo Totale (€M)',
-            marker_color='darkblue'
-        ),
-        secondary_y=False
-    )
-    
-    # Linea Payout Ratio
-    fig_sustainability.add_trace(
-        go.Scatter(
-            x=df_sustain['Anno'],
-            y=df_sustain['Payout Ratio (%)'],
-            name='Payout Ratio (%)',
-            mode='lines+markers+text',
-            marker=dict(size=8, color='red'),
-            line=dict(width=2, color='red'),
-            text=df_sustain['Payout Ratio (%)'],
-            textposition='top center'
-        ),
-        secondary_y=True
-    )
-    
-    # Layout
-    fig_sustainability.update_layout(
-        title="Analisi Sostenibilità Dividendo: FCF vs Dividendo Totale",
-        barmode='overlay',
-        legend=dict(orientation='h', yanchor='bottom', y=1.02, xanchor='center', x=0.5),
-        height=450
-    )
-    
-    fig_sustainability.update_yaxes(title_text="€ Milioni", secondary_y=False)
-    fig_sustainability.update_yaxes(title_text="Payout Ratio (%)", secondary_y=True, range=[0, 100])
-    
-    st.plotly_chart(fig_sustainability, use_container_width=True)
-    st.caption("Fonte: Dati storici 2023 (testo) e proiezioni basate sull'analisi. Anche con l'impatto delle nuove tasse nel 2025, FDJ mantiene un free cash flow ampiamente sufficiente a coprire il dividendo atteso.")
-
-# --- Legge il contenuto del file di analisi ---
-st.markdown("---")
-st.subheader("📝 Analisi Dettagliata (dal file Analisi_FDJ.txt)")
-
-analysis_file_path = 'Analisi_FDJ.txt'
-analysis_content = ""
-# Verifica se il file esiste prima di provare a leggerlo
-if os.path.exists(analysis_file_path):
-    try:
-        with open(analysis_file_path, 'r', encoding='utf-8') as f:
-            analysis_content = f.read()
-            # Sostituisce i tag [source: ...] con un formato più leggibile o li rimuove
-            import re
-            analysis_content = re.sub(r'\s*\[source:\s*\d+.*?\]', '', analysis_content) # Rimuove i tag source
-    except FileNotFoundError:
-        st.error(f"Errore: File '{analysis_file_path}' non trovato. Assicurati che sia nella stessa cartella dello script.")
-        analysis_content = "Contenuto dell'analisi non disponibile."
-    except Exception as e:
-        st.error(f"Errore nella lettura del file '{analysis_file_path}': {e}")
-        analysis_content = "Errore nel caricamento del contenuto dell'analisi."
-else:
-    st.warning(f"Attenzione: File '{analysis_file_path}' non trovato. L'analisi testuale non può essere visualizzata.")
-    analysis_content = "Contenuto dell'analisi non disponibile (file non trovato)."
-
+    st.plotly_chart(get_figure('sustainability', df_sustain), use_container_width=True)
+    if scenario_cube is not None:
+        st.caption("Fonte: Dati storici 2023-2024 (testo) e proiezioni 2025-2027 dello scenario selezionato. "
+                   "Il FCF proiettato segue l'utile distribuibile rispetto al 2024.")
+    else:
+        st.caption("Fonte: Dati storici e proiezioni del dataset della società.")
 
-# Suddivisione approssimativa del contenuto basata sui titoli nell'analisi
-# Nota: Questa è una suddivisione euristica, potrebbe necessitare aggiustamenti
-sections = {}
-current_section = "Introduzione"
-sections[current_section] = ""
+    if scenario_cube is not None:
+        render_stress_test(df_sustain, df_debt_scenario)
 
-# Regex per trovare i titoli principali (## Titolo o # Titolo) e i sottotitoli numerati (## N. Titolo)
-title_pattern = re.compile(r"^(#+\s*\d*\.?\s*\*?.*?\*?)$", re.MULTILINE)
 
-last_index = 0
-for match in title_pattern.finditer(analysis_content):
-    title = match.group(1).strip().replace('#', '').replace('*','').strip()
-    start_index = match.start()
-
-    # Aggiunge il testo precedente alla sezione corrente
-    sections[current_section] += analysis_content[last_index:start_index].strip()
-
-    # Pulisce il titolo da eventuali numeri iniziali e punti per creare la chiave
-    clean_title = re.sub(r"^\d+\.\s+", "", title)
-    current_section = clean_title
-    sections[current_section] = "" # Inizia una nuova sezione
-    last_index = match.end()
+# Stress test di copertura e leva sulla griglia degli shock (vedi fdj/stress.py)
+def render_stress_test(df_sustain, df_debt_scenario):
+    st.subheader("🧪 Stress Test: Copertura del Dividendo e Leva")
+    col1, col2 = st.columns(2)
+    with col1:
+        asse_x = st.selectbox("Asse orizzontale", options=list(ASSI_STRESS), format_func=ETICHETTE_ASSI.get, key='stress_asse_x')
+    with col2:
+        asse_y = st.selectbox("Asse verticale", options=[a for a in ASSI_STRESS if a != asse_x], format_func=ETICHETTE_ASSI.get, key='stress_asse_y')
+    scenario = scenario_corrente()
+    mappa, violazioni, critici = stress_summary(df_sustain, df_debt_scenario, float(scenario['tasse']), scenario['kindred'] / 100, asse_x, asse_y)
 
-# Aggiunge l'ultimo pezzo di testo all'ultima sezione
-sections[current_section] += analysis_content[last_index:].strip()
+    col1, col2 = st.columns([3, 2])
+    with col1:
+        st.plotly_chart(get_figure('stress_heatmap', mappa), use_container_width=True)
+    with col2:
+        st.dataframe(violazioni, use_container_width=True,
+                     column_config={c: st.column_config.NumberColumn(format="%.1f%%") for c in violazioni.columns})
+        st.caption(f"Probabilità che la copertura FCF/Dividendo scenda sotto {SOGLIA_COPERTURA:.0f}x o la leva superi {SOGLIA_LEVA:.1f}x, "
+                   "pesando ogni combinazione di shock con la sua probabilità.")
+    st.dataframe(critici, hide_index=True, use_container_width=True,
+                 column_config={c: st.column_config.NumberColumn(format="%.2f") for c in critici.columns[-3:]})
+    st.caption("Combinazioni più probabili con almeno una violazione. Base: scenario selezionato e piano del debito, dividendo mantenuto "
+               "e minore FCF finanziato con debito. Probabilità delle tasse dalla simulazione Monte Carlo; ritardo Kindred, calo EBITDA e "
+               "rialzo dei tassi sono ipotesi di lavoro (vedi fdj/stress.py).")
+
+
+# Portafoglio dell'utente: reddito da dividendi atteso (vedi fdj/portafoglio.py)
+def render_portafoglio():
+    st.subheader("💼 Reddito da Dividendi del Portafoglio")
+    file_posizioni = st.file_uploader("File delle posizioni (CSV con colonne ticker, azioni, costo)", type=['csv'], key='portafoglio_file',
+                                      help="Una riga per lotto; costo = prezzo di carico per azione (facoltativo). Sono accettati anche i nomi shares e cost_basis.")
+    if file_posizioni is None:
+        st.info("Carica un file delle posizioni per proiettare il reddito da dividendi dei prossimi anni.")
+        return
+    try:
+        hash_file, posizioni = carica_portafoglio(file_posizioni.getvalue())
+    except ValueError as e:
+        st.error(f"Errore nel file '{file_posizioni.name}': {e}")
+        return
+
+    # Previsioni del ticker con modello di scenario: quelle dello scenario selezionato in Proiezioni Future
+    sostituzioni = {}
+    if get_info(TICKER).get('modello_scenari', False):
+        sostituzioni[TICKER] = forecast_scenario(scenario_corrente(), get_scenario_cube())
+    anni = range(ANNO_ULTIMO_DPS + 1, ANNO_ULTIMO_DPS + 1 + N_ANNI_PORTAFOGLIO)
+    proiezione = proiezione_portafoglio(hash_file, posizioni, anni, storico_prezzi, sostituzioni)
+
+    if proiezione.per_anno.empty:
+        st.warning("Nessun ticker del portafoglio ha un dataset o uno storico dei dividendi: proiezione non disponibile. "
+                   "Ticker esclusi: " + ", ".join(proiezione.senza_dati['ticker'].head(20))
+                   + ("…" if len(proiezione.senza_dati) > 20 else ""))
+        return
+
+    colonne = st.columns(len(proiezione.per_anno))
+    for colonna, (anno, reddito, yield_on_cost) in zip(colonne, proiezione.per_anno.itertuples(index=False)):
+        with colonna:
+            st.metric(label=f"Reddito Lordo Esercizio {anno}", value=f"€ {reddito:,.0f}",
+                      delta=f"Yield on cost {yield_on_cost:.2f}%" if pd.notna(yield_on_cost) else None, delta_color="off")
+
+    st.plotly_chart(get_figure('calendario', proiezione.calendario), use_container_width=True)
+    st.caption(f"{proiezione.n_posizioni} ticker in portafoglio. DPS dai dataset delle società (scenario selezionato per {TICKER}) "
+               "o, in mancanza, dal DPS degli ultimi 12 mesi dello storico dividendi mantenuto costante. "
+               "Mesi ripartiti secondo gli stacchi degli ultimi 12 mesi (n.d. = mese non noto).")
+
+    st.dataframe(
+        proiezione.per_ticker,
+        hide_index=True,
+        use_container_width=True,
+        column_config={c: st.column_config.NumberColumn(format="%.2f") for c in proiezione.per_ticker.columns if c.startswith('Reddito')},
+    )
+    if len(proiezione.senza_dati):
+        st.warning(f"{len(proiezione.senza_dati)} ticker senza dataset né storico dei dividendi, esclusi dalla proiezione: "
+                   + ", ".join(proiezione.senza_dati['ticker'].head(20)) + ("…" if len(proiezione.senza_dati) > 20 else ""))
+    if len(proiezione.senza_costo):
+        st.info(f"Yield on cost calcolato su € {proiezione.costo_coperto:,.0f} di costo delle sole azioni con prezzo di carico. "
+                "Azioni senza prezzo di carico, incluse nel reddito ma escluse dallo yield: "
+                + ", ".join(f"{t} ({a:,.0f})" for t, a in proiezione.senza_costo.head(20).itertuples(index=False))
+                + ("…" if len(proiezione.senza_costo) > 20 else ""))
+
+
+SEZIONI = {
+    'storico': ("Dividendi Storici", render_dividendi_storici),
+    'proiezioni': ("Proiezioni Future", render_proiezioni_future),
+    'business': ("Mix di Business", render_mix_business),
+    'confronto': ("Analisi Comparativa", render_analisi_comparativa),
+    'rischi': ("Rischi e Debito", render_rischi_debito),
+    'portafoglio': ("Portafoglio", render_portafoglio),
+}
 
-# Visualizza le sezioni con expander
-for title, content in sections.items():
-    if content.strip(): # Mostra solo sezioni con contenuto
-        with st.expander(f"**{title}**", expanded=(title=="Introduzione" or "Dividendi storici" in title)): # Espande le prime sezioni di default
-            st.markdown(content, unsafe_allow_html=True)
+# La sezione attiva è sincronizzata con il parametro ?sezione=... dell'URL,
+# così ogni sezione resta raggiungibile con un link diretto
+if 'sezione' not in st.session_state:
+    sezione_richiesta = st.query_params.get('sezione')
+    st.session_state['sezione'] = sezione_richiesta if sezione_richiesta in SEZIONI else 'storico'
+
+sezione_attiva = st.radio(
+    "Sezione",
+    options=list(SEZIONI),
+    format_func=lambda slug: SEZIONI[slug][0],
+    horizontal=True,
+    key='sezione',
+    label_visibility="collapsed"
+)
+if st.query_params.get('sezione') != sezione_attiva:
+    st.query_params['sezione'] = sezione_attiva
+with profilo.sezione(f"sezione {sezione_attiva}"):
+    SEZIONI[sezione_attiva][1]()
 
+# --- Legge il contenuto del file di analisi ---
+st.markdown("---")
+st.subheader(f"📝 Analisi Dettagliata (dal file {', '.join(os.path.basename(name) for name in info.get('analisi', []))})")
+
+for analysis_file_path, error in analysis_errors:
+    if isinstance(error, FileNotFoundError):
+        st.warning(f"Attenzione: File '{os.path.basename(analysis_file_path)}' non trovato. L'analisi testuale non può essere visualizzata.")
+    else:
+        st.error(f"Errore nella lettura del file '{os.path.basename(analysis_file_path)}': {error}")
+
+# Sezioni mostrate per pagina: pagina e corpi caricati su richiesta tengono costante
+# il peso iniziale della pagina anche con report di molti MB
+SEZIONI_PER_PAGINA = 20
+N_SEZIONI_APERTE = 3
+
+def chiave_sezione(d, s):
+    """Chiave dell'expander della sezione ``s`` del documento ``d`` (cambia se il documento cambia)."""
+    return f"analisi_{analysis_documents[d].sha256[:12]}_{s}"
+
+def apri_sezioni(aperte, candidate):
+    """Imposta lo stato aperto/chiuso degli expander ``candidate`` prima che vengano creati."""
+    for d, s in candidate:
+        st.session_state[chiave_sezione(d, s)] = (d, s) in aperte
+
+def render_sezione(d, s):
+    section = analysis_documents[d].sections[s]
+    chiave = chiave_sezione(d, s)
+    if chiave not in st.session_state:
+        st.session_state[chiave] = section.title == "Introduzione" or "Dividendi storici" in section.title # Espande le prime sezioni di default
+    # Con on_change="rerun" il corpo è inviato solo quando la sezione è aperta;
+    # aprirla riesegue il solo frammento dell'analisi
+    sezione = st.expander(f"**{section.title}**", key=chiave, on_change="rerun")
+    if sezione.open:
+        with sezione:
+            st.markdown(section.markdown, unsafe_allow_html=True)
+
+# Frammento: ricerca, pagine e apertura delle sezioni non rieseguono il resto della dashboard
+@st.fragment
+def render_analisi():
+    sezioni = [(d, s) for d, doc in enumerate(analysis_documents) for s, section in enumerate(doc.sections) if section.body] # Solo sezioni con contenuto
+
+    # Ricerca nelle sezioni (indice BM25 salvato in .cache/ricerca, vedi fdj/ricerca.py)
+    query_analisi = st.text_input("🔎 Cerca nell'analisi", key='ricerca_analisi', placeholder="es. Kindred debito, nuove tasse 2025")
+    if query_analisi.strip():
+        risultati_ricerca = search(analysis_documents, query_analisi)
+        trovate = [(r.documento, r.sezione) for r in risultati_ricerca]
+        # Nuova ricerca: aperte solo le sezioni più pertinenti
+        if st.session_state.get('ricerca_analisi_mostrata') != query_analisi:
+            st.session_state['ricerca_analisi_mostrata'] = query_analisi
+            apri_sezioni(set(trovate[:N_SEZIONI_APERTE]), trovate)
+        if not risultati_ricerca:
+            st.info("Nessuna sezione contiene i termini cercati.")
+            return
+        st.caption(f"{len(risultati_ricerca)} sezioni pertinenti, in ordine di rilevanza (aperte le prime {min(N_SEZIONI_APERTE, len(risultati_ricerca))})")
+        for r in risultati_ricerca:
+            st.markdown(f"**{r.titolo}** · punteggio {r.punteggio:.1f}  \n{r.snippet}")
+        for d, s in trovate:
+            render_sezione(d, s)
+        return
+    st.session_state.pop('ricerca_analisi_mostrata', None)
+
+    # Passaggio citato richiesto con ?fonte=N (link dei KPI e delle didascalie)
+    fonte_richiesta = st.query_params.get('fonte', '')
+    citazioni_richieste = find_citations(analysis_documents, int(fonte_richiesta)) if fonte_richiesta.isdigit() else []
+    for d, c in citazioni_richieste:
+        st.info(f"📌 [source: {fonte_richiesta}] «{analysis_documents[d].passage(c)}» (sezione *{analysis_documents[d].sections[c.section].title}*)")
+
+    n_pagine = -(-len(sezioni) // SEZIONI_PER_PAGINA)
+    if n_pagine > 1:
+        if citazioni_richieste and st.session_state.get('fonte_mostrata') != fonte_richiesta:
+            # Prima visualizzazione della citazione: pagina della sezione citata, sezione aperta
+            st.session_state['fonte_mostrata'] = fonte_richiesta
+            d, c = citazioni_richieste[0]
+            st.session_state['analisi_pagina'] = sezioni.index((d, c.section)) // SEZIONI_PER_PAGINA + 1
+        pagina = st.number_input("Pagina dell'analisi", min_value=1, max_value=n_pagine, step=1, key='analisi_pagina')
+        st.caption(f"Sezioni {(pagina - 1) * SEZIONI_PER_PAGINA + 1}-{min(pagina * SEZIONI_PER_PAGINA, len(sezioni))} di {len(sezioni)}")
+    else:
+        pagina = 1
+    visibili = sezioni[(pagina - 1) * SEZIONI_PER_PAGINA:pagina * SEZIONI_PER_PAGINA]
+    if citazioni_richieste and st.session_state.get('fonte_aperta') != fonte_richiesta:
+        st.session_state['fonte_aperta'] = fonte_richiesta
+        citate = {(d, c.section) for d, c in citazioni_richieste}
+        apri_sezioni(citate, citate & set(visibili))
+
+    # Visualizza le sezioni con expander
+    for d, s in visibili:
+        render_sezione(d, s)
+
+with profilo.sezione("analisi"):
+    render_analisi()
 
 # --- Conclusioni Specifiche per Investitore Dividend ---
-st.markdown("---")
-st.subheader("🎯 Conclusioni per l'Investitore Orientato ai Dividendi")
-st.markdown(f"""
+# Le conclusioni commentano l'analisi FDJ: sono mostrate solo per il ticker predefinito
+CONCLUSIONI_FDJ = """
 Basato sull'analisi fornita:
 
 **Punti di Forza (Pro-Dividendo):**
@@ -840,7 +812,12 @@ Basato sull'analisi fornita:
 * ⚠️ **Rischio Normativo:** Oltre alle tasse, il settore è soggetto a cambiamenti regolatori in Francia e UE (es. restrizioni pubblicità, revisione concessioni). [source: 112, 191, 198]
 
 **In Sintesi:** FDJ presenta un profilo interessante per l'investitore da dividendo grazie a yield elevato, crescita storica e solidità del business principale. Tuttavia, l'impatto delle nuove tasse nel 2025 è un fattore chiave da monitorare attentamente, così come il successo dell'integrazione di Kindred per sostenere la crescita futura del dividendo.
-""", unsafe_allow_html=True)
+"""
+if ticker == TICKER:
+    with profilo.sezione("conclusioni"):
+        st.markdown("---")
+        st.subheader("🎯 Conclusioni per l'Investitore Orientato ai Dividendi")
+        st.markdown(CONCLUSIONI_FDJ, unsafe_allow_html=True)
 
 # Footer con disclaimer
 st.markdown("---")
@@ -854,3 +831,7 @@ with st.container():
         <p style="text-align: right; margin-top: 10px;"><em>Realizzazione a cura della Barba Sparlante</em></p>
     </div>
     """, unsafe_allow_html=True)
+
+if profilo_run is not None:
+    with pannello_profilo:
+        profilo.render_pannello(profilo_run)